@@ -1,9 +1,9 @@
 import streamlit as st
 import pandas as pd
-import os
-from datetime import datetime, timedelta
-from math import radians, cos, sin, asin, sqrt
-import json
+from config import TRAIL_FEATURES, EVENT_TYPES, TRAIL_DIFFICULTY_LEVELS, QUERY_CACHE_TTL
+from utils.trail_finder import find_nearby_trails, trail_catalog_manager
+from utils.event_manager import get_upcoming_events, event_calendar_manager
+from utils.biophilia_calculator import calculate_biophilia_score
 
 # Page configuration - needs to be the first Streamlit command
 st.set_page_config(
@@ -12,292 +12,76 @@ st.set_page_config(
     layout="wide"
 )
 
-# Utility functions for trails
-def haversine(lon1, lat1, lon2, lat2):
+# Cached data access
+# Streamlit reruns this whole script on every widget change, so catalogs are
+# kept in memory by their managers and search results per set of arguments
+def current_catalogs():
     """
-    Calculate the great circle distance between two points 
-    on the earth (specified in decimal degrees)
-    """
-    # Convert decimal degrees to radians
-    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
-    
-    # Haversine formula
-    dlon = lon2 - lon1
-    dlat = lat2 - lat1
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * asin(sqrt(a))
-    r = 3956  # Radius of earth in miles
-    return c * r
-
-def create_sample_trails_data():
-    """Create sample trail data and save to CSV"""
-    trails = [
-        {
-            'id': 1,
-            'name': 'Pine Forest Loop',
-            'latitude': 37.7749,
-            'longitude': -122.4194,
-            'length': 3.2,
-            'difficulty': 'Easy',
-            'features': 'Forest,Wildlife,Scenic Views',
-            'description': 'A beautiful loop through old-growth pine forest with abundant wildlife viewing opportunities.',
-            'image_url': 'https://i.imgur.com/3Cm5BM9.jpg'
-        },
-        {
-            'id': 2,
-            'name': 'Mountain Vista Trail',
-            'latitude': 37.8049,
-            'longitude': -122.4094,
-            'length': 5.8,
-            'difficulty': 'Moderate',
-            'features': 'Mountain View,Wildflowers,Forest',
-            'description': 'Climb to stunning panoramic views of the surrounding mountains and valleys.',
-            'image_url': 'https://i.imgur.com/Gju4kCM.jpg'
-        },
-        {
-            'id': 3,
-            'name': 'Crystal Lake Path',
-            'latitude': 37.7649,
-            'longitude': -122.4294,
-            'length': 2.5,
-            'difficulty': 'Easy',
-            'features': 'Lake,Fishing,Wildlife',
-            'description': 'An easy walk around a pristine mountain lake with fishing spots and wildlife viewing areas.',
-            'image_url': 'https://i.imgur.com/K58U4dV.jpg'
-        },
-        {
-            'id': 4,
-            'name': 'Ridgeline Traverse',
-            'latitude': 37.7849,
-            'longitude': -122.4394,
-            'length': 7.2,
-            'difficulty': 'Hard',
-            'features': 'Mountain View,Waterfall,Forest',
-            'description': 'A challenging hike along a mountain ridge with breathtaking views and a hidden waterfall.',
-            'image_url': 'https://i.imgur.com/QLKL9F5.jpg'
-        },
-        {
-            'id': 5,
-            'name': 'Waterfall Canyon',
-            'latitude': 37.7599,
-            'longitude': -122.4494,
-            'length': 4.6,
-            'difficulty': 'Moderate',
-            'features': 'Waterfall,Forest,Wildflowers',
-            'description': 'Hike through a lush canyon to a spectacular 60-foot waterfall surrounded by wildflowers.',
-            'image_url': 'https://i.imgur.com/Y2JJ6KQ.jpg'
-        }
-    ]
-    
-    # Create DataFrame
-    trails_df = pd.DataFrame(trails)
-    
-    # Ensure data directory exists
-    os.makedirs('data', exist_ok=True)
+    Current trail catalog and event calendar with their version
     
-    # Save to CSV
-    trails_df.to_csv('data/sample_trails.csv', index=False)
+    The managers check their files with one stat call each and hand out
+    each catalog together with the generation it was loaded as, so the
+    version always matches the catalogs returned with it.
     
-    return trails_df
-
-def find_nearby_trails(user_location, distance=None, difficulty=None, features=None, limit=None):
-    """
-    Find trails near the user's location with optional filters
+    Returns:
+    - (version, trails, events) tuple
     """
-    try:
-        # Try to load the sample data
-        trails_df = pd.read_csv('data/sample_trails.csv')
-    except FileNotFoundError:
-        # If the file doesn't exist, create sample data
-        trails_df = create_sample_trails_data()
-        
-    # Calculate distance from user location
-    if user_location and 'lat' in user_location and 'lon' in user_location:
-        trails_df['distance'] = trails_df.apply(
-            lambda row: haversine(
-                user_location['lon'], 
-                user_location['lat'],
-                row['longitude'], 
-                row['latitude']
-            ),
-            axis=1
-        )
-    else:
-        # Default distances if no user location provided
-        trails_df['distance'] = range(1, len(trails_df) + 1)
-    
-    # Apply filters
-    if distance is not None:
-        trails_df = trails_df[trails_df['distance'] <= distance]
-        
-    if difficulty is not None and len(difficulty) > 0:
-        trails_df = trails_df[trails_df['difficulty'].isin(difficulty)]
-        
-    if features is not None and len(features) > 0:
-        # For features, they're stored as comma-separated values
-        for feature in features:
-            trails_df = trails_df[trails_df['features'].str.contains(feature, case=False)]
-    
-    # Sort by distance
-    trails_df = trails_df.sort_values('distance')
-    
-    # Limit results
-    if limit is not None:
-        trails_df = trails_df.head(limit)
-    
-    # Convert to list of dictionaries
-    trails = trails_df.to_dict('records')
-    
-    return trails
+    trail_generation, trails = trail_catalog_manager.get_versioned()
+    event_generation, events = event_calendar_manager.get_versioned()
+    return (trail_generation, event_generation), trails, events
 
-# Event manager functions
-def create_sample_events_data():
-    """Create sample event data and save to CSV"""
-    # Current date for generating events
-    now = datetime.now()
-    
-    events = [
-        {
-            'id': 1,
-            'name': 'Guided Bird Watching Tour',
-            'date': (now + timedelta(days=3)).strftime('%Y-%m-%d'),
-            'location': 'Oakridge Nature Reserve',
-            'type': 'Birdwatching',
-            'description': 'Join our expert ornithologists for a guided tour to spot and identify local bird species. Binoculars provided!',
-            'image_url': 'https://i.imgur.com/YJOX1CW.jpg'
-        },
-        {
-            'id': 2,
-            'name': 'Forest Bathing Experience',
-            'date': (now + timedelta(days=5)).strftime('%Y-%m-%d'),
-            'location': 'Pinecrest Woods',
-            'type': 'Guided Hike',
-            'description': 'Experience the Japanese practice of Shinrin-yoku (forest bathing) to reduce stress and boost wellbeing through mindful nature immersion.',
-            'image_url': 'https://i.imgur.com/3Cm5BM9.jpg'
-        },
-        {
-            'id': 3,
-            'name': 'River Cleanup Volunteer Day',
-            'date': (now + timedelta(days=7)).strftime('%Y-%m-%d'),
-            'location': 'Silverstream River',
-            'type': 'Conservation',
-            'description': 'Help restore the natural beauty of our local river by joining our cleanup effort. All equipment provided, plus lunch for volunteers!',
-            'image_url': 'https://i.imgur.com/K58U4dV.jpg'
-        },
-        {
-            'id': 4,
-            'name': 'Wildflower Identification Workshop',
-            'date': (now + timedelta(days=10)).strftime('%Y-%m-%d'),
-            'location': 'Meadow View Park',
-            'type': 'Education',
-            'description': 'Learn to identify local wildflower species and understand their ecological importance in this hands-on workshop.',
-            'image_url': 'https://i.imgur.com/VmFbVmE.jpg'
-        },
-        {
-            'id': 5,
-            'name': 'Family Nature Scavenger Hunt',
-            'date': (now + timedelta(days=12)).strftime('%Y-%m-%d'),
-            'location': 'Community Wilderness Area',
-            'type': 'Community',
-            'description': 'A fun event for families to explore nature together through an educational scavenger hunt with prizes!',
-            'image_url': 'https://i.imgur.com/B4mJErA.jpg'
-        }
-    ]
-    
-    # Create DataFrame
-    events_df = pd.DataFrame(events)
-    
-    # Ensure data directory exists
-    os.makedirs('data', exist_ok=True)
-    
-    # Save to CSV
-    events_df.to_csv('data/sample_events.csv', index=False)
-    
-    return events_df
-
-def get_upcoming_events(date_range=None, types=None, limit=None):
+@st.cache_data(ttl=QUERY_CACHE_TTL)
+def search_trails(lat, lon, distance=None, difficulty=None, features=None, limit=None, version=None, _trails=None):
     """
-    Get upcoming nature events with optional filters
-    """
-    try:
-        # Try to load the sample data
-        events_df = pd.read_csv('data/sample_events.csv')
-    except FileNotFoundError:
-        # If the file doesn't exist, create sample data
-        events_df = create_sample_events_data()
-    
-    # Convert date strings to datetime objects
-    events_df['date_obj'] = pd.to_datetime(events_df['date'])
-    
-    # Apply date range filter
-    if date_range is not None and len(date_range) == 2:
-        start_date, end_date = date_range
-        start_date = pd.Timestamp(start_date)
-        end_date = pd.Timestamp(end_date)
-        events_df = events_df[(events_df['date_obj'] >= start_date) & 
-                              (events_df['date_obj'] <= end_date)]
-    
-    # Apply event type filter
-    if types is not None and len(types) > 0:
-        events_df = events_df[events_df['type'].isin(types)]
-    
-    # Sort by date
-    events_df = events_df.sort_values('date_obj')
-    
-    # Limit results
-    if limit is not None:
-        events_df = events_df.head(limit)
-    
-    # Remove the date_obj column before returning
-    events_df = events_df.drop('date_obj', axis=1)
+    Cached trail search
     
-    # Convert to list of dictionaries
-    events = events_df.to_dict('records')
+    Parameters:
+    - lat, lon: user location, or None for no location
+    - version: version from current_catalogs(), part of the cache key
+    - _trails: trail catalog of that version (not hashed by Streamlit)
     
-    return events
-
-# Biophilia calculator function
-def calculate_biophilia_score(answers):
+    Returns:
+    - list of trail dictionaries
     """
-    Calculate a biophilia score based on quiz answers
+    user_location = {'lat': lat, 'lon': lon} if lat is not None and lon is not None else None
+    return find_nearby_trails(user_location, distance=distance, difficulty=difficulty, features=features,
+                              limit=limit, catalog=_trails)
+
+@st.cache_data(ttl=QUERY_CACHE_TTL)
+def search_events(date_range=None, types=None, limit=None, version=None, _events=None):
     """
-    # Simple calculation - sum of answers normalized to 0-100
-    if not answers:
-        return 0
-    
-    # Sum all answers
-    total = sum(answers)
+    Cached event search
     
-    # Maximum possible score (10 points per question)
-    max_score = len(answers) * 10
+    Parameters:
+    - version: version from current_catalogs(), part of the cache key
+    - _events: event calendar of that version (not hashed by Streamlit)
     
-    # Calculate percentage and round to nearest integer
-    score = round((total / max_score) * 100)
-    
-    return score
+    Returns:
+    - list of event dictionaries
+    """
+    return get_upcoming_events(date_range=date_range, types=types, limit=limit, calendar=_events)
 
-# App constants
-TRAIL_FEATURES = [
-    "Waterfall",
-    "Lake",
-    "River",
-    "Mountain View",
-    "Forest",
-    "Wildlife",
-    "Wildflowers",
-    "Educational",
-    "Sunset Views"
-]
+def nearby_trails(user_location, distance=None, difficulty=None, features=None, limit=None):
+    """Find trails near a user's location through the result cache"""
+    lat = user_location.get('lat') if user_location else None
+    lon = user_location.get('lon') if user_location else None
+    version, trails, _ = current_catalogs()
+    return search_trails(
+        lat, lon, distance, tuple(difficulty or ()), tuple(features or ()), limit, version=version, _trails=trails
+    )
 
-EVENT_TYPES = [
-    "Guided Hike",
-    "Conservation",
-    "Education",
-    "Birdwatching",
-    "Community",
-    "Family Friendly",
-    "Workshop"
-]
+def upcoming_events(date_range=None, types=None, limit=None):
+    """Get upcoming events through the result cache"""
+    date_range = tuple(date_range) if date_range is not None else None
+    version, _, events = current_catalogs()
+    return search_events(date_range, tuple(types or ()), limit, version=version, _events=events)
+
+def refresh_catalogs():
+    """Reload trail and event data and drop every cached search result"""
+    trail_catalog_manager.invalidate()
+    event_calendar_manager.invalidate()
+    search_trails.clear()
+    search_events.clear()
 
 # Initialize session state
 if 'user_location' not in st.session_state:
@@ -341,6 +125,11 @@ else:
         st.session_state.user_location = {"zip": "00000", "lat": 37.7749, "lon": -122.4194}
         st.sidebar.success("Location updated")
 
+# Trail and event data are cached; this reloads them after the files change
+if st.sidebar.button("Refresh Trails and Events"):
+    refresh_catalogs()
+    st.sidebar.success("Trail and event data reloaded")
+
 # Main content based on selected page
 if page == "Home":
     st.header("Connect with Nature Around You")
@@ -351,7 +140,7 @@ if page == "Home":
     with col1:
         st.subheader("Nearby Trails")
         if st.session_state.user_location:
-            trails = find_nearby_trails(st.session_state.user_location, limit=3)
+            trails = nearby_trails(st.session_state.user_location, limit=3)
             for trail in trails:
                 st.write(f"**{trail['name']}** - {trail['distance']:.1f} miles away")
                 st.image(trail.get('image_url', 'https://i.imgur.com/3Cm5BM9.jpg'), width=200)
@@ -360,7 +149,7 @@ if page == "Home":
     
     with col2:
         st.subheader("Upcoming Nature Events")
-        events = get_upcoming_events(limit=3)
+        events = upcoming_events(limit=3)
         for event in events:
             st.write(f"**{event['name']}** - {event['date']}")
             st.write(event['description'][:100] + "...")
@@ -389,13 +178,13 @@ elif page == "Find Trails":
         with col1:
             distance = st.slider("Maximum Distance (miles)", 1, 50, 10)
         with col2:
-            difficulty = st.multiselect("Difficulty", ["Easy", "Moderate", "Hard"], default=["Easy", "Moderate"])
+            difficulty = st.multiselect("Difficulty", TRAIL_DIFFICULTY_LEVELS, default=["Easy", "Moderate"])
         with col3:
             features = st.multiselect("Features", TRAIL_FEATURES)
         
         # Find trails with filters
-        trails = find_nearby_trails(st.session_state.user_location, distance=distance, 
-                                   difficulty=difficulty, features=features)
+        trails = nearby_trails(st.session_state.user_location, distance=distance,
+                               difficulty=difficulty, features=features)
         
         # Display trails
         if trails:
@@ -427,9 +216,9 @@ elif page == "Nature Events":
         date_range = st.date_input("Date Range", [pd.Timestamp.now(), pd.Timestamp.now() + pd.Timedelta(days=30)])
     with col2:
         event_types = st.multiselect("Event Types", EVENT_TYPES)
-
+    
     # Get events with filters
-    events = get_upcoming_events(date_range=date_range, types=event_types)
+    events = upcoming_events(date_range=date_range, types=event_types)
     
     # Display events
     if events:
@@ -489,11 +278,11 @@ elif page == "Biophilia Score":
             st.write("You have a moderate connection to nature. Try deepening your relationship through regular nature activities.")
         else:
             st.write("You have a strong connection to nature! Consider sharing your passion with others or joining conservation efforts.")
-            
+        
         # Recommendations
         st.subheader("Personalized Recommendations")
-        recommended_trails = find_nearby_trails(st.session_state.user_location, limit=2) if st.session_state.user_location else []
-        recommended_events = get_upcoming_events(limit=2)
+        recommended_trails = nearby_trails(st.session_state.user_location, limit=2) if st.session_state.user_location else []
+        recommended_events = upcoming_events(limit=2)
         
         col1, col2 = st.columns(2)
         with col1:
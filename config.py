@@ -28,6 +28,7 @@ SECONDARY_COLOR = "#81C784"  # Light Green
 # Data settings
 DATA_FOLDER = "data"
 USER_DATA_EXPIRY_DAYS = 30  # How long to keep user data
+QUERY_CACHE_TTL = 600  # Seconds the app keeps trail and event search results
 
 # Difficulty levels for trails
 TRAIL_DIFFICULTY_LEVELS = ["Easy", "Moderate", "Hard"]
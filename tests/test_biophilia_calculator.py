@@ -1,14 +1,17 @@
 import unittest
 import sys
 import os
+import numpy as np
 
 # Add parent directory to path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.biophilia_calculator import calculate_biophilia_score, get_biophilia_recommendations
+from utils.biophilia_calculator import calculate_biophilia_score, calculate_biophilia_scores, summarize_biophilia_scores
+from utils.biophilia_calculator import ScoreDistribution, get_biophilia_recommendations
+from utils.trail_finder import find_nearby_trails
 
 class TestBiophiliaCalculator(unittest.TestCase):
-    
+
     def test_calculate_biophilia_score_empty(self):
         """Test score calculation with empty answers"""
         score = calculate_biophilia_score([])
@@ -32,6 +35,64 @@ class TestBiophiliaCalculator(unittest.TestCase):
         score = calculate_biophilia_score([5, 6, 7, 8, 9, 5, 6, 7, 8, 9])
         self.assertEqual(score, 70)
     
+    def test_calculate_biophilia_scores_matches_scalar(self):
+        """Test batch scores equal the scalar function, missing answers included"""
+        rng = np.random.default_rng(5)
+        answers = rng.integers(1, 11, size=(2000, 10)).astype(float)
+        answers[rng.random(answers.shape) < 0.2] = np.nan
+        answers[0] = np.nan
+        
+        expected = [calculate_biophilia_score([int(a) for a in row if not np.isnan(a)]) for row in answers]
+        self.assertEqual(calculate_biophilia_scores(answers).tolist(), expected)
+        self.assertEqual(calculate_biophilia_scores(answers, weights=np.ones(10)).tolist(), expected)
+    
+    def test_calculate_biophilia_scores_weighted(self):
+        """Test per-question weights only count answered questions"""
+        answers = [[10, 0, 5], [10, np.nan, np.nan]]
+        scores = calculate_biophilia_scores(answers, weights=[2, 1, 1])
+        # (20 + 0 + 5) / 40 and 20 / 20
+        self.assertEqual(scores.tolist(), [62, 100])
+    
+    def test_summarize_biophilia_scores(self):
+        """Test cohort summaries match NumPy's histogram and percentiles"""
+        rng = np.random.default_rng(8)
+        scores = rng.integers(0, 101, size=500)
+        cohorts = rng.choice(['spring', 'summer', 'fall'], size=500)
+        
+        summary = summarize_biophilia_scores(scores, cohorts, bins=5, percentiles=(10, 50, 90))
+        self.assertEqual(sorted(summary), ['fall', 'spring', 'summer'])
+        for cohort, stats in summary.items():
+            values = scores[cohorts == cohort]
+            self.assertEqual(stats['count'], len(values))
+            self.assertAlmostEqual(stats['mean'], values.mean())
+            self.assertEqual(stats['histogram'], np.histogram(values, bins=5, range=(0, 100))[0].tolist())
+            for percentile in (10, 50, 90):
+                self.assertAlmostEqual(stats['percentiles'][percentile], np.percentile(values, percentile))
+        
+        self.assertEqual(summarize_biophilia_scores([40, 60])['all']['percentiles'][50], 50)
+    
+    def test_score_distribution_percentile_rank(self):
+        """Test percentile ranks and merging of score distributions"""
+        first = ScoreDistribution()
+        self.assertIsNone(first.percentile_rank(50))
+        for score in (10, 20, 30, 40):
+            first.add(score)
+        
+        second = ScoreDistribution.from_dict(ScoreDistribution().to_dict())
+        for score in (30, 90):
+            second.add(score)
+        first.merge(second)
+        
+        # Below 30: 10 and 20; tied at 30: two of six
+        self.assertAlmostEqual(first.percentile_rank(30), 100 * (2 + 1) / 6)
+        self.assertAlmostEqual(first.percentile_rank(90), 100 * (5 + 0.5) / 6)
+        self.assertEqual(first.percentile_rank(100), 100)
+        
+        first.remove(90)
+        first.remove(90)
+        self.assertEqual(first.total, 5)
+        self.assertEqual(first.percentile_rank(0), 0)
+    
     def test_get_biophilia_recommendations_low(self):
         """Test recommendations for low score"""
         recommendations = get_biophilia_recommendations(30)
@@ -58,6 +119,29 @@ class TestBiophiliaCalculator(unittest.TestCase):
         location = {'lat': 37.7749, 'lon': -122.4194}
         recommendations = get_biophilia_recommendations(50, location)
         self.assertIn('location_based', recommendations)
+    
+    def test_get_biophilia_recommendations_frozen(self):
+        """Test tier recommendations are shared read-only tables"""
+        recommendations = get_biophilia_recommendations(30)
+        self.assertIs(recommendations, get_biophilia_recommendations(10))
+        self.assertIsNot(recommendations, get_biophilia_recommendations(50))
+        with self.assertRaises(TypeError):
+            recommendations['activities'] = []
+    
+    def test_get_biophilia_recommendations_nearby(self):
+        """Test location-based recommendations name nearby trails and are cached"""
+        location = {'lat': 37.7749, 'lon': -122.4194}
+        recommendations = get_biophilia_recommendations(30, location)
+        suggestions = ' '.join(recommendations['location_based'])
+        trail_names = [trail['name'] for trail in find_nearby_trails(location, distance=25, difficulty=('Easy',))]
+        self.assertTrue(trail_names)
+        self.assertIn(trail_names[0], suggestions)
+        self.assertNotIn('(Hard,', suggestions)
+        self.assertEqual(recommendations['activities'], get_biophilia_recommendations(30)['activities'])
+        
+        # Nearby locations in the same grid cell and tier share the result
+        self.assertIs(get_biophilia_recommendations(35, {'lat': 37.7731, 'lon': -122.4172}), recommendations)
+        self.assertIsNot(get_biophilia_recommendations(80, location), recommendations)
 
 if __name__ == '__main__':
     unittest.main()
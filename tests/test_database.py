@@ -0,0 +1,811 @@
+import asyncio
+import unittest
+import sys
+import os
+import json
+import random
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+# Add parent directory to path to import utils
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.database import SimpleDB, SQLiteDB, WriteBehindDB, AsyncSimpleDB, ExpirySweeper, IdCollection
+from utils.database import migrate_json_to_sqlite, migrate_to_shards
+from utils.database import add_array_item, remove_array_item
+from utils.journal_log import JournalLog
+
+def without_timestamps(data):
+    """Drop the fields that depend on when the test runs"""
+    return {key: value for key, value in data.items() if key not in ('created_at', 'last_updated')}
+
+class CountingDB(SimpleDB):
+    """SimpleDB that counts how often it reads and writes user files"""
+    def __init__(self, data_folder):
+        super().__init__(data_folder)
+        self.loads = 0
+        self.saves = 0
+        self.load_delay = 0
+        self.save_delay = 0
+    
+    def load_user_data(self, user_id):
+        self.loads += 1
+        time.sleep(self.load_delay)
+        return super().load_user_data(user_id)
+    
+    def save_user_data(self, user_id, data, **kwargs):
+        self.saves += 1
+        time.sleep(self.save_delay)
+        super().save_user_data(user_id, data, **kwargs)
+
+class TestDatabase(unittest.TestCase):
+
+    def setUp(self):
+        """Set up a fresh data folder for each test"""
+        self.folder = tempfile.mkdtemp()
+        self.json_db = SimpleDB(self.folder)
+        self.sqlite_db = SQLiteDB(os.path.join(self.folder, 'users.db'))
+    
+    def tearDown(self):
+        self.sqlite_db.close()
+        shutil.rmtree(self.folder)
+    
+    def apply_updates(self, db):
+        """Run the same sequence of updates against a database"""
+        db.update_user_field('alice', 'biophilia_score', 72)
+        db.add_to_user_array('alice', 'favorite_trails', {'id': 1, 'name': 'Pine Forest Loop'})
+        db.add_to_user_array('alice', 'favorite_trails', {'id': 2, 'name': 'Mountain Vista Trail'})
+        db.add_to_user_array('alice', 'favorite_trails', {'id': 1, 'name': 'Pine Forest Loop (updated)'})
+        db.add_to_user_array('alice', 'registered_events', {'id': 7, 'name': 'Stargazing Night'})
+        db.add_to_user_array('alice', 'nature_journal', {'date': '2025-03-01', 'location': 'Park'})
+        db.remove_from_user_array('alice', 'registered_events', 7)
+        db.add_to_user_array('alice', 'badges', 'early-bird')
+    
+    def test_load_missing_user(self):
+        """Test both backends return an empty document for unknown users"""
+        for db in (self.json_db, self.sqlite_db):
+            data = db.load_user_data('nobody')
+            self.assertEqual(data['user_id'], 'nobody')
+            self.assertEqual(data['favorite_trails'], [])
+            self.assertIsNone(data['biophilia_score'])
+    
+    def test_sqlite_matches_json_backend(self):
+        """Test the SQLite backend stores the same documents as SimpleDB"""
+        for db in (self.json_db, self.sqlite_db):
+            self.apply_updates(db)
+        
+        json_data = self.json_db.load_user_data('alice')
+        sqlite_data = self.sqlite_db.load_user_data('alice')
+        self.assertEqual(without_timestamps(sqlite_data), without_timestamps(json_data))
+        self.assertEqual([t['id'] for t in sqlite_data['favorite_trails']], [2, 1])
+        self.assertIn('last_updated', sqlite_data)
+    
+    def test_sqlite_reads_whole_documents(self):
+        """Test a load never mixes fields and array items from different writes"""
+        self.sqlite_db.save_user_data('alice', {'user_id': 'alice', 'version': 0, 'trails': [0]})
+        stop = threading.Event()
+        
+        def writer():
+            db = SQLiteDB(self.sqlite_db.db_path)
+            version = 0
+            while not stop.is_set():
+                version += 1
+                db.save_user_data('alice', {'user_id': 'alice', 'version': version, 'trails': [version]})
+            db.close()
+        
+        thread = threading.Thread(target=writer)
+        thread.start()
+        try:
+            for _ in range(2000):
+                data = self.sqlite_db.load_user_data('alice')
+                self.assertEqual(data['trails'], [data['version']])
+        finally:
+            stop.set()
+            thread.join()
+    
+    def test_sqlite_connections_are_bounded(self):
+        """Test many short-lived threads share a bounded pool of connections"""
+        db = SQLiteDB(os.path.join(self.folder, 'pooled.db'), pool_size=4)
+        
+        def work(number):
+            db.update_user_field(f"user{number % 10}", 'biophilia_score', number)
+            db.load_user_data(f"user{number % 10}")
+        
+        for start in range(0, 200, 20):
+            threads = [threading.Thread(target=work, args=(number,)) for number in range(start, start + 20)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        self.assertLessEqual(db._opened, 4)
+        self.assertIn(db.load_user_data('user9')['biophilia_score'], (189, 199))
+        db.close()
+        self.assertEqual(db._opened, 0)
+    
+    def test_migrate_json_to_sqlite(self):
+        """Test existing JSON user files are imported unchanged"""
+        self.apply_updates(self.json_db)
+        self.json_db.save_user_data('bob', {'user_id': 'bob', 'biophilia_score': 40, 'favorite_trails': []})
+        
+        self.assertEqual(migrate_json_to_sqlite(self.folder, self.sqlite_db), 2)
+        for user_id in ('alice', 'bob'):
+            self.assertEqual(self.sqlite_db.load_user_data(user_id), self.json_db.load_user_data(user_id))
+    
+    def test_id_collection_matches_list_semantics(self):
+        """Test id-keyed arrays end up exactly like the list-based updates"""
+        rng = random.Random(3)
+        indexed = {'favorite_trails': [{'id': 0}, 'legacy-item', {'name': 'no id'}]}
+        plain = {'trails': [{'id': 0}, 'legacy-item', {'name': 'no id'}]}
+        
+        for step in range(300):
+            item_id = rng.randrange(20)
+            if rng.random() < 0.6:
+                item = {'id': item_id, 'step': step}
+                add_array_item(indexed, 'favorite_trails', item)
+                add_array_item(plain, 'trails', dict(item))
+            else:
+                remove_array_item(indexed, 'favorite_trails', item_id)
+                remove_array_item(plain, 'trails', item_id)
+        
+        collection = indexed['favorite_trails']
+        self.assertIsInstance(collection, IdCollection)
+        self.assertEqual(collection, plain['trails'])
+        self.assertEqual(collection.to_list(), plain['trails'])
+        
+        present = {item['id'] for item in plain['trails'] if isinstance(item, dict) and 'id' in item}
+        for item_id in range(20):
+            self.assertEqual(item_id in collection, item_id in present)
+    
+    def test_id_collections_stored_as_lists(self):
+        """Test indexed arrays are written and returned in the list format"""
+        db = WriteBehindDB(SimpleDB(self.folder), flush_interval=None)
+        db.add_to_user_array('alice', 'favorite_trails', {'id': 1})
+        db.add_to_user_array('alice', 'favorite_trails', {'id': 2})
+        db.add_to_user_array('alice', 'favorite_trails', {'id': 1, 'note': 'again'})
+        
+        self.assertIs(type(db.load_user_data('alice')['favorite_trails']), list)
+        db.close()
+        
+        with open(self.json_db.user_path('alice'), 'r') as f:
+            self.assertEqual(json.load(f)['favorite_trails'], [{'id': 2}, {'id': 1, 'note': 'again'}])
+    
+    def test_apply_ops_reads_and_writes_once(self):
+        """Test a batch of operations matches the single calls with one read and one write"""
+        ops = [
+            ('set', 'biophilia_score', 72),
+            ('add', 'favorite_trails', {'id': 1, 'name': 'Pine Forest Loop'}),
+            ('add', 'favorite_trails', {'id': 2, 'name': 'Mountain Vista Trail'}),
+            ('add', 'registered_events', {'id': 7, 'name': 'Stargazing Night'}),
+            ('remove', 'favorite_trails', 1),
+            ('add', 'nature_journal', {'date': '2025-03-01'})
+        ]
+        for action, field, value in ops:
+            {'set': self.json_db.update_user_field, 'add': self.json_db.add_to_user_array,
+             'remove': self.json_db.remove_from_user_array}[action]('single', field, value)
+        
+        db = SimpleDB(self.folder)
+        calls = []
+        for name in ('_read_document', '_write_document'):
+            method = getattr(db, name)
+            setattr(db, name, lambda *args, method=method, name=name, **kwargs: calls.append(name) or method(*args, **kwargs))
+        
+        db.apply_ops('batch', ops)
+        self.assertEqual(calls, ['_read_document', '_write_document'])
+        self.assertEqual(
+            without_timestamps(self.json_db.load_user_data('batch')),
+            dict(without_timestamps(self.json_db.load_user_data('single')), user_id='batch')
+        )
+        
+        self.sqlite_db.apply_ops('batch', ops)
+        self.assertEqual(
+            without_timestamps(self.sqlite_db.load_user_data('batch')),
+            without_timestamps(self.json_db.load_user_data('batch'))
+        )
+    
+    def test_apply_ops_failure_changes_nothing(self):
+        """Test a batch with a bad operation leaves the document and journal untouched"""
+        self.json_db.update_user_field('alice', 'biophilia_score', 40)
+        journal_add = ('add', 'nature_journal', {'date': '2025-03-01'})
+        
+        for bad_op in [('rename', 'biophilia_score', 50), ('add', 'biophilia_score', 50)]:
+            with self.assertRaises((ValueError, AttributeError)):
+                self.json_db.apply_ops('alice', [journal_add, ('set', 'biophilia_score', 90), bad_op])
+        
+        data = self.json_db.load_user_data('alice')
+        self.assertEqual(data['biophilia_score'], 40)
+        self.assertEqual(data['nature_journal'], [])
+    
+    def test_transaction_rolls_back_on_error(self):
+        """Test a failed transaction leaves the stored document untouched"""
+        self.json_db.update_user_field('alice', 'biophilia_score', 40)
+        
+        with self.assertRaises(RuntimeError):
+            with self.json_db.transaction('alice') as data:
+                data['biophilia_score'] = 90
+                raise RuntimeError('interrupted')
+        
+        with self.json_db.transaction('alice') as data:
+            self.assertEqual(data['biophilia_score'], 40)
+            data['biophilia_score'] = 65
+        
+        self.assertEqual(self.json_db.load_user_data('alice')['biophilia_score'], 65)
+        self.assertEqual([name for name in os.listdir(self.folder) if name.endswith('.tmp')], [])
+    
+    def run_writers(self, dbs, writers=64, rounds=5):
+        """Run concurrent read-modify-write cycles on one user and return the elapsed time"""
+        start_line = threading.Barrier(writers)
+        errors = []
+        
+        def write(writer):
+            db = dbs[writer % len(dbs)]
+            try:
+                start_line.wait()
+                for round_number in range(rounds):
+                    db.add_to_user_array('shared', 'favorite_trails', {'id': f"{writer}-{round_number}"})
+                    with db.transaction('shared') as data:
+                        data['visits'] = data.get('visits', 0) + 1
+            except Exception as error:
+                errors.append(error)
+        
+        started = time.time()
+        threads = [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        return time.time() - started
+    
+    def test_concurrent_writers_lose_no_updates(self):
+        """Test 64 threads updating one user keep every change"""
+        elapsed = self.run_writers([self.json_db])
+        
+        data = self.json_db.load_user_data('shared')
+        self.assertEqual(len(data['favorite_trails']), 64 * 5)
+        self.assertEqual(data['visits'], 64 * 5)
+        self.assertLess(elapsed, 30)
+    
+    def test_file_locks_serialize_separate_instances(self):
+        """Test instances sharing a folder (as processes would) keep every change with file locks"""
+        dbs = [SimpleDB(self.folder, file_locks=True) for _ in range(4)]
+        self.run_writers(dbs, writers=16)
+        
+        data = self.json_db.load_user_data('shared')
+        self.assertEqual(len(data['favorite_trails']), 16 * 5)
+        self.assertEqual(data['visits'], 16 * 5)
+    
+    def test_file_locks_use_fixed_stripe_files(self):
+        """Test lock files are shared per stripe and not left behind per user"""
+        db = SimpleDB(self.folder, lock_stripes=4, file_locks=True)
+        for number in range(40):
+            db.update_user_field(f"user{number}", 'biophilia_score', number)
+            db.delete_user(f"user{number}")
+        self.assertLessEqual(set(os.listdir(os.path.join(self.folder, 'locks'))),
+                             {f"stripe_{n}.lock" for n in range(4)} | {'score_distribution.lock'})
+        
+        # Two users of one stripe can be held together by one thread
+        with db._user_lock('a'):
+            for number in range(8):
+                with db._user_lock(f"other{number}"):
+                    pass
+    
+    def test_async_loads_are_coalesced(self):
+        """Test concurrent async loads of one user share a single read"""
+        backend = CountingDB(self.folder)
+        backend.load_delay = 0.05
+        db = AsyncSimpleDB(backend, max_workers=4)
+        
+        async def scenario():
+            await db.update_user_field('alice', 'biophilia_score', 81)
+            results = await asyncio.gather(*(db.load_user_data('alice') for _ in range(100)))
+            
+            # Callers get independent copies
+            results[0]['biophilia_score'] = 0
+            self.assertEqual({data['biophilia_score'] for data in results[1:]}, {81})
+            
+            # A load after a write does not reuse the old read
+            await db.add_to_user_array('alice', 'favorite_trails', {'id': 3})
+            return await db.load_user_data('alice')
+        
+        latest = asyncio.run(scenario())
+        db.close()
+        self.assertEqual(backend.loads, 2)
+        self.assertEqual(db.coalesced, 99)
+        self.assertEqual(latest['favorite_trails'], [{'id': 3}])
+    
+    def test_async_load_after_write_sees_write(self):
+        """Test a load started during a write is not shared with callers after it"""
+        class ReadThenWaitDB(CountingDB):
+            def load_user_data(self, user_id):
+                self.loads += 1
+                data = SimpleDB.load_user_data(self, user_id)
+                time.sleep(self.load_delay)
+                return data
+        
+        backend = ReadThenWaitDB(self.folder)
+        backend.load_delay = 0.3
+        backend.save_delay = 0.1
+        db = AsyncSimpleDB(backend, max_workers=4)
+        
+        async def scenario():
+            write = asyncio.ensure_future(db.save_user_data('alice', {'user_id': 'alice', 'biophilia_score': 64}))
+            await asyncio.sleep(0.05)
+            
+            # Reads the old document and is still running when the write ends
+            early = asyncio.ensure_future(db.load_user_data('alice'))
+            await write
+            latest = await db.load_user_data('alice')
+            await early
+            return latest
+        
+        latest = asyncio.run(scenario())
+        db.close()
+        self.assertEqual(latest['biophilia_score'], 64)
+        self.assertEqual(backend.loads, 2)
+    
+    def test_async_calls_keep_event_loop_responsive(self):
+        """Test hundreds of concurrent async requests do not stall the event loop"""
+        db = AsyncSimpleDB(SimpleDB(self.folder), max_workers=8)
+        
+        async def scenario():
+            lags = []
+            done = asyncio.Event()
+            
+            async def ticker():
+                while not done.is_set():
+                    before = time.perf_counter()
+                    await asyncio.sleep(0.005)
+                    lags.append(time.perf_counter() - before - 0.005)
+            
+            async def request(number):
+                user_id = f"user{number % 50}"
+                await db.add_to_user_array(user_id, 'favorite_trails', {'id': number})
+                return await db.load_user_data(user_id)
+            
+            ticking = asyncio.ensure_future(ticker())
+            results = await asyncio.gather(*(request(number) for number in range(400)))
+            done.set()
+            await ticking
+            return lags, results
+        
+        lags, results = asyncio.run(scenario())
+        db.close()
+        self.assertEqual(len(results), 400)
+        self.assertLess(max(lags), 0.25)
+        self.assertEqual(len(self.json_db.load_user_data('user0')['favorite_trails']), 8)
+    
+    def sweep(self, sweeper, now=None, steps=50):
+        """Run sweeper steps and return the number of users each one deleted"""
+        return [sweeper.step(now) for _ in range(steps)]
+    
+    def test_expiry_sweeper_deletes_inactive_users(self):
+        """Test only users inactive for the expiry period are deleted, in bounded batches"""
+        for number in range(5):
+            self.json_db.update_user_field(f"idle{number}", 'biophilia_score', number)
+        self.json_db.add_journal_entry('idle0', {'date': '2025-03-01'})
+        self.json_db.update_user_field('active', 'biophilia_score', 90)
+        
+        # Forty days from now, 'active' was written five days ago
+        later = datetime.now() + timedelta(days=40)
+        recent = (later - timedelta(days=5)).timestamp()
+        os.utime(self.json_db.user_path('active'), (recent, recent))
+        
+        sweeper = ExpirySweeper(self.json_db, expiry_days=30, batch_size=2)
+        deleted = self.sweep(sweeper, later)
+        
+        self.assertEqual(sum(deleted), 5)
+        self.assertEqual(max(deleted), 2)
+        self.assertEqual([user_id for user_id, _ in self.json_db.iter_user_files()], ['active'])
+        self.assertFalse(self.json_db.journal.exists('idle0'))
+        self.assertEqual(self.json_db.load_user_data('active')['biophilia_score'], 90)
+    
+    def test_expiry_sweeper_indexes_older_files(self):
+        """Test user files written before the index existed are found"""
+        for user_id, age in (('legacy', 45), ('recent', 3)):
+            path = os.path.join(self.folder, f"user_{user_id}.json")
+            with open(path, 'w') as f:
+                json.dump({'user_id': user_id}, f)
+            modified = (datetime.now() - timedelta(days=age)).timestamp()
+            os.utime(path, (modified, modified))
+        
+        sweeper = ExpirySweeper(SimpleDB(self.folder), expiry_days=30)
+        self.assertEqual(sum(self.sweep(sweeper)), 1)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'user_legacy.json')))
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'user_recent.json')))
+    
+    def test_shard_migration_keeps_flat_files_readable(self):
+        """Test flat user files are read in place and moved to shards in resumable runs"""
+        for number in range(5):
+            with open(os.path.join(self.folder, f"user_flat{number}.json"), 'w') as f:
+                json.dump({'user_id': f"flat{number}", 'biophilia_score': number}, f)
+        
+        self.assertEqual(self.json_db.load_user_data('flat3')['biophilia_score'], 3)
+        
+        # Writing a flat user moves it to its shard
+        self.json_db.update_user_field('flat0', 'biophilia_score', 50)
+        self.assertEqual(os.path.relpath(self.json_db.user_path('flat0'), self.folder).count(os.sep), 3)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'user_flat0.json')))
+        
+        self.assertEqual(migrate_to_shards(self.json_db, limit=2), 2)
+        self.assertEqual(migrate_to_shards(self.json_db), 2)
+        self.assertEqual(migrate_to_shards(self.json_db), 0)
+        
+        self.assertEqual([name for name in os.listdir(self.folder) if name.startswith('user_')], [])
+        self.assertEqual(sorted(user_id for user_id, _ in self.json_db.iter_user_files()), [f"flat{n}" for n in range(5)])
+        self.assertEqual([self.json_db.load_user_data(f"flat{n}")['biophilia_score'] for n in range(5)], [50, 1, 2, 3, 4])
+    
+    def test_shard_migration_moves_flat_journals(self):
+        """Test journals of the flat layout are read in place and moved to shards"""
+        journals = os.path.join(self.folder, 'journals')
+        for number in range(3):
+            self.json_db.add_journal_entry(f"flat{number}", {'id': number, 'day': number})
+            # Put the files back where the flat layout kept them
+            for path in self.json_db.journal.paths(f"flat{number}")[:4]:
+                if os.path.exists(path):
+                    os.replace(path, os.path.join(journals, os.path.basename(path)))
+        
+        db = SimpleDB(self.folder)
+        self.assertEqual(sorted(db.journal.flat_user_ids()), ['flat0', 'flat1', 'flat2'])
+        self.assertEqual(db.get_journal_entries('flat0')['entries'], [{'id': 0, 'day': 0}])
+        
+        self.assertEqual(migrate_to_shards(db), 2)
+        self.assertEqual(migrate_to_shards(db), 0)
+        self.assertEqual([name for name in os.listdir(journals) if name.startswith('journal_')], [])
+        
+        # Id lookups keep working after the move
+        db.add_journal_entry('flat2', {'id': 2, 'day': 9})
+        self.assertEqual(db.journal.entries('flat2'), [{'id': 2, 'day': 9}])
+        self.assertEqual(os.path.relpath(db.journal.paths('flat2')[0], journals).count(os.sep), 2)
+    
+    def test_item_index_follows_user_changes(self):
+        """Test trail and event lookups stay in line with every kind of write"""
+        self.json_db = SimpleDB(self.folder, item_index=True)
+        self.apply_updates(self.json_db)
+        self.json_db.add_to_user_array('bob', 'favorite_trails', {'id': 2})
+        self.json_db.apply_ops('carol', [('add', 'favorite_trails', {'id': 2}), ('add', 'registered_events', {'id': 7})])
+        
+        self.assertEqual(self.json_db.get_item_users('favorite_trails', 2), ['alice', 'bob', 'carol'])
+        self.assertEqual(self.json_db.get_item_users('favorite_trails', 1), ['alice'])
+        self.assertEqual(self.json_db.count_item_users('registered_events', 7), 1)
+        
+        data = self.json_db.load_user_data('alice')
+        data['favorite_trails'] = [{'id': 5}]
+        self.json_db.save_user_data('alice', data)
+        self.json_db.delete_user('bob')
+        
+        self.assertEqual(self.json_db.get_item_users('favorite_trails', 2), ['carol'])
+        self.assertEqual(self.json_db.count_item_users('favorite_trails', 2), 1)
+        self.assertEqual(self.json_db.count_item_users('favorite_trails', 5), 1)
+        
+        # A rebuilt index from the files alone is the same
+        os.remove(os.path.join(self.folder, 'item_index.db'))
+        rebuilt = SimpleDB(self.folder, item_index=True)
+        self.assertEqual(rebuilt.rebuild_item_index(), 2)
+        self.assertEqual(rebuilt.get_item_users('favorite_trails', 2), ['carol'])
+        self.assertEqual(rebuilt.count_item_users('registered_events', 7), 1)
+    
+    def test_item_index_is_opt_in(self):
+        """Test the item index is only kept when enabled, and only for id-keyed changes"""
+        self.apply_updates(self.json_db)
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'item_index.db')))
+        self.assertTrue(self.json_db.register_for_event('alice', {'id': 8}))
+        with self.assertRaises(ValueError):
+            self.json_db.count_item_users('registered_events', 8)
+        with self.assertRaises(ValueError):
+            self.json_db.register_for_event('alice', {'id': 9}, capacity=5)
+        
+        db = SimpleDB(self.folder, item_index=True)
+        syncs = []
+        sync_user = db.item_index.sync_user
+        db.item_index.sync_user = lambda *args: syncs.append(args[0]) or sync_user(*args)
+        db.update_user_field('alice', 'biophilia_score', 10)
+        db.apply_ops('alice', [('set', 'biophilia_score', 20), ('add', 'nature_journal', {'date': 'x'})])
+        self.assertEqual(syncs, [])
+        
+        db.apply_ops('alice', [('add', 'favorite_trails', {'id': 4})])
+        self.assertEqual(syncs, ['alice'])
+        self.assertEqual(db.get_item_users('favorite_trails', 4), ['alice'])
+    
+    def test_event_capacity_is_never_exceeded(self):
+        """Test concurrent registrations fill an event exactly to capacity"""
+        self.json_db = SimpleDB(self.folder, item_index=True)
+        results = []
+        
+        def register(number):
+            results.append(self.json_db.register_for_event(f"user{number}", {'id': 9, 'name': 'Bird Walk'}, capacity=10))
+        
+        threads = [threading.Thread(target=register, args=(number,)) for number in range(32)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(results.count(True), 10)
+        self.assertEqual(self.json_db.count_item_users('registered_events', 9), 10)
+        
+        registered = [
+            user_id for user_id in self.json_db.get_item_users('registered_events', 9)
+            if self.json_db.load_user_data(user_id)['registered_events'] == [{'id': 9, 'name': 'Bird Walk'}]
+        ]
+        self.assertEqual(len(registered), 10)
+        
+        # Registering again is not a second place; leaving frees one
+        self.assertTrue(self.json_db.register_for_event(registered[0], {'id': 9}, capacity=10))
+        self.json_db.remove_from_user_array(registered[0], 'registered_events', 9)
+        self.assertTrue(self.json_db.register_for_event('late', {'id': 9}, capacity=10))
+        self.assertFalse(self.json_db.register_for_event('later', {'id': 9}, capacity=10))
+    
+    def test_score_distribution_follows_saved_scores(self):
+        """Test each user's current score is counted once across instances"""
+        other = SimpleDB(self.folder)
+        self.json_db.update_user_field('alice', 'biophilia_score', 40)
+        other.update_user_field('bob', 'biophilia_score', 80)
+        self.json_db.apply_ops('carol', [('set', 'biophilia_score', 60)])
+        
+        # Re-scoring replaces the old score rather than adding another
+        data = other.load_user_data('alice')
+        data['biophilia_score'] = 70
+        other.save_user_data('alice', data)
+        self.json_db.add_to_user_array('alice', 'favorite_trails', {'id': 1})
+        
+        distribution = self.json_db.get_score_distribution()
+        self.assertEqual(distribution.total, 3)
+        self.assertEqual(self.json_db.score_percentile_rank(70), 50)
+        
+        self.json_db.delete_user('bob')
+        self.assertEqual(other.score_percentile_rank(70), 75)
+        
+        os.remove(os.path.join(self.folder, 'score_distribution.json'))
+        rebuilt = self.json_db.rebuild_score_distribution()
+        self.assertEqual(rebuilt.total, 2)
+        self.assertEqual(self.json_db.score_percentile_rank(70), 75)
+    
+    def test_journal_pages_newest_first(self):
+        """Test journal pages walk the history from newest to oldest"""
+        self.json_db.update_user_field('alice', 'biophilia_score', 60)
+        for day in range(1, 26):
+            self.json_db.add_to_user_array('alice', 'nature_journal', {'date': f"2025-03-{day:02d}"})
+        
+        dates = []
+        before = None
+        while True:
+            page = self.json_db.get_journal_entries('alice', limit=10, before=before)
+            dates.extend(entry['date'] for entry in page['entries'])
+            before = page['next_before']
+            if before is None:
+                break
+        
+        self.assertEqual(dates, [f"2025-03-{day:02d}" for day in range(25, 0, -1)])
+        self.assertEqual(len(self.json_db.load_user_data('alice')['nature_journal']), 25)
+        
+        # The user file itself no longer grows with the journal
+        with open(self.json_db.user_path('alice'), 'r') as f:
+            self.assertEqual(json.load(f).get('nature_journal', []), [])
+    
+    def test_journal_migrates_legacy_entries(self):
+        """Test journal entries stored in an old user file are kept in order"""
+        with open(os.path.join(self.folder, 'user_bob.json'), 'w') as f:
+            json.dump({'user_id': 'bob', 'nature_journal': [{'date': 'a'}, {'date': 'b'}]}, f)
+        
+        self.json_db.add_to_user_array('bob', 'nature_journal', {'date': 'c'})
+        self.assertEqual([e['date'] for e in self.json_db.load_user_data('bob')['nature_journal']], ['a', 'b', 'c'])
+        
+        # Saving a loaded document with one new entry only appends it
+        data = self.json_db.load_user_data('bob')
+        data['nature_journal'].append({'date': 'd'})
+        self.json_db.save_user_data('bob', data)
+        self.assertEqual(self.json_db.journal.entries('bob'), [{'date': d} for d in 'abcd'])
+    
+    def test_journal_saves_keep_edited_entries(self):
+        """Test saving a journal with an edited older entry stores the edit"""
+        for day in ('a', 'b', 'c'):
+            self.json_db.add_journal_entry('dana', {'date': day, 'note': ''})
+        
+        # The newest entry is unchanged, so only a full comparison sees the edit
+        data = self.json_db.load_user_data('dana')
+        data['nature_journal'][0]['note'] = 'saw a heron'
+        self.json_db.save_user_data('dana', data)
+        self.assertEqual(self.json_db.journal.entries('dana')[0], {'date': 'a', 'note': 'saw a heron'})
+        
+        entries = self.json_db.load_user_data('dana')['nature_journal']
+        entries[1]['note'] = 'rain'
+        entries.append({'date': 'd', 'note': ''})
+        self.json_db.update_user_field('dana', 'nature_journal', entries)
+        self.assertEqual(self.json_db.journal.entries('dana'), entries)
+    
+    def test_journal_log_repairs_and_compacts(self):
+        """Test an interrupted append is repaired and deleted entries are compacted away"""
+        journal = JournalLog(os.path.join(self.folder, 'journals'), min_compact=2)
+        for number in range(6):
+            journal.append('carol', {'id': number})
+        
+        # Simulate a crash after the log write but before the index write
+        with open(journal.paths('carol')[0], 'a') as f:
+            f.write('{"id": 6}\n{"id": 7')
+        
+        journal = JournalLog(os.path.join(self.folder, 'journals'), min_compact=2)
+        self.assertEqual([entry['id'] for _, entry in journal.latest('carol', limit=3)], [6, 5, 4])
+        
+        journal.delete('carol', 5)
+        self.assertEqual(journal.count('carol'), 6)
+        journal.delete('carol', 1)
+        
+        # Two deletions reach the threshold and the log is rewritten
+        self.assertFalse(os.path.exists(journal.paths('carol')[2]))
+        self.assertEqual([entry['id'] for entry in journal.entries('carol')], [0, 2, 3, 4, 6])
+        
+        # Entries keep their numbers through compaction
+        self.assertEqual(journal.latest('carol', limit=2, before=4), [(3, {'id': 3}), (2, {'id': 2})])
+        self.assertEqual(journal.latest('carol', limit=2, before=2), [(0, {'id': 0})])
+        self.assertEqual(journal.append('carol', {'id': 7}), 7)
+        self.assertEqual(journal.find('carol', 3), [3])
+        self.assertEqual(journal.find('carol', 5), [])
+    
+    def test_journal_log_state_is_bounded(self):
+        """Test per-user locks and caches stay bounded over many users"""
+        journal = JournalLog(os.path.join(self.folder, 'journals'), lock_stripes=4, cached_users=8)
+        for number in range(50):
+            journal.append(f"user{number}", {'id': number})
+            self.assertEqual(journal.find(f"user{number}", number), [0])
+        
+        self.assertLessEqual(len(journal._checked), 8)
+        self.assertLessEqual(len(journal._ids), 8)
+        
+        # Users dropped from the caches are read back from their files
+        journal.append('user0', {'id': 0})
+        self.assertEqual(journal.find('user0', 0), [0, 1])
+        self.assertEqual(journal.count('user0'), 2)
+    
+    def test_journal_pages_survive_compaction(self):
+        """Test a page cursor still continues after older entries are deleted"""
+        self.json_db.journal.min_compact = 2
+        for number in range(20):
+            self.json_db.add_journal_entry('alice', {'id': number})
+        
+        page = self.json_db.get_journal_entries('alice', limit=5)
+        self.assertEqual([e['id'] for e in page['entries']], [19, 18, 17, 16, 15])
+        
+        # Deleting entries on both sides of the cursor compacts the log
+        for number in (17, 12, 3, 2, 1):
+            self.json_db.remove_from_user_array('alice', 'nature_journal', number)
+        self.assertFalse(os.path.exists(self.json_db.journal.paths('alice')[2]))
+        
+        page = self.json_db.get_journal_entries('alice', limit=5, before=page['next_before'])
+        self.assertEqual([e['id'] for e in page['entries']], [14, 13, 11, 10, 9])
+        page = self.json_db.get_journal_entries('alice', limit=5, before=page['next_before'])
+        self.assertEqual([e['id'] for e in page['entries']], [8, 7, 6, 5, 4])
+        page = self.json_db.get_journal_entries('alice', limit=5, before=page['next_before'])
+        self.assertEqual(page, {'entries': [{'id': 0}], 'next_before': None})
+    
+    def test_journal_entries_with_ids_replace_earlier_ones(self):
+        """Test adding an entry with an existing id replaces it, without rereading the log"""
+        for number in range(50):
+            self.json_db.add_journal_entry('alice', {'id': number % 10, 'version': number})
+        
+        entries = self.json_db.journal.entries('alice')
+        self.assertEqual([e['id'] for e in entries], list(range(10)))
+        self.assertEqual([e['version'] for e in entries], list(range(40, 50)))
+        
+        # A fresh log object rebuilds the id map from the id file
+        journal = JournalLog(self.json_db.journal.folder)
+        self.assertEqual(len(journal.find('alice', 3)), 1)
+        self.assertEqual(journal.latest('alice', limit=1), [(49, {'id': 9, 'version': 49})])
+    
+    def test_write_behind_coalesces_writes(self):
+        """Test many mutations to one user are written once"""
+        backend = CountingDB(self.folder)
+        db = WriteBehindDB(backend, flush_interval=None)
+        
+        for trail_id in range(5):
+            db.add_to_user_array('alice', 'favorite_trails', {'id': trail_id})
+        db.update_user_field('alice', 'biophilia_score', 80)
+        
+        self.assertEqual(backend.saves, 0)
+        self.assertEqual(db.stats()['dirty'], 1)
+        self.assertEqual(db.flush(), 1)
+        self.assertEqual((backend.loads, backend.saves), (1, 1))
+        
+        stored = self.json_db.load_user_data('alice')
+        self.assertEqual([t['id'] for t in stored['favorite_trails']], [0, 1, 2, 3, 4])
+        self.assertEqual(stored['biophilia_score'], 80)
+        self.assertEqual(db.stats()['dirty'], 0)
+        self.assertEqual(db.stats()['flushes'], 1)
+    
+    def test_write_behind_flushes_after_interval(self):
+        """Test dirty documents are written without an explicit flush"""
+        db = WriteBehindDB(SimpleDB(self.folder), flush_interval=0.05)
+        db.update_user_field('alice', 'biophilia_score', 55)
+        
+        deadline = time.time() + 5
+        while db.stats()['flushes'] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.json_db.load_user_data('alice')['biophilia_score'], 55)
+    
+    def test_write_behind_evicts_least_recently_used(self):
+        """Test eviction writes dirty documents before dropping them"""
+        db = WriteBehindDB(SimpleDB(self.folder), flush_interval=None, max_users=2)
+        for user_id in ('alice', 'bob', 'carol'):
+            db.update_user_field(user_id, 'biophilia_score', 50)
+        
+        stats = db.stats()
+        self.assertEqual((stats['cached'], stats['evictions'], stats['dirty']), (2, 1, 2))
+        self.assertEqual(self.json_db.load_user_data('alice')['biophilia_score'], 50)
+        self.assertEqual(db.load_user_data('alice')['biophilia_score'], 50)
+        db.close()
+    
+    def test_write_behind_writes_evictions_outside_lock(self):
+        """Test a slow eviction write does not block other users of the cache"""
+        backend = CountingDB(self.folder)
+        db = WriteBehindDB(backend, flush_interval=None, max_users=2)
+        db.update_user_field('alice', 'biophilia_score', 1)
+        db.load_user_data('bob')
+        
+        # Loading carol evicts alice, whose write is slow
+        backend.save_delay = 0.5
+        loader = threading.Thread(target=db.load_user_data, args=('carol',))
+        loader.start()
+        time.sleep(0.1)
+        
+        start = time.time()
+        self.assertEqual(db.stats()['evictions'], 1)
+        self.assertEqual(db.load_user_data('bob')['user_id'], 'bob')
+        self.assertLess(time.time() - start, 0.3)
+        
+        # The evicted version is served until its write lands
+        backend.save_delay = 0
+        db.update_user_field('alice', 'biophilia_score', 2)
+        loader.join()
+        db.close()
+        self.assertEqual(self.json_db.load_user_data('alice')['biophilia_score'], 2)
+    
+    def test_write_behind_saves_pass_stored_score(self):
+        """Test flushes and evictions keep the score distribution without reading user files back"""
+        backend = SimpleDB(self.folder)
+        reads = []
+        read_document = backend._read_document
+        backend._read_document = lambda user_id: reads.append(user_id) or read_document(user_id)
+        
+        db = WriteBehindDB(backend, flush_interval=None, max_users=1)
+        db.update_user_field('alice', 'biophilia_score', 40)
+        db.update_user_field('alice', 'biophilia_score', 90)
+        db.flush()
+        db.update_user_field('alice', 'biophilia_score', 20)
+        db.update_user_field('bob', 'biophilia_score', 60)
+        db.flush()
+        
+        # One read per user, when it was first loaded
+        self.assertEqual(reads, ['alice', 'bob'])
+        distribution = backend.get_score_distribution()
+        self.assertEqual(distribution.total, 2)
+        self.assertEqual((distribution.counts[20], distribution.counts[60]), (1, 1))
+    
+    def test_write_behind_evicts_after_running_flush(self):
+        """Test a user changed during its flush keeps the newer version"""
+        backend = CountingDB(self.folder)
+        db = WriteBehindDB(backend, flush_interval=None, max_users=1)
+        db.update_user_field('alice', 'biophilia_score', 1)
+        
+        # Only the flush's write is slow
+        backend.save_delay = 0.3
+        flusher = threading.Thread(target=db.flush)
+        flusher.start()
+        time.sleep(0.05)
+        backend.save_delay = 0
+        
+        # Changed while its older version is being written, then pushed out
+        db.update_user_field('alice', 'biophilia_score', 2)
+        db.load_user_data('bob')
+        self.assertEqual(db.load_user_data('alice')['biophilia_score'], 2)
+        
+        flusher.join()
+        db.close()
+        self.assertEqual(self.json_db.load_user_data('alice')['biophilia_score'], 2)
+        self.assertLessEqual(db.stats()['cached'], 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,15 @@
 import unittest
 import sys
 import os
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 
 # Add parent directory to path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.event_manager import get_upcoming_events, create_sample_events_data
+from utils.event_manager import get_upcoming_events, find_nearby_events, create_sample_events_data, EventCalendar
+from utils.trail_finder import haversine
 
 class TestEventManager(unittest.TestCase):
     
@@ -85,6 +87,89 @@ class TestEventManager(unittest.TestCase):
             self.assertIn(event['type'], event_types)
             event_date = pd.to_datetime(event['date'])
             self.assertTrue(self.start_date <= event_date <= self.end_date)
+    
+    def test_event_calendar_date_slices(self):
+        """Test the calendar sorts once and answers windows by binary search"""
+        events_df = pd.DataFrame({
+            'id': [1, 2, 3, 4, 5],
+            'date': ['2025-03-10', '2025-03-01', None, '2025-03-10', '2025-03-05'],
+            'type': ['Education', 'Birdwatching', 'Education', 'Conservation', 'Education']
+        })
+        calendar = EventCalendar(events_df)
+        
+        # Sorted by date, ties in file order, missing dates last
+        self.assertEqual(list(calendar.events_df['id']), [2, 5, 1, 4, 3])
+        
+        self.assertEqual(list(calendar.events_between('2025-03-05', '2025-03-10')['id']), [5, 1, 4])
+        self.assertEqual(list(calendar.events_between('2025-03-02', None)['id']), [5, 1, 4])
+        self.assertEqual(list(calendar.events_between('2025-03-11', '2025-03-01')['id']), [])
+    
+    def test_event_calendar_type_postings(self):
+        """Test type filters merge posting lists within the date window"""
+        events_df = pd.DataFrame({
+            'id': [1, 2, 3, 4, 5, 6],
+            'date': ['2025-03-06', '2025-03-01', '2025-03-03', '2025-03-02', '2025-03-05', '2025-03-04'],
+            'type': ['Education', 'Birdwatching', 'Conservation', 'Birdwatching', 'Education', 'Conservation']
+        })
+        calendar = EventCalendar(events_df)
+        
+        # Configured types without events have empty posting lists
+        self.assertEqual(len(calendar.type_postings['Camping']), 0)
+        
+        query = calendar.query(types=['Birdwatching', 'Conservation'])
+        self.assertEqual(list(query['id']), [2, 4, 3, 6])
+        
+        query = calendar.query(date_range=('2025-03-02', '2025-03-05'), types=['Birdwatching', 'Conservation'], limit=2)
+        self.assertEqual(list(query['id']), [4, 3])
+        
+        self.assertEqual(len(calendar.query(types=['Stargazing'])), 0)
+    
+    def test_event_calendar_nearby_matches_full_scan(self):
+        """Test radius-and-window queries find the same events as a full scan"""
+        rng = np.random.default_rng(3)
+        events_df = pd.DataFrame({
+            'id': np.arange(3000),
+            'date': (pd.Timestamp('2025-01-01') + pd.to_timedelta(rng.integers(0, 120, 3000), unit='D')).strftime('%Y-%m-%d'),
+            'type': rng.choice(['Education', 'Birdwatching', 'Conservation'], 3000),
+            'latitude': rng.uniform(37, 38.5, 3000),
+            'longitude': rng.uniform(-123, -121.5, 3000)
+        })
+        calendar = EventCalendar(events_df)
+        
+        start, end = pd.Timestamp('2025-02-08'), pd.Timestamp('2025-02-09')
+        distances = np.array([haversine(-122.4, 37.77, lon, lat)
+                              for lat, lon in zip(events_df['latitude'], events_df['longitude'])])
+        dates = pd.to_datetime(events_df['date'])
+        
+        expected = events_df[(distances <= 20) & (dates >= start) & (dates <= end)
+                             & events_df['type'].isin(['Education', 'Birdwatching'])]
+        expected = expected.assign(date_obj=dates).sort_values(['date_obj'], kind='stable')
+        
+        found = calendar.query_nearby(37.77, -122.4, 20, (start, end), ['Education', 'Birdwatching'])
+        self.assertEqual(sorted(found['id']), sorted(expected['id']))
+        self.assertEqual(list(found['date']), list(expected['date']))
+        
+        limited = calendar.query_nearby(37.77, -122.4, 20, (start, end), ['Education', 'Birdwatching'], limit=3)
+        self.assertEqual(list(limited['id']), list(found['id'][:3]))
+    
+    def test_find_nearby_events(self):
+        """Test nearby events respect the radius and include their distance"""
+        location = {'lat': 37.7749, 'lon': -122.4194}
+        events = find_nearby_events(location, 20)
+        
+        self.assertGreater(len(events), 0)
+        self.assertLess(len(events), len(self.sample_data))
+        for event in events:
+            self.assertLessEqual(event['distance'], 20)
+        
+        # Without a location there is nothing to measure from
+        self.assertEqual(find_nearby_events(None, 20), get_upcoming_events())
+    
+    def test_get_upcoming_events_sorted_by_date(self):
+        """Test events come back in date order"""
+        events = get_upcoming_events()
+        dates = [event['date'] for event in events]
+        self.assertEqual(dates, sorted(dates))
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,14 +1,22 @@
 import unittest
 import sys
 import os
+import tempfile
+import numpy as np
+import pandas as pd
 
 # Add parent directory to path to import utils
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from utils.biophilia_calculator import calculate_biophilia_score, get_biophilia_recommendations
+from utils.trail_finder import (
+    haversine, haversine_many, find_nearby_trails, find_nearby_trails_batch, find_nearby_trails_page,
+    iter_nearby_trails, create_sample_trails_data,
+    TrailSpatialIndex, TrailCatalog, TrailCatalogManager, TrailFeatureIndex, convert_trail_catalog
+)
 
 class TestBiophiliaCalculator(unittest.TestCase):
-    
+
     def test_calculate_biophilia_score_empty(self):
         """Test score calculation with empty answers"""
         score = calculate_biophilia_score([])
@@ -59,5 +67,269 @@ class TestBiophiliaCalculator(unittest.TestCase):
         recommendations = get_biophilia_recommendations(50, location)
         self.assertIn('location_based', recommendations)
 
+class TestTrailFinder(unittest.TestCase):
+
+    def setUp(self):
+        """Set up test cases"""
+        self.sample_data = create_sample_trails_data()
+        self.location = {'lat': 37.7749, 'lon': -122.4194}
+        
+        # Random points covering the whole globe, including the poles
+        rng = np.random.default_rng(42)
+        self.lats = rng.uniform(-90, 90, 2000)
+        self.lons = rng.uniform(-180, 180, 2000)
+        self.index = TrailSpatialIndex(self.lats, self.lons, cell_size=5)
+    
+    def brute_force(self, lat, lon):
+        """Distances to every random point, in the order a full scan sorts them"""
+        distances = haversine_many(lat, lon, self.lats, self.lons)
+        order = np.argsort(distances, kind='stable')
+        return order, distances[order]
+    
+    def test_haversine_many_matches_scalar(self):
+        """Test the batch distance kernel agrees with the scalar haversine"""
+        expected = [haversine(-122.4, 37.7, lon, lat) for lat, lon in zip(self.lats, self.lons)]
+        np.testing.assert_allclose(haversine_many(37.7, -122.4, self.lats, self.lons), expected, rtol=1e-12)
+        
+        # Antipodal points must not overflow the arcsin domain
+        self.assertAlmostEqual(haversine_many(0, 0, [0], [180])[0], haversine(0, 0, 180, 0))
+    
+    def test_query_radius_matches_full_scan(self):
+        """Test radius queries return exactly the trails a full scan finds"""
+        for lat, lon, radius in [(37.7, -122.4, 500), (0, 179.9, 800), (89.5, 10, 300), (-60, -179, 2000)]:
+            order, distances = self.brute_force(lat, lon)
+            keep = distances <= radius
+            positions, found = self.index.query_radius(lat, lon, radius)
+            np.testing.assert_array_equal(positions, order[keep])
+            np.testing.assert_allclose(found, distances[keep])
+    
+    def test_query_nearest_matches_full_scan(self):
+        """Test k-nearest queries return the k closest trails in order"""
+        for lat, lon in [(37.7, -122.4), (-89, 0), (0, -180)]:
+            order, distances = self.brute_force(lat, lon)
+            positions, found = self.index.query_nearest(lat, lon, 7)
+            np.testing.assert_array_equal(positions, order[:7])
+            np.testing.assert_allclose(found, distances[:7])
+    
+    def test_top_k_matches_full_sort(self):
+        """Test top-k selection keeps the full sort's order, including ties"""
+        # Every point appears three times, so the cut-off falls inside ties
+        lats, lons = np.repeat(self.lats[:50], 3), np.repeat(self.lons[:50], 3)
+        index = TrailSpatialIndex(lats, lons, cell_size=5)
+        distances = haversine_many(10, 20, lats, lons)
+        order = np.argsort(distances, kind='stable')
+        
+        for k in (1, 4, 8, 149):
+            positions, _ = index.query_radius(10, 20, 20000, k=k)
+            np.testing.assert_array_equal(positions, order[:k])
+        
+        even = lambda positions: positions % 2 == 0
+        positions, _ = index.query_nearest(10, 20, 5, where=even)
+        np.testing.assert_array_equal(positions, order[order % 2 == 0][:5])
+    
+    def test_find_nearby_trails_sorted_by_distance(self):
+        """Test results are sorted nearest first and match haversine"""
+        trails = find_nearby_trails(self.location)
+        self.assertEqual(len(trails), len(self.sample_data))
+        
+        distances = [trail['distance'] for trail in trails]
+        self.assertEqual(distances, sorted(distances))
+        for trail in trails:
+            expected = haversine(self.location['lon'], self.location['lat'], trail['longitude'], trail['latitude'])
+            self.assertAlmostEqual(trail['distance'], expected)
+    
+    def test_find_nearby_trails_with_distance_and_limit(self):
+        """Test radius and limit queries agree with the unfiltered ordering"""
+        all_trails = find_nearby_trails(self.location)
+        
+        within = find_nearby_trails(self.location, distance=2)
+        self.assertEqual([t['id'] for t in within], [t['id'] for t in all_trails if t['distance'] <= 2])
+        
+        nearest = find_nearby_trails(self.location, limit=3)
+        self.assertEqual([t['id'] for t in nearest], [t['id'] for t in all_trails[:3]])
+    
+    def test_catalog_manager_reloads_only_on_change(self):
+        """Test the catalog is cached until its file changes"""
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'trails.csv')
+            self.sample_data.to_csv(path, index=False)
+            manager = TrailCatalogManager(path)
+            
+            first = manager.get()
+            self.assertIs(manager.get(), first)
+            self.assertEqual(manager.stats(), {'hits': 1, 'misses': 1, 'reloads': 0})
+            
+            # Rewriting the file with fewer rows changes its size
+            self.sample_data.head(4).to_csv(path, index=False)
+            self.assertEqual(len(manager.get()), 4)
+            self.assertEqual(manager.stats(), {'hits': 1, 'misses': 1, 'reloads': 1})
+            self.assertEqual(manager.generation, 2)
+            
+            manager.invalidate()
+            manager.get()
+            self.assertEqual(manager.stats()['reloads'], 2)
+            self.assertEqual(manager.generation, 3)
+            
+            # The generation handed out belongs to the catalog it comes with
+            generation, catalog = manager.get_versioned()
+            self.assertEqual(generation, 3)
+            self.assertIs(catalog, manager.get())
+            
+            # An explicit catalog is searched instead of the sample catalog
+            trails = find_nearby_trails(self.location, catalog=manager.get())
+            self.assertEqual(sorted(t['id'] for t in trails), [1, 2, 3, 4])
+    
+    def test_catalog_manager_missing_file(self):
+        """Test a missing catalog file raises unless sample data may be created"""
+        manager = TrailCatalogManager(os.path.join(tempfile.gettempdir(), 'missing_trails.csv'))
+        with self.assertRaises(FileNotFoundError):
+            manager.get()
+    
+    def test_trail_store_round_trip(self):
+        """Test a converted trail store serves the same rows and queries as the CSV"""
+        with tempfile.TemporaryDirectory() as tmp:
+            csv_path = os.path.join(tmp, 'trails.csv')
+            store_path = os.path.join(tmp, 'trails.store')
+            self.sample_data.to_csv(csv_path, index=False)
+            
+            store = convert_trail_catalog(csv_path, store_path)
+            self.assertEqual(len(store), len(self.sample_data))
+            self.assertTrue(store.to_dataframe().equals(self.sample_data))
+            
+            csv_catalog = TrailCatalogManager(csv_path).get()
+            store_catalog = TrailCatalogManager(store_path).get()
+            self.assertTrue(store_catalog.take([4, 0]).reset_index(drop=True).equals(
+                csv_catalog.take([4, 0]).reset_index(drop=True)))
+            
+            for catalog in (csv_catalog, store_catalog):
+                positions, _ = catalog.index.query_nearest(37.7749, -122.4194, 3)
+                self.assertEqual(list(catalog.take(positions)['id']), [1, 3, 4])
+            
+            np.testing.assert_array_equal(store_catalog.features.match(['Forest', 'Fishing'], 'any'),
+                                          csv_catalog.features.match(['Forest', 'Fishing'], 'any'))
+    
+    def test_trail_store_rewrite_keeps_store_readable(self):
+        """Test readers always open a complete store while it is rewritten"""
+        import threading
+        from utils.trail_store import TrailStore, write_trail_store
+        with tempfile.TemporaryDirectory() as tmp:
+            store_path = os.path.join(tmp, 'trails.store')
+            write_trail_store(self.sample_data, store_path)
+            errors = []
+            done = threading.Event()
+            
+            def read():
+                while not done.is_set():
+                    try:
+                        self.assertEqual(len(TrailStore(store_path).to_dataframe()), len(self.sample_data))
+                    except Exception as e:
+                        errors.append(e)
+            
+            reader = threading.Thread(target=read)
+            reader.start()
+            for _ in range(20):
+                write_trail_store(self.sample_data, store_path)
+            done.set()
+            reader.join()
+            
+            self.assertEqual(errors, [])
+            self.assertEqual(len(os.listdir(store_path)), 3)
+            self.assertTrue(TrailStore(store_path).to_dataframe().equals(self.sample_data))
+    
+    def test_find_nearby_trails_feature_filters(self):
+        """Test features match whole names, with AND and OR semantics"""
+        trails = find_nearby_trails(self.location, features=['Forest', 'Wildlife'])
+        self.assertEqual(sorted(t['id'] for t in trails), [1, 6, 7, 9])
+        
+        trails = find_nearby_trails(self.location, features=['Lake', 'River'], feature_match='any')
+        self.assertEqual(sorted(t['id'] for t in trails), [3, 9])
+        
+        # 'View' is only part of 'Mountain View', so nothing matches
+        self.assertEqual(find_nearby_trails(self.location, features=['View']), [])
+    
+    def test_find_nearby_trails_batch_matches_single_queries(self):
+        """Test the batch API gives every user the same trails as a single query"""
+        rng = np.random.default_rng(7)
+        locations = [
+            {'lat': lat, 'lon': lon}
+            for lat, lon in zip(rng.uniform(37.6, 37.9, 25), rng.uniform(-122.6, -122.3, 25))
+        ]
+        locations.append(None)
+        
+        for filters in [{}, {'distance': 3}, {'limit': 2}, {'distance': 5, 'difficulty': ['Easy'], 'limit': 3},
+                        {'features': ['Forest', 'Lake'], 'feature_match': 'any'}]:
+            # A tiny block bound forces many small distance matrices
+            batch = find_nearby_trails_batch(locations, max_block_cells=20, **filters)
+            self.assertEqual(len(batch), len(locations))
+            for location, trails in zip(locations, batch):
+                self.assertEqual(trails, find_nearby_trails(location, **filters))
+        
+        # An explicit catalog is searched instead of the cached one
+        catalog = TrailCatalog(self.sample_data.iloc[:4])
+        batch = find_nearby_trails_batch(locations, catalog=catalog)
+        for location, trails in zip(locations, batch):
+            self.assertEqual(trails, find_nearby_trails(location, catalog=catalog))
+    
+    def test_spatial_index_groups_points_by_cell(self):
+        """Test points are grouped by the grid cell they fall in"""
+        index = TrailSpatialIndex([37.1], [-122.1], cell_size=0.5)
+        lats = np.array([37.1, 10.0, 37.4, 10.2])
+        lons = np.array([-122.1, 20.0, -122.2, 20.3])
+        groups = sorted(group.tolist() for group in index.group_by_cell(lats, lons))
+        self.assertEqual(groups, [[0, 2], [1, 3]])
+        self.assertEqual(index.candidates(37.1, -122.1, 1).tolist(), [0])
+    
+    def test_paginated_trails_match_full_results(self):
+        """Test pages and the lazy iterator walk the same trails in the same order"""
+        for location, filters in [(self.location, {}), (self.location, {'distance': 3, 'features': ['Forest']}),
+                                  ({'lat': 0, 'lon': 0}, {'difficulty': ['Moderate']}), (None, {})]:
+            expected = find_nearby_trails(location, **filters)
+            self.assertEqual(list(iter_nearby_trails(location, batch_size=3, **filters)), expected)
+            
+            trails, cursor = [], None
+            while True:
+                page = find_nearby_trails_page(location, page_size=3, cursor=cursor, **filters)
+                self.assertLessEqual(len(page['trails']), 3)
+                trails.extend(page['trails'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            self.assertEqual(trails, expected)
+        
+        with self.assertRaises(ValueError):
+            find_nearby_trails_page(self.location, cursor='not-a-cursor')
+    
+    def test_paginated_trails_with_distant_ties(self):
+        """Test trails tied with a cursor past the first search ring are not repeated"""
+        # Five trails share a point about 50 miles away, the rest are farther
+        trails_df = pd.concat([self.sample_data] * 2, ignore_index=True)
+        trails_df['id'] = range(1, len(trails_df) + 1)
+        trails_df['latitude'] = [38.5] * 5 + [38.6 + 0.1 * i for i in range(len(trails_df) - 5)]
+        trails_df['longitude'] = -122.4194
+        catalog = TrailCatalog(trails_df)
+        
+        expected = [t['id'] for t in find_nearby_trails(self.location, catalog=catalog)]
+        self.assertEqual(expected, list(range(1, len(trails_df) + 1)))
+        
+        ids, cursor = [], None
+        while True:
+            page = find_nearby_trails_page(self.location, page_size=2, cursor=cursor, catalog=catalog)
+            ids.extend(t['id'] for t in page['trails'])
+            cursor = page['next_cursor']
+            if cursor is None:
+                break
+        self.assertEqual(ids, expected)
+    
+    def test_feature_index_overflow(self):
+        """Test features past the 64 mask bits are still matched"""
+        values = [','.join(f"Feature {i}" for i in range(row, row + 70)) for row in range(3)]
+        index = TrailFeatureIndex.from_values(values, vocabulary=[])
+        self.assertTrue(index.overflow)
+        
+        np.testing.assert_array_equal(index.match(['Feature 0', 'Feature 71']), [False, False, False])
+        np.testing.assert_array_equal(index.match(['Feature 2', 'Feature 71']), [False, False, True])
+        np.testing.assert_array_equal(index.match(['Feature 0', 'Feature 71'], 'any'), [True, False, True])
+        np.testing.assert_array_equal(index.match(['feature 70'], positions=[2, 0]), [True, False])
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,293 @@
+import threading
+from collections import OrderedDict
+from datetime import date, timedelta
+from types import MappingProxyType
+import numpy as np
+from utils.score_distribution import ScoreDistribution
+from utils.trail_finder import find_nearby_trails, get_trail_catalog
+from utils.event_manager import find_nearby_events, get_event_calendar
+
+def calculate_biophilia_score(answers):
+    """
+    Calculate a biophilia score based on quiz answers
+    
+    Parameters:
+    - answers: list of integer answers from 1-10
+    
+    Returns:
+    - integer score from 0-100
+    """
+    # Simple calculation - sum of answers normalized to 0-100
+    if not answers:
+        return 0
+    
+    # Sum all answers
+    total = sum(answers)
+    
+    # Maximum possible score (10 points per question)
+    max_score = len(answers) * 10
+    
+    # Calculate percentage and round to nearest integer
+    score = round((total / max_score) * 100)
+    
+    return score
+
+def calculate_biophilia_scores(answers, weights=None):
+    """
+    Calculate the biophilia scores of many users at once
+    
+    Parameters:
+    - answers: (users x questions) array of answers from 1-10, with NaN
+      for questions a user did not answer
+    - weights: optional per-question weights; unanswered questions do not
+      count towards a user's maximum score
+    
+    Returns:
+    - integer array of scores from 0-100, one per user; without weights
+      each equals calculate_biophilia_score of the user's answered questions
+    """
+    answers = np.asarray(answers, dtype=np.float64)
+    if answers.ndim != 2:
+        raise ValueError('Answers must be a (users x questions) matrix')
+    
+    answered = ~np.isnan(answers)
+    values = np.where(answered, answers, 0.0)
+    
+    if weights is None:
+        # Same operations as the scalar function, so results are identical
+        total = values.sum(axis=1)
+        max_score = answered.sum(axis=1) * 10
+    else:
+        weights = np.asarray(weights, dtype=np.float64)
+        if weights.shape != (answers.shape[1],):
+            raise ValueError('Weights need one value per question')
+        total = values @ weights
+        max_score = (answered @ weights) * 10
+    
+    # Users without answers score 0, as in the scalar function
+    scores = np.zeros(len(answers), dtype=np.int64)
+    has_answers = max_score > 0
+    scores[has_answers] = np.round(total[has_answers] / max_score[has_answers] * 100)
+    return scores
+
+def summarize_biophilia_scores(scores, cohorts=None, bins=10, percentiles=(25, 50, 75)):
+    """
+    Summarize biophilia scores per cohort
+    
+    Parameters:
+    - scores: array of scores from 0-100
+    - cohorts: optional cohort label per score (one cohort 'all' if omitted)
+    - bins: number of equal-width histogram bins over 0-100
+    - percentiles: percentiles to report, interpolated like np.percentile
+    
+    Returns:
+    - dict mapping each cohort to its 'count', 'mean', 'histogram' (counts
+      per bin), 'bin_edges' and 'percentiles' ({percentile: value})
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if cohorts is None:
+        cohorts = np.full(len(scores), 'all', dtype=object)
+    labels, groups = np.unique(np.asarray(cohorts), return_inverse=True)
+    groups = groups.reshape(-1)
+    
+    counts = np.bincount(groups, minlength=len(labels))
+    means = np.bincount(groups, weights=scores, minlength=len(labels)) / np.maximum(counts, 1)
+    
+    # Histograms of all cohorts from one bincount over (cohort, bin) pairs
+    edges = np.linspace(0, 100, bins + 1)
+    score_bins = np.clip((scores * bins // 100).astype(np.int64), 0, bins - 1)
+    histograms = np.bincount(groups * bins + score_bins, minlength=len(labels) * bins).reshape(len(labels), bins)
+    
+    # Percentiles by linear interpolation within each cohort's sorted scores
+    order = np.lexsort((scores, groups))
+    sorted_scores = scores[order]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    fractions = np.asarray(percentiles, dtype=np.float64) / 100
+    positions = fractions[None, :] * (counts[:, None] - 1)
+    lower = np.floor(positions).astype(np.int64)
+    upper = np.minimum(lower + 1, counts[:, None] - 1)
+    low_values = sorted_scores[starts[:, None] + lower]
+    high_values = sorted_scores[starts[:, None] + upper]
+    values = low_values + (high_values - low_values) * (positions - lower)
+    
+    summary = {}
+    for i, label in enumerate(labels):
+        # Plain Python labels rather than NumPy scalars
+        label = label.item() if isinstance(label, np.generic) else label
+        summary[label] = {
+            'count': int(counts[i]),
+            'mean': float(means[i]),
+            'histogram': histograms[i].tolist(),
+            'bin_edges': edges.tolist(),
+            'percentiles': {percentile: float(value) for percentile, value in zip(percentiles, values[i])}
+        }
+    return summary
+
+def _frozen(recommendations):
+    """Read-only mapping of tuples, shared by every caller"""
+    return MappingProxyType({key: tuple(values) for key, values in recommendations.items()})
+
+# Recommendations per score tier, built once: (exclusive upper score, table)
+RECOMMENDATION_TIERS = (
+    # Low connection to nature (0-40)
+    (40, _frozen({
+        'activities': [
+            'Visit a local park for 15 minutes daily',
+            'Start a small indoor plant collection',
+            'Watch nature documentaries',
+            'Take a guided nature walk'
+        ],
+        'resources': [
+            'Book: "The Nature Fix" by Florence Williams',
+            'App: "iNaturalist" for identifying plants and animals',
+            'Website: AllTrails.com for finding nearby nature spots'
+        ],
+        'daily_practices': [
+            'Take breaks to look at the sky and clouds',
+            'Listen to nature sounds while working',
+            'Eat lunch outdoors when possible',
+            'Notice wildlife in your neighborhood'
+        ]
+    })),
+    
+    # Moderate connection to nature (40-70)
+    (70, _frozen({
+        'activities': [
+            'Try forest bathing (mindful nature immersion)',
+            'Start a small garden (even container gardening counts)',
+            'Join a local conservation volunteer group',
+            'Take up nature photography or sketching'
+        ],
+        'resources': [
+            'Book: "Braiding Sweetgrass" by Robin Wall Kimmerer',
+            'App: "Seek" by iNaturalist for nature challenges',
+            'Podcast: "For the Wild" on ecological restoration'
+        ],
+        'daily_practices': [
+            'Establish a "sit spot" for regular nature observation',
+            'Incorporate natural materials in your home',
+            'Practice identifying bird calls and songs',
+            'Track moon phases and seasonal changes'
+        ]
+    })),
+    
+    # Strong connection to nature (70-100)
+    (None, _frozen({
+        'activities': [
+            'Participate in citizen science projects',
+            'Lead nature walks for others',
+            'Create a certified wildlife habitat in your yard',
+            'Try solo wilderness experiences'
+        ],
+        'resources': [
+            'Book: "The Hidden Life of Trees" by Peter Wohlleben',
+            'Organization: Join your local native plant society',
+            'Course: Wilderness first aid certification'
+        ],
+        'daily_practices': [
+            'Mentor others in nature connection',
+            'Keep a detailed nature journal',
+            'Practice traditional skills (foraging, tracking)',
+            'Create rituals celebrating seasonal changes'
+        ]
+    }))
+)
+
+# Location-based suggestions per tier: trail difficulties and event types
+# that fit it (None for no restriction)
+TIER_TRAIL_DIFFICULTY = (('Easy',), ('Easy', 'Moderate'), None)
+TIER_EVENT_TYPES = (
+    ('Guided Hike', 'Birdwatching', 'Education', 'Community', 'Family Friendly'),
+    ('Guided Hike', 'Birdwatching', 'Education', 'Conservation', 'Volunteer', 'Workshop'),
+    None
+)
+
+LOCATION_RADIUS_MILES = 25
+LOCATION_TRAILS = 3
+LOCATION_EVENTS = 2
+LOCATION_EVENT_DAYS = 30
+
+# Locations in the same cell of this grid (about 0.7 miles) share results
+LOCATION_GRID_DEGREES = 0.01
+LOCATION_CACHE_SIZE = 4096
+
+_location_cache = OrderedDict()
+_location_cache_sources = None
+_location_cache_lock = threading.Lock()
+
+def score_tier(score):
+    """Index into RECOMMENDATION_TIERS of the tier a score falls in"""
+    for tier, (upper, _) in enumerate(RECOMMENDATION_TIERS):
+        if upper is None or score < upper:
+            return tier
+
+def _location_recommendations(lat, lon, tier):
+    """Build the recommendations of a tier for one location"""
+    location = {'lat': lat, 'lon': lon}
+    trails = find_nearby_trails(
+        location, distance=LOCATION_RADIUS_MILES, difficulty=TIER_TRAIL_DIFFICULTY[tier], limit=LOCATION_TRAILS
+    )
+    
+    today = date.today()
+    date_range = (today.isoformat(), (today + timedelta(days=LOCATION_EVENT_DAYS)).isoformat())
+    events = find_nearby_events(
+        location, LOCATION_RADIUS_MILES, date_range=date_range, types=TIER_EVENT_TYPES[tier], limit=LOCATION_EVENTS
+    )
+    
+    suggestions = [
+        f"Walk {trail['name']} ({trail['difficulty']}, {trail['length']:.1f} miles), "
+        f"{trail['distance']:.1f} miles away"
+        for trail in trails
+    ]
+    suggestions += [
+        f"Join {event['name']} ({event['type']}) on {event['date']} at {event['location']}"
+        for event in events
+    ]
+    if not suggestions:
+        suggestions = [f"Look for parks and green spaces within {LOCATION_RADIUS_MILES} miles of you"]
+    
+    return _frozen(dict(RECOMMENDATION_TIERS[tier][1], location_based=suggestions))
+
+def get_biophilia_recommendations(score, user_location=None):
+    """
+    Get personalized recommendations based on biophilia score
+    
+    Parameters:
+    - score: integer biophilia score from 0-100
+    - user_location: optional location for localized recommendations
+    
+    Returns:
+    - read-only mapping of recommendation tuples; with a location it also
+      has 'location_based' suggestions of nearby trails and events
+    """
+    tier = score_tier(score)
+    if not (user_location and 'lat' in user_location and 'lon' in user_location):
+        return RECOMMENDATION_TIERS[tier][1]
+    
+    global _location_cache_sources
+    
+    # Results are reused for the same grid cell, tier and day while the
+    # trail and event catalogs are unchanged
+    sources = (get_trail_catalog(), get_event_calendar())
+    row = round(user_location['lat'] / LOCATION_GRID_DEGREES)
+    col = round(user_location['lon'] / LOCATION_GRID_DEGREES)
+    key = (row, col, tier, date.today())
+    
+    with _location_cache_lock:
+        if _location_cache_sources is None or any(a is not b for a, b in zip(sources, _location_cache_sources)):
+            _location_cache.clear()
+            _location_cache_sources = sources
+        
+        recommendations = _location_cache.get(key)
+        if recommendations is not None:
+            _location_cache.move_to_end(key)
+            return recommendations
+    
+    # Built outside the lock; the cell centre stands for every location in it
+    recommendations = _location_recommendations(row * LOCATION_GRID_DEGREES, col * LOCATION_GRID_DEGREES, tier)
+    
+    with _location_cache_lock:
+        _location_cache[key] = recommendations
+        while len(_location_cache) > LOCATION_CACHE_SIZE:
+            _location_cache.popitem(last=False)
+    return recommendations
@@ -0,0 +1,1779 @@
+import asyncio
+import atexit
+import copy
+import functools
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import weakref
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from config import USER_DATA_EXPIRY_DAYS
+from utils.journal_log import JournalLog, shard_folder
+from utils.score_distribution import ScoreDistribution
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows; file locks are then unsupported
+    fcntl = None
+
+# User field whose items are stored in the journal log
+JOURNAL_FIELD = 'nature_journal'
+
+def new_user_data(user_id):
+    """Return the document of a user that has no stored data yet"""
+    return {
+        'user_id': user_id,
+        'created_at': datetime.now().isoformat(),
+        'biophilia_score': None,
+        'favorite_trails': [],
+        'registered_events': [],
+        'nature_journal': []
+    }
+
+# Array fields whose items carry an id and are kept in an IdCollection
+ID_KEYED_FIELDS = ('favorite_trails', 'registered_events')
+
+_MISSING = object()
+
+class IdCollection:
+    """
+    Ordered collection of array items keyed by their id
+    
+    Upserting, removing and finding an item by id are O(1), and iterating
+    yields the items in the order the list form has: an upserted item
+    moves to the end, as add_array_item does for plain lists. Items
+    without an id are kept in order under private keys. `in` checks ids,
+    not items.
+    """
+    def __init__(self, items=()):
+        self._items = OrderedDict()
+        self._next_key = 0
+        for item in items:
+            self.upsert(item)
+    
+    def _key(self, item):
+        if isinstance(item, dict) and 'id' in item:
+            return ('id', item['id'])
+        self._next_key += 1
+        return ('item', self._next_key)
+    
+    def upsert(self, item):
+        """Add an item at the end, replacing any item with the same id"""
+        key = self._key(item)
+        self._items.pop(key, None)
+        self._items[key] = item
+    
+    append = upsert
+    
+    def remove(self, item_id):
+        """
+        Remove the item with the given id
+        
+        Returns:
+        - True if an item was removed
+        """
+        return self._items.pop(('id', item_id), _MISSING) is not _MISSING
+    
+    def get(self, item_id, default=None):
+        """Return the item with the given id"""
+        return self._items.get(('id', item_id), default)
+    
+    def __contains__(self, item_id):
+        return ('id', item_id) in self._items
+    
+    def __iter__(self):
+        return iter(self._items.values())
+    
+    def __len__(self):
+        return len(self._items)
+    
+    def __getitem__(self, index):
+        return self.to_list()[index]
+    
+    def __eq__(self, other):
+        if isinstance(other, (IdCollection, list)):
+            return self.to_list() == list(other)
+        return NotImplemented
+    
+    def __repr__(self):
+        return f"IdCollection({self.to_list()!r})"
+    
+    def to_list(self):
+        """Return the items as the list stored on disk"""
+        return list(self._items.values())
+
+def plain_user_data(data):
+    """Return a shallow copy of a user document with every IdCollection turned back into a list"""
+    return {
+        field: value.to_list() if isinstance(value, IdCollection) else value
+        for field, value in data.items()
+    }
+
+def add_array_item(data, array_field, item):
+    """Append an item to an array field of a user document, replacing any item with the same id"""
+    if array_field not in data:
+        data[array_field] = []
+    
+    if array_field in ID_KEYED_FIELDS:
+        # Index the list once; later changes to this document are O(1)
+        if not isinstance(data[array_field], IdCollection):
+            data[array_field] = IdCollection(data[array_field])
+        data[array_field].upsert(item)
+        return
+    
+    # Check if item already exists in array (by id if available)
+    if isinstance(item, dict) and 'id' in item:
+        # Remove existing item with same id if found
+        data[array_field] = [
+            existing_item for existing_item in data[array_field] 
+            if not (isinstance(existing_item, dict) and 
+                    'id' in existing_item and 
+                    existing_item['id'] == item['id'])
+        ]
+    
+    # Add the new item
+    data[array_field].append(item)
+
+def remove_array_item(data, array_field, item_id):
+    """
+    Remove the item with the given id from an array field of a user document
+    
+    Returns:
+    - True if the document has the array field (and so may have changed)
+    """
+    if array_field not in data:
+        return False
+    
+    if array_field in ID_KEYED_FIELDS:
+        if not isinstance(data[array_field], IdCollection):
+            data[array_field] = IdCollection(data[array_field])
+        data[array_field].remove(item_id)
+        return True
+    
+    # Filter out the item with matching id
+    data[array_field] = [
+        item for item in data[array_field] 
+        if not (isinstance(item, dict) and 
+                'id' in item and 
+                item['id'] == item_id)
+    ]
+    return True
+
+def apply_op(data, op):
+    """
+    Apply one operation to a user document
+    
+    Parameters:
+    - data: user document to change in place
+    - op: ('set', field, value), ('add', array_field, item) or
+      ('remove', array_field, item_id)
+    
+    Returns:
+    - True if the operation may have changed the document
+    """
+    action, field, value = op
+    if action == 'set':
+        data[field] = value
+        return True
+    if action == 'add':
+        add_array_item(data, field, value)
+        return True
+    if action == 'remove':
+        return remove_array_item(data, field, value)
+    raise ValueError(f"Unknown user data operation: {action}")
+
+class ExpiryIndex:
+    """
+    Day buckets of user ids, used to find users whose data may have expired
+    
+    Each write of a user's data appends the user id to the file of that
+    day, `YYYY-MM-DD.ids` (once per user and day in each process). A user
+    is listed in every bucket of a day they were active, so the sweeper
+    checks file modification times before deleting anyone.
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        os.makedirs(folder, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        self._day = None
+        self._recorded = set()
+    
+    def bucket_path(self, day):
+        return os.path.join(self.folder, f"{day}.ids")
+    
+    def record(self, user_id, when=None):
+        """Note that a user's data was written at `when` (default now)"""
+        day = (when or datetime.now()).date().isoformat()
+        user_id = str(user_id)
+        
+        with self._lock:
+            if day != self._day:
+                self._day = day
+                self._recorded = set()
+            if user_id in self._recorded:
+                return
+            self._recorded.add(user_id)
+            
+            with open(self.bucket_path(day), 'a') as f:
+                f.write(f"{user_id}\n")
+    
+    def record_many(self, entries):
+        """Record (user_id, datetime) pairs, one append per day"""
+        by_day = {}
+        for user_id, when in entries:
+            by_day.setdefault(when.date().isoformat(), []).append(str(user_id))
+        
+        with self._lock:
+            for day, user_ids in by_day.items():
+                with open(self.bucket_path(day), 'a') as f:
+                    f.write(''.join(f"{user_id}\n" for user_id in user_ids))
+    
+    def days_before(self, day):
+        """Bucket days strictly before `day` (a date), oldest first"""
+        limit = day.isoformat()
+        return sorted(
+            name[:-len('.ids')] for name in os.listdir(self.folder)
+            if name.endswith('.ids') and name[:-len('.ids')] < limit
+        )
+    
+    def remove_bucket(self, day):
+        try:
+            os.remove(self.bucket_path(day))
+        except FileNotFoundError:
+            pass
+
+class SimpleDB:
+    """
+    A simple JSON-based database for storing user data
+    For a real app, you would use a proper database like SQLite, PostgreSQL, etc.
+    
+    Nature journal entries are kept in append-only journal logs next to the
+    user files (see JournalLog), so adding an entry does not rewrite the
+    user's history. Loaded documents still contain the full journal.
+    
+    Every read-modify-write of a user runs under that user's lock, taken
+    from a fixed set of `lock_stripes` thread locks. With `file_locks`,
+    the stripe's advisory lock file (locks/stripe_{n}.lock) is held as
+    well, so several processes using the same `lock_stripes` can share one
+    data folder.
+    
+    Looking up the users of a trail or event (get_item_users,
+    count_item_users, capacity-limited register_for_event) needs the item
+    index, which every write then keeps up to date. It is off by default:
+    pass `item_index=True` for item_index.db in the data folder, or a
+    UserItemIndex to use.
+    """
+    def __init__(self, data_folder='data', lock_stripes=64, file_locks=False, item_index=False):
+        self.data_folder = data_folder
+        # Create data folder if it doesn't exist
+        os.makedirs(data_folder, exist_ok=True)
+        self.journal = JournalLog(os.path.join(data_folder, 'journals'))
+        self.expiry_index = ExpiryIndex(os.path.join(data_folder, 'expiry'))
+        if item_index is True:
+            item_index = UserItemIndex(os.path.join(data_folder, 'item_index.db'))
+        self.item_index = item_index or None
+        self._scores_path = os.path.join(data_folder, 'score_distribution.json')
+        self._scores_lock = threading.Lock()
+        
+        if file_locks and fcntl is None:
+            raise ValueError('File locks need fcntl, which is not available on this platform')
+        self.file_locks = file_locks
+        if file_locks:
+            os.makedirs(os.path.join(data_folder, 'locks'), exist_ok=True)
+        
+        self._stripes = [threading.RLock() for _ in range(lock_stripes)]
+        self._held = threading.local()
+    
+    @contextmanager
+    def _user_lock(self, user_id):
+        """Hold a user's thread lock (and file lock) for the duration of a block"""
+        held = getattr(self._held, 'users', None)
+        if held is None:
+            held = self._held.users = {}
+        user_id = str(user_id)
+        
+        # Re-entered from another method of this thread; already locked
+        if user_id in held:
+            held[user_id] += 1
+            try:
+                yield
+            finally:
+                held[user_id] -= 1
+            return
+        
+        # A stable hash, so every process maps a user to the same stripe
+        number = zlib.crc32(user_id.encode('utf-8')) % len(self._stripes)
+        stripes = getattr(self._held, 'stripes', None)
+        if stripes is None:
+            stripes = self._held.stripes = {}
+        
+        with self._stripes[number]:
+            lock_file = None
+            # Another user of this stripe may already hold its file lock in this thread
+            if self.file_locks and number not in stripes:
+                lock_file = open(os.path.join(self.data_folder, 'locks', f"stripe_{number}.lock"), 'a')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            
+            held[user_id] = 1
+            stripes[number] = stripes.get(number, 0) + 1
+            try:
+                yield
+            finally:
+                del held[user_id]
+                stripes[number] -= 1
+                if not stripes[number]:
+                    del stripes[number]
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+    
+    def _shard_path(self, user_id):
+        """Path of a user file in the sharded layout, users/ab/cd/user_{id}.json"""
+        return os.path.join(shard_folder(os.path.join(self.data_folder, 'users'), user_id), f"user_{user_id}.json")
+    
+    def _legacy_path(self, user_id):
+        """Path of a user file in the old flat layout"""
+        return os.path.join(self.data_folder, f"user_{user_id}.json")
+    
+    def user_path(self, user_id):
+        """Path of a user's file: the flat one if it was not moved yet, else the sharded one"""
+        shard_path = self._shard_path(user_id)
+        legacy_path = self._legacy_path(user_id)
+        if not os.path.exists(shard_path) and os.path.exists(legacy_path):
+            return legacy_path
+        return shard_path
+    
+    def iter_user_files(self):
+        """
+        Yield (user_id, os.DirEntry) for every user file, flat ones first
+        
+        Directories are scanned lazily, so callers can stop at any point.
+        """
+        folders = [self.data_folder]
+        shards = os.path.join(self.data_folder, 'users')
+        if os.path.isdir(shards):
+            for first in sorted(os.listdir(shards)):
+                folders.append(os.path.join(shards, first))
+        
+        for folder in folders:
+            for entry in os.scandir(folder):
+                if entry.is_dir() and folder != self.data_folder:
+                    # Second-level shard directory
+                    for user_entry in os.scandir(entry.path):
+                        if user_entry.name.startswith('user_') and user_entry.name.endswith('.json'):
+                            yield user_entry.name[len('user_'):-len('.json')], user_entry
+                elif entry.name.startswith('user_') and entry.name.endswith('.json'):
+                    yield entry.name[len('user_'):-len('.json')], entry
+    
+    def _read_document(self, user_id):
+        """Read a user file as stored, or None if the user has no file"""
+        # The flat file is tried second; the sharded one again in case it was moved meanwhile
+        for file_path in (self._shard_path(user_id), self._legacy_path(user_id), self._shard_path(user_id)):
+            try:
+                with open(file_path, 'r') as f:
+                    return json.load(f)
+            except FileNotFoundError:
+                continue
+        return None
+    
+    def _write_document(self, user_id, data, sync_items=True, previous_score=_MISSING):
+        """
+        Write a user file as given, adding the update timestamp
+        
+        Unless `sync_items` is False (the caller updates it itself, or no
+        id-keyed array changed), the item index, if any, is brought in line
+        with the document's id-keyed arrays.
+        `previous_score` is the stored biophilia_score being replaced; when
+        the caller does not pass it, it is read from the current file.
+        """
+        if previous_score is _MISSING:
+            stored = self._read_document(user_id) or {}
+            previous_score = stored.get('biophilia_score')
+        
+        file_path = self._shard_path(user_id)
+        folder = os.path.dirname(file_path)
+        os.makedirs(folder, exist_ok=True)
+        
+        # Add timestamp
+        data['last_updated'] = datetime.now().isoformat()
+        
+        # Write a temporary file and rename it, so readers never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=f"user_{user_id}.", suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(plain_user_data(data), f, indent=2)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        
+        # The sharded file now holds the user; drop any flat one
+        try:
+            os.remove(self._legacy_path(user_id))
+        except FileNotFoundError:
+            pass
+        self.expiry_index.record(user_id)
+        
+        if sync_items and self.item_index is not None:
+            self._sync_items(user_id, data)
+        self._update_scores(previous_score, data.get('biophilia_score'))
+    
+    def _update_scores(self, previous_score, score):
+        """Move a user from one score bucket of the stored distribution to another"""
+        if previous_score == score:
+            return
+        
+        with self._scores_lock:
+            lock_file = None
+            if self.file_locks:
+                lock_file = open(os.path.join(self.data_folder, 'locks', 'score_distribution.lock'), 'a')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                distribution = self.get_score_distribution()
+                if previous_score is not None:
+                    distribution.remove(previous_score)
+                if score is not None:
+                    distribution.add(score)
+                self._save_score_distribution(distribution)
+            finally:
+                if lock_file is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+                    lock_file.close()
+    
+    def _save_score_distribution(self, distribution):
+        fd, tmp_path = tempfile.mkstemp(dir=self.data_folder, prefix='score_distribution.', suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(distribution.to_dict(), f)
+        os.replace(tmp_path, self._scores_path)
+    
+    def get_score_distribution(self):
+        """Return the distribution of the current biophilia scores of all users"""
+        try:
+            with open(self._scores_path, 'r') as f:
+                return ScoreDistribution.from_dict(json.load(f))
+        except FileNotFoundError:
+            return ScoreDistribution()
+    
+    def score_percentile_rank(self, score):
+        """
+        Rank a biophilia score among the current scores of all users
+        
+        Returns:
+        - percentage of users scoring lower (ties count half), or None
+          while no user has a score
+        """
+        return self.get_score_distribution().percentile_rank(score)
+    
+    def rebuild_score_distribution(self):
+        """
+        Recount the score distribution from every stored user
+        
+        Needed once for user files written before the distribution existed.
+        
+        Returns:
+        - the new ScoreDistribution
+        """
+        distribution = ScoreDistribution()
+        for user_id, _ in self.iter_user_files():
+            data = self._read_document(user_id)
+            if data and data.get('biophilia_score') is not None:
+                distribution.add(data['biophilia_score'])
+        
+        with self._scores_lock:
+            self._save_score_distribution(distribution)
+        return distribution
+    
+    def _require_item_index(self):
+        if self.item_index is None:
+            raise ValueError('The item index is disabled; create the SimpleDB with item_index=True')
+        return self.item_index
+    
+    @staticmethod
+    def _item_ids(data):
+        """Ids in each id-keyed array of a document"""
+        return {
+            field: [item['id'] for item in data.get(field, []) if isinstance(item, dict) and 'id' in item]
+            for field in ID_KEYED_FIELDS
+        }
+    
+    def _sync_items(self, user_id, data):
+        self.item_index.sync_user(user_id, self._item_ids(data))
+    
+    def save_user_data(self, user_id, data, previous_score=_MISSING):
+        """
+        Save user data to a JSON file, moving journal entries to the journal log
+        
+        Parameters:
+        - previous_score: the user's stored biophilia_score, if the caller
+          knows it; otherwise the file is read to update the score distribution
+        """
+        with self._user_lock(user_id):
+            document = dict(data)
+            entries = document.pop(JOURNAL_FIELD, None)
+            if entries is not None:
+                # The whole journal is given, so entries left in an old user
+                # file are replaced along with the file
+                self._sync_journal(user_id, entries)
+            
+            self._write_document(user_id, document, previous_score=previous_score)
+            data['last_updated'] = document['last_updated']
+    
+    def load_user_data(self, user_id):
+        """Load user data from a JSON file"""
+        with self._user_lock(user_id):
+            data = self._read_document(user_id)
+            if data is None:
+                # Return empty data if user file doesn't exist
+                data = new_user_data(user_id)
+            
+            # Entries not yet moved to the journal log come first
+            data[JOURNAL_FIELD] = data.get(JOURNAL_FIELD, []) + self.journal.entries(user_id)
+            return data
+    
+    def update_user_field(self, user_id, field, value):
+        """Update a specific field in user data"""
+        with self._user_lock(user_id):
+            if field == JOURNAL_FIELD:
+                self._migrate_journal(user_id)
+                self._sync_journal(user_id, value)
+                return
+            
+            data = self._read_document(user_id) or new_user_data(user_id)
+            previous_score = data.get('biophilia_score')
+            data[field] = value
+            self._write_document(
+                user_id, data, sync_items=field in ID_KEYED_FIELDS, previous_score=previous_score
+            )
+    
+    def add_to_user_array(self, user_id, array_field, item):
+        """Add an item to an array field in user data"""
+        with self._user_lock(user_id):
+            if array_field == JOURNAL_FIELD:
+                self.add_journal_entry(user_id, item)
+                return
+            
+            data = self._read_document(user_id) or new_user_data(user_id)
+            add_array_item(data, array_field, item)
+            
+            # Save updated data
+            self._write_document(user_id, data, sync_items=False, previous_score=data.get('biophilia_score'))
+            if self.item_index is not None and array_field in ID_KEYED_FIELDS and isinstance(item, dict) and 'id' in item:
+                self.item_index.add(array_field, item['id'], user_id)
+    
+    def remove_from_user_array(self, user_id, array_field, item_id):
+        """Remove an item from an array field in user data by its id"""
+        with self._user_lock(user_id):
+            if array_field == JOURNAL_FIELD:
+                self._migrate_journal(user_id)
+                self._remove_journal_entries(user_id, item_id)
+                return
+            
+            data = self._read_document(user_id) or new_user_data(user_id)
+            
+            if remove_array_item(data, array_field, item_id):
+                # Save updated data
+                self._write_document(user_id, data, sync_items=False, previous_score=data.get('biophilia_score'))
+                if self.item_index is not None and array_field in ID_KEYED_FIELDS:
+                    self.item_index.remove(array_field, item_id, user_id)
+    
+    def _migrate_journal(self, user_id):
+        """Move journal entries stored in a user file into the journal log"""
+        if self.journal.exists(user_id):
+            return
+        
+        data = self._read_document(user_id)
+        if data and data.get(JOURNAL_FIELD):
+            self.journal.extend(user_id, data.pop(JOURNAL_FIELD))
+            self._write_document(user_id, data, sync_items=False, previous_score=data.get('biophilia_score'))
+    
+    def _sync_journal(self, user_id, entries):
+        """
+        Make the journal log hold exactly the given entries
+        
+        A list that starts with every stored entry unchanged is taken to be
+        the loaded journal plus new entries, which are appended. Anything
+        else, such as an edited or removed entry, replaces the whole log.
+        """
+        stored = self.journal.entries(user_id)
+        if entries[:len(stored)] == stored:
+            if len(entries) > len(stored):
+                self.journal.extend(user_id, entries[len(stored):])
+        else:
+            self.journal.replace(user_id, entries)
+    
+    def _remove_journal_entries(self, user_id, item_id):
+        """Delete the journal entries with the given id"""
+        matches = self.journal.find(user_id, item_id)
+        if matches:
+            self.journal.delete(user_id, *matches)
+    
+    def add_journal_entry(self, user_id, entry):
+        """
+        Append an entry to a user's nature journal
+        
+        Entries with an id replace any earlier entry with the same id, as
+        in add_to_user_array.
+        """
+        with self._user_lock(user_id):
+            self._migrate_journal(user_id)
+            self._append_journal_entry(user_id, entry)
+    
+    def _append_journal_entry(self, user_id, entry):
+        if isinstance(entry, dict) and 'id' in entry:
+            self._remove_journal_entries(user_id, entry['id'])
+        self.journal.append(user_id, entry)
+        self.expiry_index.record(user_id)
+    
+    def get_journal_entries(self, user_id, limit=10, before=None):
+        """
+        Read one page of a user's nature journal, newest entries first
+        
+        Parameters:
+        - limit: maximum number of entries to return
+        - before: `next_before` value of the previous page, or None
+        
+        Returns:
+        - dict with the page's 'entries' and the 'next_before' value of the
+          next page (None when this is the last page)
+        
+        Entries keep their numbers when the log is compacted, so a
+        `next_before` value stays valid while entries are deleted.
+        """
+        with self._user_lock(user_id):
+            self._migrate_journal(user_id)
+            # One extra entry tells whether another page follows
+            page = self.journal.latest(user_id, limit=limit + 1, before=before)
+            
+            next_before = None
+            if len(page) > limit:
+                page = page[:limit]
+                next_before = page[-1][0]
+            
+            return {
+                'entries': [entry for _, entry in page],
+                'next_before': next_before
+            }
+    
+    def _last_activity(self, user_id):
+        """Latest modification time of a user's files, or None without any"""
+        paths = [self._shard_path(user_id), self._legacy_path(user_id)]
+        paths += self.journal.paths(user_id)
+        
+        times = []
+        for path in paths:
+            try:
+                times.append(os.stat(path).st_mtime)
+            except FileNotFoundError:
+                pass
+        return max(times) if times else None
+    
+    def delete_user(self, user_id):
+        """Delete all stored data of a user"""
+        with self._user_lock(user_id):
+            stored = self._read_document(user_id) or {}
+            self._update_scores(stored.get('biophilia_score'), None)
+            for path in (self._shard_path(user_id), self._legacy_path(user_id)):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self.journal.drop(user_id)
+            if self.item_index is not None:
+                self.item_index.remove_user(user_id)
+    
+    def register_for_event(self, user_id, event, capacity=None):
+        """
+        Add an event to a user's registered events unless it is full
+        
+        Parameters:
+        - event: event dict with an 'id'
+        - capacity: maximum number of registrants, or None for no limit;
+          a limit needs the item index
+        
+        Returns:
+        - True if the user is registered, False if the event was full
+        """
+        if self.item_index is None:
+            if capacity is not None:
+                self._require_item_index()
+            self.add_to_user_array(user_id, 'registered_events', event)
+            return True
+        
+        with self._user_lock(user_id):
+            # Taking the place first makes the capacity check atomic
+            if not self.item_index.add('registered_events', event['id'], user_id, capacity):
+                return False
+            
+            try:
+                data = self._read_document(user_id) or new_user_data(user_id)
+                add_array_item(data, 'registered_events', event)
+                self._write_document(user_id, data, sync_items=False, previous_score=data.get('biophilia_score'))
+            except BaseException:
+                self.item_index.remove('registered_events', event['id'], user_id)
+                raise
+            return True
+    
+    def get_item_users(self, array_field, item_id):
+        """Ids of the users whose favorite_trails or registered_events hold an item"""
+        return self._require_item_index().users(array_field, item_id)
+    
+    def count_item_users(self, array_field, item_id):
+        """Number of users whose favorite_trails or registered_events hold an item"""
+        return self._require_item_index().count(array_field, item_id)
+    
+    def rebuild_item_index(self):
+        """
+        Index the favorites and registrations of every stored user
+        
+        Needed once for user files written before the item index existed.
+        
+        Returns:
+        - number of users indexed
+        """
+        self._require_item_index()
+        indexed = 0
+        for user_id, _ in self.iter_user_files():
+            with self._user_lock(user_id):
+                data = self._read_document(user_id)
+                if data is not None:
+                    self._sync_items(user_id, data)
+                    indexed += 1
+        return indexed
+    
+    def expire_user(self, user_id, cutoff):
+        """
+        Delete a user's data if it has not changed since `cutoff`
+        
+        Parameters:
+        - cutoff: datetime before which data counts as expired
+        
+        Returns:
+        - True if the user was deleted
+        """
+        with self._user_lock(user_id):
+            last_activity = self._last_activity(user_id)
+            if last_activity is None or last_activity >= cutoff.timestamp():
+                return False
+            self.delete_user(user_id)
+            return True
+    
+    @contextmanager
+    def transaction(self, user_id):
+        """
+        Load a user document once, let the block change it and write it once
+        
+        Usage:
+            with db.transaction(user_id) as data:
+                data['biophilia_score'] = 72
+                add_array_item(data, 'favorite_trails', trail)
+        
+        The file is replaced atomically when the block finishes and left
+        untouched if it raises. Earlier journal entries stay in the journal
+        log: the document's nature_journal starts empty and whatever it
+        holds at the end is appended to the journal.
+        """
+        with self._user_lock(user_id):
+            data = self._read_document(user_id) or new_user_data(user_id)
+            previous_score = data.get('biophilia_score')
+            if data.get(JOURNAL_FIELD):
+                # Move old journal entries to the log before anything else
+                self.journal.extend(user_id, data.pop(JOURNAL_FIELD))
+                self._write_document(user_id, data, sync_items=False, previous_score=previous_score)
+            data[JOURNAL_FIELD] = []
+            item_ids = self._item_ids(data) if self.item_index is not None else None
+            
+            yield data
+            
+            entries = data.pop(JOURNAL_FIELD, None)
+            if entries:
+                self.journal.extend(user_id, list(entries))
+            
+            # The item index only changes with the id-keyed arrays
+            sync_items = item_ids is not None and self._item_ids(data) != item_ids
+            self._write_document(user_id, data, sync_items=sync_items, previous_score=previous_score)
+    
+    def apply_ops(self, user_id, ops):
+        """
+        Apply a list of operations with one read and one write
+        
+        Every operation is checked before anything is changed, and journal
+        operations only reach the journal log once the document operations
+        have all succeeded, so a failing batch changes nothing.
+        
+        Parameters:
+        - ops: operations as accepted by apply_op, applied in order
+        """
+        for op in ops:
+            if len(op) != 3 or op[0] not in ('set', 'add', 'remove'):
+                raise ValueError(f"Invalid user data operation: {op}")
+        
+        with self.transaction(user_id) as data:
+            journal_ops = []
+            for op in ops:
+                if op[1] == JOURNAL_FIELD:
+                    journal_ops.append(op)
+                else:
+                    apply_op(data, op)
+            
+            # Journal operations go to the journal log just before the write
+            for action, _, value in journal_ops:
+                if action == 'add':
+                    self._append_journal_entry(user_id, value)
+                elif action == 'remove':
+                    self._remove_journal_entries(user_id, value)
+                else:
+                    self._sync_journal(user_id, value)
+
+
+class ExpirySweeper:
+    """
+    Deletes users of a SimpleDB that have been inactive for `expiry_days`
+    
+    Candidates come from the store's ExpiryIndex, so no user file is
+    opened to find them. Each `step()` handles at most `batch_size`
+    users; `start()` runs one step every `interval` seconds on a daemon
+    thread, which bounds the extra I/O no matter how many users expired.
+    User files written before the index existed are added to it first,
+    again `batch_size` directory entries per step.
+    """
+    def __init__(self, db, expiry_days=USER_DATA_EXPIRY_DAYS, batch_size=100, interval=1.0):
+        self.db = db
+        self.expiry_days = expiry_days
+        self.batch_size = batch_size
+        self.interval = interval
+        
+        self._marker = os.path.join(db.expiry_index.folder, 'backfilled')
+        self._scan = None
+        self._bucket = None
+        self._offset = 0
+        self._stop = threading.Event()
+        self._thread = None
+        
+        self.checked = 0
+        self.deleted = 0
+    
+    def _backfill_step(self):
+        """Index a batch of user files that predate the index"""
+        if self._scan is None:
+            self._scan = self.db.iter_user_files()
+        
+        entries = []
+        for user_id, entry in self._scan:
+            entries.append((user_id, datetime.fromtimestamp(entry.stat().st_mtime)))
+            if len(entries) >= self.batch_size:
+                break
+        else:
+            self._scan = None
+            with open(self._marker, 'w') as f:
+                f.write(datetime.now().isoformat())
+        
+        self.db.expiry_index.record_many(entries)
+    
+    def step(self, now=None):
+        """
+        Process one batch of candidates
+        
+        Returns:
+        - number of users deleted
+        """
+        if not os.path.exists(self._marker):
+            self._backfill_step()
+            return 0
+        
+        cutoff = (now or datetime.now()) - timedelta(days=self.expiry_days)
+        if self._bucket is None:
+            days = self.db.expiry_index.days_before(cutoff.date())
+            if not days:
+                return 0
+            self._bucket = days[0]
+            self._offset = 0
+        
+        user_ids = []
+        try:
+            with open(self.db.expiry_index.bucket_path(self._bucket), 'r') as f:
+                f.seek(self._offset)
+                while len(user_ids) < self.batch_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    user_ids.append(line.strip())
+                self._offset = f.tell()
+        except FileNotFoundError:
+            pass
+        
+        if not user_ids:
+            # Bucket finished; every user in it was checked
+            self.db.expiry_index.remove_bucket(self._bucket)
+            self._bucket = None
+            return 0
+        
+        deleted = sum(1 for user_id in user_ids if user_id and self.db.expire_user(user_id, cutoff))
+        self.checked += len(user_ids)
+        self.deleted += deleted
+        return deleted
+    
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.step()
+    
+    def start(self):
+        """Start sweeping on a background thread"""
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='expiry-sweeper', daemon=True)
+            self._thread.start()
+    
+    def stop(self):
+        """Stop the background thread after its current step"""
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+
+class _SQLiteStore:
+    """
+    Shared connection handling of the SQLite-backed stores
+    
+    The database runs in WAL mode, so readers never block the writer.
+    Connections come from a pool of at most `pool_size`, checked out for
+    one operation and then returned, so the number of open connections
+    stays bounded however many threads use the store. Subclasses list
+    their tables in SCHEMA.
+    """
+    SCHEMA = []
+    
+    def __init__(self, db_path, pool_size=8):
+        self.db_path = db_path
+        folder = os.path.dirname(db_path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+        
+        # Idle connections; more are opened on demand up to pool_size
+        self._pool = queue.Queue()
+        self._pool_size = pool_size
+        self._opened = 0
+        self._pool_lock = threading.Lock()
+        
+        with self._transaction() as conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+    
+    def _open_connection(self):
+        # Autocommit mode; transactions are opened explicitly. Connections
+        # move between threads, but only one uses a connection at a time
+        conn = sqlite3.connect(
+            self.db_path, timeout=30, isolation_level=None,
+            cached_statements=256, check_same_thread=False
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+    
+    @contextmanager
+    def _connection(self):
+        """Check a connection out of the pool for the duration of the block"""
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                can_open = self._opened < self._pool_size
+                if can_open:
+                    self._opened += 1
+            if can_open:
+                try:
+                    conn = self._open_connection()
+                except Exception:
+                    with self._pool_lock:
+                        self._opened -= 1
+                    raise
+            else:
+                # Wait for another thread to return one
+                conn = self._pool.get()
+        try:
+            yield conn
+        finally:
+            self._pool.put(conn)
+    
+    @contextmanager
+    def _transaction(self, mode='IMMEDIATE'):
+        """Context manager running its block in one write transaction"""
+        with self._connection() as conn:
+            with _SQLiteTransaction(conn, mode):
+                yield conn
+    
+    def _read_transaction(self):
+        """Context manager running its reads against one snapshot"""
+        return self._transaction('DEFERRED')
+    
+    def close(self):
+        """Close every idle pooled connection"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+            with self._pool_lock:
+                self._opened -= 1
+
+class UserItemIndex(_SQLiteStore):
+    """
+    Reverse index from array items (trails, events) to the users holding them
+    
+    One row per (field, item id, user) plus a counter per item, both
+    changed in the same write transaction, so counts are exact and can be
+    read without scanning users. `add` can enforce a capacity: the check
+    and the insert happen under SQLite's write lock, so concurrent
+    registrations (threads or processes) never overbook an item.
+    """
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS item_users (
+            field TEXT NOT NULL,
+            item_key TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            PRIMARY KEY (field, item_key, user_id)
+        ) WITHOUT ROWID""",
+        """CREATE INDEX IF NOT EXISTS item_users_by_user
+            ON item_users (user_id, field)""",
+        """CREATE TABLE IF NOT EXISTS item_counts (
+            field TEXT NOT NULL,
+            item_key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (field, item_key)
+        ) WITHOUT ROWID"""
+    ]
+    
+    def _insert(self, conn, field, key, user_id):
+        inserted = conn.execute(
+            'INSERT OR IGNORE INTO item_users (field, item_key, user_id) VALUES (?, ?, ?)',
+            (field, key, user_id)
+        ).rowcount
+        if inserted:
+            conn.execute(
+                """INSERT INTO item_counts (field, item_key, count) VALUES (?, ?, 1)
+                   ON CONFLICT (field, item_key) DO UPDATE SET count = count + 1""",
+                (field, key)
+            )
+    
+    def _delete(self, conn, field, key, user_id):
+        deleted = conn.execute(
+            'DELETE FROM item_users WHERE field = ? AND item_key = ? AND user_id = ?',
+            (field, key, user_id)
+        ).rowcount
+        if deleted:
+            conn.execute(
+                'UPDATE item_counts SET count = count - 1 WHERE field = ? AND item_key = ?',
+                (field, key)
+            )
+    
+    def add(self, field, item_id, user_id, capacity=None):
+        """
+        Record that a user holds an item
+        
+        Parameters:
+        - capacity: maximum number of users per item, or None for no limit
+        
+        Returns:
+        - True if the user holds the item now, False if it was full
+        """
+        key = json.dumps(item_id)
+        user_id = str(user_id)
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT 1 FROM item_users WHERE field = ? AND item_key = ? AND user_id = ?',
+                (field, key, user_id)
+            ).fetchone()
+            if row is not None:
+                return True
+            
+            if capacity is not None and self._count(conn, field, key) >= capacity:
+                return False
+            self._insert(conn, field, key, user_id)
+            return True
+    
+    def remove(self, field, item_id, user_id):
+        """Record that a user no longer holds an item"""
+        with self._transaction() as conn:
+            self._delete(conn, field, json.dumps(item_id), str(user_id))
+    
+    def sync_user(self, user_id, items_by_field):
+        """Make the index list exactly the given item ids, a list per field, for a user"""
+        user_id = str(user_id)
+        with self._transaction() as conn:
+            for field, item_ids in items_by_field.items():
+                wanted = {json.dumps(item_id) for item_id in item_ids}
+                current = {
+                    key for (key,) in conn.execute(
+                        'SELECT item_key FROM item_users WHERE user_id = ? AND field = ?', (user_id, field)
+                    )
+                }
+                for key in current - wanted:
+                    self._delete(conn, field, key, user_id)
+                for key in wanted - current:
+                    self._insert(conn, field, key, user_id)
+    
+    def remove_user(self, user_id):
+        """Drop every item of a user"""
+        user_id = str(user_id)
+        with self._transaction() as conn:
+            rows = conn.execute('SELECT field, item_key FROM item_users WHERE user_id = ?', (user_id,)).fetchall()
+            for field, key in rows:
+                self._delete(conn, field, key, user_id)
+    
+    def _count(self, conn, field, key):
+        row = conn.execute(
+            'SELECT count FROM item_counts WHERE field = ? AND item_key = ?', (field, key)
+        ).fetchone()
+        return row[0] if row else 0
+    
+    def count(self, field, item_id):
+        """Number of users holding an item"""
+        with self._connection() as conn:
+            return self._count(conn, field, json.dumps(item_id))
+    
+    def users(self, field, item_id):
+        """Ids of the users holding an item"""
+        with self._connection() as conn:
+            rows = conn.execute(
+                'SELECT user_id FROM item_users WHERE field = ? AND item_key = ? ORDER BY user_id',
+                (field, json.dumps(item_id))
+            )
+            return [user_id for (user_id,) in rows]
+
+class SQLiteDB(_SQLiteStore):
+    """
+    SQLite-backed user store with the same API as SimpleDB
+    
+    Every scalar field is its own row and every array element is its own
+    row, so updating one field or one array item only writes that row
+    instead of the whole user document.
+    """
+    SCHEMA = [
+        """CREATE TABLE IF NOT EXISTS user_fields (
+            user_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            value TEXT,
+            is_array INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, field)
+        )""",
+        """CREATE TABLE IF NOT EXISTS user_array_items (
+            user_id TEXT NOT NULL,
+            field TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            item_key TEXT,
+            value TEXT NOT NULL,
+            PRIMARY KEY (user_id, field, seq)
+        )""",
+        """CREATE UNIQUE INDEX IF NOT EXISTS user_array_items_key
+            ON user_array_items (user_id, field, item_key)
+            WHERE item_key IS NOT NULL"""
+    ]
+    
+    def __init__(self, db_path=os.path.join('data', 'users.db'), pool_size=8):
+        super().__init__(db_path, pool_size)
+    
+    @staticmethod
+    def _item_key(item):
+        """Key used to find an array item by its id, or None without one"""
+        if isinstance(item, dict) and 'id' in item:
+            return json.dumps(item['id'])
+        return None
+    
+    def _write_fields(self, conn, user_id, data):
+        """Replace a user's stored document with `data`"""
+        user_id = str(user_id)
+        conn.execute('DELETE FROM user_fields WHERE user_id = ?', (user_id,))
+        conn.execute('DELETE FROM user_array_items WHERE user_id = ?', (user_id,))
+        
+        for field, value in data.items():
+            if isinstance(value, list):
+                conn.execute(
+                    'INSERT INTO user_fields (user_id, field, value, is_array) VALUES (?, ?, NULL, 1)',
+                    (user_id, field)
+                )
+                # Later duplicates replace earlier ones, as add_to_user_array does
+                for item in value:
+                    self._append_item(conn, user_id, field, item)
+            else:
+                self._set_field(conn, user_id, field, value)
+    
+    def _set_field(self, conn, user_id, field, value):
+        conn.execute(
+            'INSERT OR REPLACE INTO user_fields (user_id, field, value, is_array) VALUES (?, ?, ?, 0)',
+            (str(user_id), field, json.dumps(value))
+        )
+    
+    def _append_item(self, conn, user_id, field, item):
+        key = self._item_key(item)
+        if key is not None:
+            conn.execute(
+                'DELETE FROM user_array_items WHERE user_id = ? AND field = ? AND item_key = ?',
+                (str(user_id), field, key)
+            )
+        conn.execute(
+            """INSERT INTO user_array_items (user_id, field, seq, item_key, value)
+               SELECT ?, ?, COALESCE(MAX(seq), 0) + 1, ?, ?
+               FROM user_array_items WHERE user_id = ? AND field = ?""",
+            (str(user_id), field, key, json.dumps(item), str(user_id), field)
+        )
+    
+    def _ensure_user(self, conn, user_id):
+        """Store the default document for a user that has no rows yet"""
+        row = conn.execute('SELECT 1 FROM user_fields WHERE user_id = ? LIMIT 1', (str(user_id),)).fetchone()
+        if row is None:
+            self._write_fields(conn, user_id, new_user_data(user_id))
+    
+    def _touch(self, conn, user_id):
+        self._set_field(conn, user_id, 'last_updated', datetime.now().isoformat())
+    
+    def _read_document(self, conn, user_id):
+        """Assemble a user's document from its rows, or None if it has none"""
+        user_id = str(user_id)
+        rows = conn.execute(
+            'SELECT field, value, is_array FROM user_fields WHERE user_id = ?', (user_id,)
+        ).fetchall()
+        if not rows:
+            return None
+        
+        data = {}
+        for field, value, is_array in rows:
+            data[field] = [] if is_array else json.loads(value)
+        
+        items = conn.execute(
+            'SELECT field, value FROM user_array_items WHERE user_id = ? ORDER BY field, seq', (user_id,)
+        )
+        for field, value in items:
+            data.setdefault(field, []).append(json.loads(value))
+        return data
+    
+    def save_user_data(self, user_id, data):
+        """Save a whole user document"""
+        # Add timestamp
+        data['last_updated'] = datetime.now().isoformat()
+        
+        with self._transaction() as conn:
+            self._write_fields(conn, user_id, data)
+    
+    def load_user_data(self, user_id):
+        """Load a user document"""
+        # Fields and array items are read from the same snapshot
+        with self._read_transaction() as conn:
+            data = self._read_document(conn, user_id)
+        if data is None:
+            # Return empty data if the user has no rows
+            return new_user_data(user_id)
+        return data
+    
+    def update_user_field(self, user_id, field, value):
+        """Update a specific field in user data"""
+        self.apply_ops(user_id, [('set', field, value)])
+    
+    def _write_array(self, conn, user_id, field, items):
+        conn.execute('DELETE FROM user_array_items WHERE user_id = ? AND field = ?', (str(user_id), field))
+        conn.execute(
+            'INSERT OR REPLACE INTO user_fields (user_id, field, value, is_array) VALUES (?, ?, NULL, 1)',
+            (str(user_id), field)
+        )
+        for item in items:
+            self._append_item(conn, user_id, field, item)
+    
+    def add_to_user_array(self, user_id, array_field, item):
+        """Add an item to an array field, replacing any item with the same id"""
+        self.apply_ops(user_id, [('add', array_field, item)])
+    
+    def remove_from_user_array(self, user_id, array_field, item_id):
+        """Remove an item from an array field in user data by its id"""
+        self.apply_ops(user_id, [('remove', array_field, item_id)])
+    
+    def _apply_op(self, conn, user_id, op):
+        """
+        Apply one operation to a user's rows
+        
+        Returns:
+        - True if the operation may have changed the document
+        """
+        action, field, value = op
+        if action == 'set':
+            if isinstance(value, list):
+                self._write_array(conn, user_id, field, value)
+            else:
+                self._set_field(conn, user_id, field, value)
+            return True
+        
+        if action == 'add':
+            conn.execute(
+                'INSERT OR IGNORE INTO user_fields (user_id, field, value, is_array) VALUES (?, ?, NULL, 1)',
+                (str(user_id), field)
+            )
+            self._append_item(conn, user_id, field, value)
+            return True
+        
+        if action == 'remove':
+            row = conn.execute(
+                'SELECT 1 FROM user_fields WHERE user_id = ? AND field = ? AND is_array = 1',
+                (str(user_id), field)
+            ).fetchone()
+            if row is None:
+                return False
+            
+            conn.execute(
+                'DELETE FROM user_array_items WHERE user_id = ? AND field = ? AND item_key = ?',
+                (str(user_id), field, json.dumps(value))
+            )
+            return True
+        
+        raise ValueError(f"Unknown user data operation: {action}")
+    
+    def apply_ops(self, user_id, ops):
+        """Apply a list of operations (see apply_op) in one SQLite transaction"""
+        with self._transaction() as conn:
+            self._ensure_user(conn, user_id)
+            changed = False
+            for op in ops:
+                changed = self._apply_op(conn, user_id, op) or changed
+            if changed:
+                self._touch(conn, user_id)
+    
+    def import_user_data(self, user_id, data):
+        """Store a user document as-is, keeping its own timestamps"""
+        with self._transaction() as conn:
+            self._write_fields(conn, user_id, data)
+
+class _SQLiteTransaction:
+    """Runs a block inside BEGIN (IMMEDIATE by default) ... COMMIT, rolling back on error"""
+    def __init__(self, conn, mode='IMMEDIATE'):
+        self.conn = conn
+        self.mode = mode
+    
+    def __enter__(self):
+        self.conn.execute(f'BEGIN {self.mode}')
+        return self.conn
+    
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute('COMMIT')
+        else:
+            self.conn.execute('ROLLBACK')
+        return False
+
+def migrate_json_to_sqlite(data_folder, sqlite_db):
+    """
+    Import every SimpleDB user file in a folder into an SQLiteDB
+    
+    Parameters:
+    - data_folder: folder holding SimpleDB user files
+    - sqlite_db: SQLiteDB to import into
+    
+    Returns:
+    - number of users imported
+    """
+    json_db = SimpleDB(data_folder)
+    imported = 0
+    for file_user_id, entry in json_db.iter_user_files():
+        with open(entry.path, 'r') as f:
+            data = json.load(f)
+        
+        # Journal entries may live in the user's journal log
+        data[JOURNAL_FIELD] = data.get(JOURNAL_FIELD, []) + json_db.journal.entries(file_user_id)
+        
+        user_id = data.get('user_id', file_user_id)
+        sqlite_db.import_user_data(user_id, data)
+        imported += 1
+    
+    return imported
+
+def migrate_to_shards(db, limit=None):
+    """
+    Move flat user_{id}.json files and journals of a SimpleDB into its
+    sharded layout
+    
+    Safe to run while the store is in use: each user is moved under the
+    user's lock, and readers fall back to the flat path until then. The
+    migration keeps no state; running it again continues with the files
+    that are still flat.
+    
+    Parameters:
+    - db: SimpleDB whose data folder to migrate
+    - limit: maximum number of user files and journals to move in this run
+      (None for all)
+    
+    Returns:
+    - number of user files and journals moved
+    """
+    moved = 0
+    for name in os.listdir(db.data_folder):
+        if limit is not None and moved >= limit:
+            break
+        if not (name.startswith('user_') and name.endswith('.json')):
+            continue
+        
+        user_id = name[len('user_'):-len('.json')]
+        with db._user_lock(user_id):
+            legacy_path = db._legacy_path(user_id)
+            shard_path = db._shard_path(user_id)
+            if not os.path.exists(legacy_path):
+                continue
+            
+            if os.path.exists(shard_path):
+                # Written since in the new layout; that copy is newer
+                os.remove(legacy_path)
+            else:
+                os.makedirs(os.path.dirname(shard_path), exist_ok=True)
+                os.replace(legacy_path, shard_path)
+            moved += 1
+    
+    for user_id in db.journal.flat_user_ids():
+        if limit is not None and moved >= limit:
+            break
+        with db._user_lock(user_id):
+            if db.journal.move_to_shard(user_id):
+                moved += 1
+    
+    return moved
+
+# Write-behind caches still alive, flushed when the interpreter exits
+_open_write_behind_dbs = weakref.WeakSet()
+
+@atexit.register
+def _flush_write_behind_dbs():
+    for db in list(_open_write_behind_dbs):
+        db.close()
+
+class WriteBehindDB:
+    """
+    In-memory write-behind cache in front of SimpleDB or SQLiteDB
+    
+    Hot user documents stay in memory and mutations only mark them dirty.
+    Dirty documents are written to the backend together, `flush_interval`
+    seconds after the first unflushed change, on `flush()`, on `close()`
+    or at interpreter exit, so a burst of changes to one user costs one
+    write. At most `max_users` documents are cached; the least recently
+    used one is dropped when the cache is full and, if dirty, written once
+    the lock is released.
+    Cached documents keep their id-keyed arrays in IdCollections, so each
+    change to a hot user's favorites or registrations is O(1).
+    """
+    def __init__(self, backend=None, flush_interval=2.0, max_users=1024):
+        self.backend = backend if backend is not None else SimpleDB()
+        self.flush_interval = flush_interval
+        self.max_users = max_users
+        
+        self._cache = OrderedDict()
+        self._dirty = set()
+        self._flushing = {}
+        # Evicted dirty documents by user, as (data, previous score), until
+        # they are written; ids not yet claimed by a writer are queued
+        self._evicting = {}
+        self._evicted = []
+        self._lock = threading.RLock()
+        self._evicting_done = threading.Condition(self._lock)
+        # Stored biophilia_score of cached users, so SimpleDB need not read it back
+        self._stored_scores = {}
+        self._flush_lock = threading.Lock()
+        self._timer = None
+        
+        self.hits = 0
+        self.misses = 0
+        self.flushes = 0
+        self.writes = 0
+        self.evictions = 0
+        
+        _open_write_behind_dbs.add(self)
+    
+    def _document(self, user_id):
+        """Return the cached document of a user, loading it on a miss"""
+        if user_id in self._cache:
+            self.hits += 1
+            self._cache.move_to_end(user_id)
+            return self._cache[user_id]
+        
+        self.misses += 1
+        if user_id in self._evicting:
+            # Evicted but not written yet
+            data = copy.deepcopy(self._evicting[user_id][0])
+        elif user_id in self._flushing:
+            # Being written right now; the backend may not have it yet
+            data = copy.deepcopy(self._flushing[user_id])
+        else:
+            data = self.backend.load_user_data(user_id)
+        self._stored_scores[user_id] = data.get('biophilia_score')
+        self._cache[user_id] = data
+        self._evict()
+        return data
+    
+    def _evict(self):
+        """
+        Drop least recently used documents until the cache fits
+        
+        Dirty documents are queued for `_write_evicted`, which callers run
+        after releasing the lock. A user changed since its running flush or
+        eviction took its snapshot stays cached until that write ends;
+        writing it now could land before the older write, and a reload
+        would see the older snapshot.
+        """
+        def busy(user_id):
+            return user_id in self._dirty and (user_id in self._flushing or user_id in self._evicting)
+        
+        while len(self._cache) > self.max_users:
+            user_id = next(iter(self._cache))
+            if busy(user_id):
+                user_id = next((u for u in self._cache if not busy(u)), None)
+                if user_id is None:
+                    return
+            data = self._cache.pop(user_id)
+            previous_score = self._stored_scores.pop(user_id, _MISSING)
+            if user_id in self._dirty:
+                self._dirty.discard(user_id)
+                self._evicting[user_id] = (copy.deepcopy(plain_user_data(data)), previous_score)
+                self._evicted.append(user_id)
+            self.evictions += 1
+    
+    def _write_evicted(self):
+        """Write the queued evicted documents; call without holding the lock"""
+        with self._lock:
+            claimed = [(user_id, self._evicting[user_id]) for user_id in self._evicted]
+            self._evicted = []
+        
+        error = None
+        for user_id, (data, previous_score) in claimed:
+            try:
+                self._save(user_id, copy.deepcopy(data), previous_score)
+            except Exception as e:
+                # Keep the change cached and dirty so the next flush retries it
+                error = error or e
+                with self._lock:
+                    self._cache.setdefault(user_id, data)
+                    self._mark_dirty(user_id, touch=False)
+            else:
+                with self._lock:
+                    self.writes += 1
+            finally:
+                with self._lock:
+                    del self._evicting[user_id]
+                    self._evicting_done.notify_all()
+        
+        if error is not None:
+            raise error
+    
+    def _save(self, user_id, data, previous_score=_MISSING):
+        """Write a document to the backend, passing the stored score to a SimpleDB"""
+        if previous_score is not _MISSING and isinstance(self.backend, SimpleDB):
+            self.backend.save_user_data(user_id, data, previous_score=previous_score)
+        else:
+            self.backend.save_user_data(user_id, data)
+    
+    def _mark_dirty(self, user_id, touch=True):
+        """Record a change and make sure a flush is scheduled"""
+        if touch:
+            self._cache[user_id]['last_updated'] = datetime.now().isoformat()
+        self._dirty.add(user_id)
+        if self._timer is None and self.flush_interval is not None:
+            self._timer = threading.Timer(self.flush_interval, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+    
+    def save_user_data(self, user_id, data):
+        """Replace a user document"""
+        # Add timestamp
+        data['last_updated'] = datetime.now().isoformat()
+        
+        with self._lock:
+            self._cache[user_id] = copy.deepcopy(data)
+            self._cache.move_to_end(user_id)
+            self._mark_dirty(user_id, touch=False)
+            self._evict()
+        self._write_evicted()
+    
+    def load_user_data(self, user_id):
+        """Load a user document"""
+        with self._lock:
+            data = copy.deepcopy(plain_user_data(self._document(user_id)))
+        self._write_evicted()
+        return data
+    
+    def update_user_field(self, user_id, field, value):
+        """Update a specific field in user data"""
+        with self._lock:
+            self._document(user_id)[field] = copy.deepcopy(value)
+            self._mark_dirty(user_id)
+        self._write_evicted()
+    
+    def add_to_user_array(self, user_id, array_field, item):
+        """Add an item to an array field in user data"""
+        with self._lock:
+            add_array_item(self._document(user_id), array_field, copy.deepcopy(item))
+            self._mark_dirty(user_id)
+        self._write_evicted()
+    
+    def remove_from_user_array(self, user_id, array_field, item_id):
+        """Remove an item from an array field in user data by its id"""
+        with self._lock:
+            if remove_array_item(self._document(user_id), array_field, item_id):
+                self._mark_dirty(user_id)
+        self._write_evicted()
+    
+    def apply_ops(self, user_id, ops):
+        """Apply a list of operations (see apply_op) to the cached document"""
+        with self._lock:
+            data = self._document(user_id)
+            changed = False
+            for op in ops:
+                changed = apply_op(data, copy.deepcopy(op)) or changed
+            if changed:
+                self._mark_dirty(user_id)
+        self._write_evicted()
+    
+    def flush(self):
+        """Write every dirty document to the backend"""
+        with self._flush_lock:
+            self._write_evicted()
+            with self._lock:
+                # A user changed after its eviction has to be written after
+                # the evicted version
+                while any(user_id in self._evicting for user_id in self._dirty):
+                    self._evicting_done.wait()
+                
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                
+                # Snapshot under the lock, write outside it
+                pending = {user_id: copy.deepcopy(plain_user_data(self._cache[user_id])) for user_id in self._dirty}
+                previous_scores = {user_id: self._stored_scores.get(user_id, _MISSING) for user_id in pending}
+                self._flushing = pending
+                self._dirty = set()
+            
+            if not pending:
+                return 0
+            
+            try:
+                for user_id, data in pending.items():
+                    self._save(user_id, copy.deepcopy(data), previous_scores[user_id])
+                    with self._lock:
+                        if user_id in self._cache:
+                            self._stored_scores[user_id] = data.get('biophilia_score')
+            except Exception:
+                # Keep unwritten changes dirty so the next flush retries them
+                with self._lock:
+                    for user_id, data in pending.items():
+                        self._cache.setdefault(user_id, data)
+                        self._dirty.add(user_id)
+                raise
+            finally:
+                with self._lock:
+                    self._flushing = {}
+            
+            with self._lock:
+                self.flushes += 1
+                self.writes += len(pending)
+                # Users kept cached during the flush can be evicted now
+                self._evict()
+            self._write_evicted()
+            return len(pending)
+    
+    def close(self):
+        """Flush outstanding changes; the cache stays usable afterwards"""
+        self.flush()
+    
+    def stats(self):
+        """Return cache counters as a dictionary"""
+        with self._lock:
+            return {
+                'cached': len(self._cache),
+                'dirty': len(self._dirty),
+                'hits': self.hits,
+                'misses': self.misses,
+                'flushes': self.flushes,
+                'writes': self.writes,
+                'evictions': self.evictions
+            }
+
+class AsyncSimpleDB:
+    """
+    asyncio front end for SimpleDB (or any store with the same API)
+    
+    Each call runs the blocking store method on a bounded thread pool, so
+    the event loop never waits for disk I/O. Concurrent load_user_data
+    calls for the same user share one read; a write to the user starts a
+    fresh read for later callers, so nobody sees data older than a write
+    that finished before their call. Use apply_ops for transactions.
+    """
+    def __init__(self, db=None, max_workers=8):
+        self.db = db if db is not None else SimpleDB()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='simpledb')
+        self._loads = {}
+        
+        self.reads = 0
+        self.coalesced = 0
+    
+    async def _run(self, method, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(method, *args))
+    
+    async def _write(self, method, user_id, *args):
+        # Loads already in flight may miss this write; later ones must not
+        # join them, including loads started while the write was running
+        self._loads.pop(user_id, None)
+        try:
+            return await self._run(method, user_id, *args)
+        finally:
+            self._loads.pop(user_id, None)
+    
+    def _forget_load(self, user_id, read):
+        if self._loads.get(user_id) is read:
+            del self._loads[user_id]
+    
+    async def load_user_data(self, user_id):
+        """Load a user document, sharing the read with concurrent callers"""
+        read = self._loads.get(user_id)
+        if read is None:
+            read = asyncio.ensure_future(self._run(self.db.load_user_data, user_id))
+            self._loads[user_id] = read
+            self.reads += 1
+            read.add_done_callback(functools.partial(self._forget_load, user_id))
+        else:
+            self.coalesced += 1
+        
+        # Each caller gets its own copy to change
+        return copy.deepcopy(await asyncio.shield(read))
+    
+    async def save_user_data(self, user_id, data):
+        """Save a whole user document"""
+        await self._write(self.db.save_user_data, user_id, data)
+    
+    async def update_user_field(self, user_id, field, value):
+        """Update a specific field in user data"""
+        await self._write(self.db.update_user_field, user_id, field, value)
+    
+    async def add_to_user_array(self, user_id, array_field, item):
+        """Add an item to an array field in user data"""
+        await self._write(self.db.add_to_user_array, user_id, array_field, item)
+    
+    async def remove_from_user_array(self, user_id, array_field, item_id):
+        """Remove an item from an array field in user data by its id"""
+        await self._write(self.db.remove_from_user_array, user_id, array_field, item_id)
+    
+    async def apply_ops(self, user_id, ops):
+        """Apply a list of operations (see apply_op) with one read and one write"""
+        await self._write(self.db.apply_ops, user_id, ops)
+    
+    async def add_journal_entry(self, user_id, entry):
+        """Append an entry to a user's nature journal"""
+        await self._write(self.db.add_journal_entry, user_id, entry)
+    
+    async def get_journal_entries(self, user_id, limit=10, before=None):
+        """Read one page of a user's nature journal, newest entries first"""
+        return await self._run(self.db.get_journal_entries, user_id, limit, before)
+    
+    def close(self):
+        """Wait for running calls and stop the thread pool"""
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,378 @@
+import pandas as pd
+import numpy as np
+import os
+from datetime import datetime, timedelta
+from config import EVENT_TYPES
+from utils.trail_finder import CatalogManager, TrailSpatialIndex
+
+EVENTS_CSV_PATH = 'data/sample_events.csv'
+
+class EventCalendar:
+    """
+    Events sorted once by date, answering date-window queries by binary search
+    
+    A date window maps to one contiguous run of the sorted table, found with
+    two binary searches, so a query costs O(log N + k) for k matching events.
+    Each event type also keeps a posting list of its positions in date
+    order, so type filters only touch events of the requested types.
+    
+    For "near me" queries the sorted events are cut into time buckets of
+    `bucket_days` days, each with its own spatial index over the events'
+    coordinates, so a radius-and-window query only searches the buckets
+    overlapping the window.
+    """
+    def __init__(self, events_df, bucket_days=7):
+        dates = pd.to_datetime(events_df['date']).to_numpy()
+        
+        # Stable sort keeps file order between events on the same day;
+        # events without a date sort last
+        order = np.argsort(dates, kind='stable')
+        self.events_df = events_df.iloc[order].reset_index(drop=True)
+        self.dates = dates[order]
+        
+        # Posting lists per type; configured types exist even with no events
+        self.type_postings = {name: np.empty(0, dtype=np.int64) for name in EVENT_TYPES}
+        codes, names = pd.factorize(self.events_df['type'])
+        by_type = np.argsort(codes, kind='stable')
+        boundaries = np.searchsorted(codes[by_type], np.arange(len(names) + 1))
+        for code, name in enumerate(names):
+            self.type_postings[name] = by_type[boundaries[code]:boundaries[code + 1]]
+        
+        self._build_buckets(bucket_days)
+    
+    def _build_buckets(self, bucket_days):
+        """Split dated events with coordinates into spatially indexed time buckets"""
+        self.bucket_days = bucket_days
+        self.buckets = []
+        self.bucket_starts = np.empty(0, dtype=np.int64)
+        
+        # Events without coordinates cannot be found by distance
+        if 'latitude' not in self.events_df or 'longitude' not in self.events_df:
+            return
+        
+        dated = self.date_slice().stop
+        if dated == 0:
+            return
+        
+        lats = self.events_df['latitude'].to_numpy(dtype=float)
+        lons = self.events_df['longitude'].to_numpy(dtype=float)
+        bucket_ids = (self.dates[:dated] - self.dates[0]) // np.timedelta64(bucket_days, 'D')
+        bounds = np.concatenate([[0], np.flatnonzero(np.diff(bucket_ids)) + 1, [dated]])
+        
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            positions = np.arange(start, end)
+            positions = positions[~(np.isnan(lats[start:end]) | np.isnan(lons[start:end]))]
+            self.buckets.append((int(start), int(end), positions, TrailSpatialIndex(lats[positions], lons[positions])))
+        
+        self.bucket_starts = bounds[:-1]
+    
+    def __len__(self):
+        return len(self.events_df)
+    
+    def date_slice(self, start_date=None, end_date=None):
+        """
+        Return the slice of sorted positions between two dates (inclusive)
+        
+        Either bound may be None to leave that side open.
+        """
+        start = 0
+        end = np.searchsorted(self.dates, np.datetime64('NaT'), side='left')
+        if start_date is not None:
+            start = np.searchsorted(self.dates, pd.Timestamp(start_date).to_datetime64(), side='left')
+        if end_date is not None:
+            end = min(end, np.searchsorted(self.dates, pd.Timestamp(end_date).to_datetime64(), side='right'))
+        return slice(int(start), int(max(start, end)))
+    
+    def events_between(self, start_date=None, end_date=None):
+        """Return the events between two dates as a view of the sorted table"""
+        return self.events_df.iloc[self.date_slice(start_date, end_date)]
+    
+    def query(self, date_range=None, types=None, limit=None):
+        """
+        Return events in date order, filtered by date window and type
+        
+        Parameters:
+        - date_range: optional (start_date, end_date) tuple
+        - types: optional list of event types to include
+        - limit: maximum number of events to return
+        
+        Returns:
+        - DataFrame of matching events
+        """
+        rows = slice(0, len(self))
+        if date_range is not None and len(date_range) == 2:
+            rows = self.date_slice(*date_range)
+        
+        if types is None or len(types) == 0:
+            return self.events_df.iloc[rows][:limit]
+        
+        # Cut each type's posting list down to the date window, then merge
+        parts = []
+        for name in set(types):
+            postings = self.type_postings.get(name)
+            if postings is None:
+                continue
+            lo = np.searchsorted(postings, rows.start, side='left')
+            hi = np.searchsorted(postings, rows.stop, side='left')
+            parts.append(postings[lo:hi][:limit])
+        
+        positions = np.sort(np.concatenate(parts)) if parts else np.empty(0, dtype=np.int64)
+        return self.events_df.iloc[positions[:limit]]
+    
+    def query_nearby(self, lat, lon, radius, date_range=None, types=None, limit=None):
+        """
+        Return events within `radius` miles of a point, in date order
+        
+        Only dated events with coordinates can match. Each event gets a
+        'distance' column in miles.
+        
+        Parameters:
+        - lat, lon: point in decimal degrees
+        - radius: maximum distance in miles
+        - date_range, types, limit: as for `query`
+        
+        Returns:
+        - DataFrame of matching events
+        """
+        rows = self.date_slice()
+        if date_range is not None and len(date_range) == 2:
+            rows = self.date_slice(*date_range)
+        
+        types = list(types) if types is not None and len(types) > 0 else None
+        event_types = self.events_df['type'].to_numpy()
+        
+        found_positions, found_distances = [], []
+        found = 0
+        first = max(int(np.searchsorted(self.bucket_starts, rows.start, side='right')) - 1, 0)
+        for start, end, positions, index in self.buckets[first:]:
+            if start >= rows.stop:
+                break
+            
+            local, distances = index.query_radius(lat, lon, radius)
+            matches = positions[local]
+            
+            # Buckets at the edges of the window may hold events outside it
+            keep = (matches >= rows.start) & (matches < rows.stop)
+            if types is not None:
+                keep &= np.isin(event_types[matches], types)
+            found_positions.append(matches[keep])
+            found_distances.append(distances[keep])
+            found += int(keep.sum())
+            
+            # Later buckets only hold later events
+            if limit is not None and found >= limit:
+                break
+        
+        if found_positions:
+            positions = np.concatenate(found_positions)
+            distances = np.concatenate(found_distances)
+        else:
+            positions = np.empty(0, dtype=np.int64)
+            distances = np.empty(0, dtype=float)
+        
+        order = np.argsort(positions, kind='stable')[:limit]
+        events_df = self.events_df.iloc[positions[order]].copy()
+        events_df['distance'] = distances[order]
+        return events_df
+
+class EventCalendarManager(CatalogManager):
+    """
+    Keeps the event calendar in memory and reloads it only when its file changes
+    """
+    def __init__(self, path=EVENTS_CSV_PATH, create_if_missing=False):
+        super().__init__(path, create_if_missing)
+    
+    def _read(self):
+        return EventCalendar(pd.read_csv(self.path))
+    
+    def _create_sample(self):
+        create_sample_events_data()
+
+# Calendar manager for the bundled sample events
+event_calendar_manager = EventCalendarManager(create_if_missing=True)
+
+def get_event_calendar():
+    """Return the cached calendar of sample events"""
+    return event_calendar_manager.get()
+
+def get_upcoming_events(date_range=None, types=None, limit=None, calendar=None):
+    """
+    Get upcoming nature events with optional filters
+    
+    Parameters:
+    - date_range: tuple of (start_date, end_date)
+    - types: list of event types to include
+    - limit: maximum number of events to return
+    - calendar: EventCalendar to query instead of the cached sample calendar
+    
+    Returns:
+    - list of event dictionaries
+    """
+    # In a real app, this would query an API or database
+    # For this example, events come from a sample CSV file that is parsed
+    # and sorted by date once, then kept in memory between calls
+    if calendar is None:
+        calendar = get_event_calendar()
+    
+    # Date window and type filters are answered from the calendar's indexes
+    events_df = calendar.query(date_range, types, limit)
+    
+    # Convert to list of dictionaries
+    events = events_df.to_dict('records')
+    
+    return events
+
+def find_nearby_events(user_location, distance, date_range=None, types=None, limit=None):
+    """
+    Get nature events near the user's location with optional filters
+    
+    Parameters:
+    - user_location: dict with 'lat' and 'lon' keys
+    - distance: maximum distance in miles
+    - date_range: tuple of (start_date, end_date)
+    - types: list of event types to include
+    - limit: maximum number of events to return
+    
+    Returns:
+    - list of event dictionaries in date order, each with a 'distance'
+      in miles; without a location this is the same as get_upcoming_events
+    """
+    if not (user_location and 'lat' in user_location and 'lon' in user_location):
+        return get_upcoming_events(date_range, types, limit)
+    
+    calendar = get_event_calendar()
+    events_df = calendar.query_nearby(user_location['lat'], user_location['lon'], distance, date_range, types, limit)
+    
+    # Convert to list of dictionaries
+    events = events_df.to_dict('records')
+    
+    return events
+
+def create_sample_events_data():
+    """Create sample event data and save to CSV"""
+    # Current date for generating events
+    now = datetime.now()
+    
+    events = [
+        {
+            'id': 1,
+            'name': 'Guided Bird Watching Tour',
+            'date': (now + timedelta(days=3)).strftime('%Y-%m-%d'),
+            'location': 'Oakridge Nature Reserve',
+            'latitude': 37.7799,
+            'longitude': -122.4144,
+            'type': 'Birdwatching',
+            'description': 'Join our expert ornithologists for a guided tour to spot and identify local bird species. Binoculars provided!',
+            'image_url': 'https://i.imgur.com/YJOX1CW.jpg'
+        },
+        {
+            'id': 2,
+            'name': 'Forest Bathing Experience',
+            'date': (now + timedelta(days=5)).strftime('%Y-%m-%d'),
+            'location': 'Pinecrest Woods',
+            'latitude': 37.8149,
+            'longitude': -122.3994,
+            'type': 'Guided Hike',
+            'description': 'Experience the Japanese practice of Shinrin-yoku (forest bathing) to reduce stress and boost wellbeing through mindful nature immersion.',
+            'image_url': 'https://i.imgur.com/3Cm5BM9.jpg'
+        },
+        {
+            'id': 3,
+            'name': 'River Cleanup Volunteer Day',
+            'date': (now + timedelta(days=7)).strftime('%Y-%m-%d'),
+            'location': 'Silverstream River',
+            'latitude': 37.7449,
+            'longitude': -122.4694,
+            'type': 'Conservation',
+            'description': 'Help restore the natural beauty of our local river by joining our cleanup effort. All equipment provided, plus lunch for volunteers!',
+            'image_url': 'https://i.imgur.com/K58U4dV.jpg'
+        },
+        {
+            'id': 4,
+            'name': 'Wildflower Identification Workshop',
+            'date': (now + timedelta(days=10)).strftime('%Y-%m-%d'),
+            'location': 'Meadow View Park',
+            'latitude': 37.8249,
+            'longitude': -122.3894,
+            'type': 'Education',
+            'description': 'Learn to identify local wildflower species and understand their ecological importance in this hands-on workshop.',
+            'image_url': 'https://i.imgur.com/VmFbVmE.jpg'
+        },
+        {
+            'id': 5,
+            'name': 'Family Nature Scavenger Hunt',
+            'date': (now + timedelta(days=12)).strftime('%Y-%m-%d'),
+            'location': 'Community Wilderness Area',
+            'latitude': 37.7599,
+            'longitude': -122.4494,
+            'type': 'Community',
+            'description': 'A fun event for families to explore nature together through an educational scavenger hunt with prizes!',
+            'image_url': 'https://i.imgur.com/B4mJErA.jpg'
+        },
+        {
+            'id': 6,
+            'name': 'Sunset Yoga in the Park',
+            'date': (now + timedelta(days=14)).strftime('%Y-%m-%d'),
+            'location': 'Hilltop Gardens',
+            'latitude': 37.8349,
+            'longitude': -122.3794,
+            'type': 'Community',
+            'description': 'Connect with nature through outdoor yoga as the sun sets. All skill levels welcome. Bring your own mat.',
+            'image_url': 'https://i.imgur.com/QLKL9F5.jpg'
+        },
+        {
+            'id': 7,
+            'name': 'Native Plant Gardening Workshop',
+            'date': (now + timedelta(days=17)).strftime('%Y-%m-%d'),
+            'location': 'Community Center',
+            'latitude': 37.7749,
+            'longitude': -122.4194,
+            'type': 'Education',
+            'description': 'Learn how to create a garden that supports local ecosystems using native plant species. Take home a starter plant!',
+            'image_url': 'https://i.imgur.com/Gju4kCM.jpg'
+        },
+        {
+            'id': 8,
+            'name': 'Stargazing Night',
+            'date': (now + timedelta(days=20)).strftime('%Y-%m-%d'),
+            'location': 'Mountain Ridge Observatory',
+            'latitude': 37.3414,
+            'longitude': -121.6429,
+            'type': 'Education',
+            'description': 'Join amateur astronomers to observe stars, planets, and constellations. Telescopes provided. Hot chocolate served!',
+            'image_url': 'https://i.imgur.com/bIziVdO.jpg'
+        },
+        {
+            'id': 9,
+            'name': 'Nature Photography Workshop',
+            'date': (now + timedelta(days=22)).strftime('%Y-%m-%d'),
+            'location': 'Wildlife Sanctuary',
+            'latitude': 37.9,
+            'longitude': -122.58,
+            'type': 'Education',
+            'description': 'Learn techniques for capturing stunning nature photographs with your smartphone or camera. All skill levels welcome.',
+            'image_url': 'https://i.imgur.com/Y2JJ6KQ.jpg'
+        },
+        {
+            'id': 10,
+            'name': 'Trail Maintenance Day',
+            'date': (now + timedelta(days=25)).strftime('%Y-%m-%d'),
+            'location': 'Red Rock Trails',
+            'latitude': 38.1,
+            'longitude': -122.65,
+            'type': 'Conservation',
+            'description': 'Help maintain our beloved hiking trails for everyone to enjoy. Tools, training, and refreshments provided.',
+            'image_url': 'https://i.imgur.com/Gju4kCM.jpg'
+        }
+    ]
+    
+    # Create DataFrame
+    events_df = pd.DataFrame(events)
+    
+    # Ensure data directory exists
+    os.makedirs('data', exist_ok=True)
+    
+    # Save to CSV
+    events_df.to_csv(EVENTS_CSV_PATH, index=False)
+    
+    return events_df
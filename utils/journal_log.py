@@ -0,0 +1,465 @@
+"""
+Append-only storage for nature journal entries
+
+Each user's journal is a line-delimited JSON log plus an offset index with
+one fixed-size record per entry, so adding an entry only appends that
+entry and reading the newest entries only reads their bytes.
+"""
+import functools
+import hashlib
+import json
+import os
+import struct
+import threading
+import zlib
+from array import array
+from collections import OrderedDict
+
+# Index record: file offset of the entry's line and the entry's number
+RECORD = struct.Struct('<qq')
+RECORD_SIZE = RECORD.size
+
+JOURNAL_SUFFIXES = ('.log', '.idx', '.del', '.ids')
+
+# Paths are computed on every read and write of a user; hashing dominates
+@functools.lru_cache(maxsize=4096)
+def shard_folder(folder, user_id):
+    """Folder of a user's files in the sharded layout, folder/ab/cd from the MD5 of the id"""
+    digest = hashlib.md5(str(user_id).encode('utf-8')).hexdigest()
+    return os.path.join(folder, digest[:2], digest[2:4])
+
+class JournalLog:
+    """
+    Per-user append-only journal logs
+    
+    Files per user, inside the user's shard folder/ab/cd (see shard_folder):
+    - journal_{id}.log: one JSON entry per line, oldest first
+    - journal_{id}.idx: little-endian int64 (offset, number) of every line
+    - journal_{id}.del: numbers of deleted entries, one per line
+    - journal_{id}.ids: [encoded id, number] of every entry with an 'id'
+    
+    Every entry gets a number one higher than the entry before it, which it
+    keeps for good, so numbers can be used as paging cursors. Deleting an
+    entry only records its number; once deleted entries make up
+    `compact_ratio` of the log (and at least `min_compact` entries), the log
+    is rewritten without them.
+    
+    Journals of the old flat layout, directly inside `folder`, move to
+    their shard the first time they are used (or with move_to_shard).
+    
+    Users share `lock_stripes` locks, and which logs were checked and their
+    id maps are only remembered for the `cached_users` most recently used
+    users, so memory stays bounded however many users write.
+    """
+    def __init__(self, folder, compact_ratio=0.25, min_compact=16, lock_stripes=64, cached_users=1024):
+        self.folder = folder
+        self.compact_ratio = compact_ratio
+        self.min_compact = min_compact
+        self.cached_users = cached_users
+        os.makedirs(folder, exist_ok=True)
+        
+        self._stripes = [threading.Lock() for _ in range(lock_stripes)]
+        # Least recently used first; both guarded by _cache_lock
+        self._checked = OrderedDict()
+        self._ids = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    def _paths(self, user_id):
+        base = os.path.join(shard_folder(self.folder, user_id), f"journal_{user_id}")
+        return tuple(base + suffix for suffix in JOURNAL_SUFFIXES)
+    
+    def _flat_paths(self, user_id):
+        base = os.path.join(self.folder, f"journal_{user_id}")
+        return tuple(base + suffix for suffix in JOURNAL_SUFFIXES)
+    
+    def _lock(self, user_id):
+        return self._stripes[zlib.crc32(str(user_id).encode('utf-8')) % len(self._stripes)]
+    
+    def _cached(self, cache, user_id):
+        """Return a user's cached value, or None, marking it recently used"""
+        with self._cache_lock:
+            value = cache.get(user_id)
+            if value is not None:
+                cache.move_to_end(user_id)
+            return value
+    
+    def _remember(self, cache, user_id, value):
+        """Cache a value for a user, dropping the least recently used users"""
+        with self._cache_lock:
+            cache[user_id] = value
+            cache.move_to_end(user_id)
+            while len(cache) > self.cached_users:
+                cache.popitem(last=False)
+    
+    def _forget(self, user_id):
+        """Drop everything cached about a user's files"""
+        with self._cache_lock:
+            self._checked.pop(user_id, None)
+            self._ids.pop(user_id, None)
+    
+    def paths(self, user_id):
+        """Files that may hold a user's journal, in either layout"""
+        return list(self._paths(user_id) + self._flat_paths(user_id))
+    
+    def flat_user_ids(self):
+        """Ids of the users whose journal is still in the flat layout"""
+        return [
+            name[len('journal_'):-len('.log')] for name in os.listdir(self.folder)
+            if name.startswith('journal_') and name.endswith('.log')
+        ]
+    
+    def move_to_shard(self, user_id):
+        """
+        Move a user's journal from the flat layout into its shard
+        
+        Returns:
+        - True if there were flat files to move
+        """
+        with self._lock(user_id):
+            return self._move_to_shard(user_id)
+    
+    def _move_to_shard(self, user_id):
+        flat_paths = [path for path in self._flat_paths(user_id) if os.path.exists(path)]
+        if not flat_paths:
+            return False
+        
+        paths = self._paths(user_id)
+        os.makedirs(os.path.dirname(paths[0]), exist_ok=True)
+        if os.path.exists(paths[0]):
+            # Written since in the new layout; that copy is newer
+            for path in flat_paths:
+                os.remove(path)
+        else:
+            # The log moves last, so an interrupted move is finished next time
+            for path, flat_path in reversed(list(zip(paths, self._flat_paths(user_id)))):
+                if os.path.exists(flat_path):
+                    os.replace(flat_path, path)
+        self._forget(user_id)
+        return True
+    
+    def drop(self, user_id):
+        """Delete a user's whole journal"""
+        with self._lock(user_id):
+            for path in self.paths(user_id):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            self._forget(user_id)
+    
+    def exists(self, user_id):
+        """Check whether a user has a journal log"""
+        return os.path.exists(self._paths(user_id)[0]) or os.path.exists(self._flat_paths(user_id)[0])
+    
+    def _check(self, user_id):
+        """
+        Bring the offset index in line with the log after a crash
+        
+        A crash between the appends can leave the index short, and a crash
+        mid-write can leave a partial last line. Only the bytes after the
+        last indexed entry are read.
+        """
+        if self._cached(self._checked, user_id):
+            return
+        self._move_to_shard(user_id)
+        log_path = self._paths(user_id)[0]
+        if not os.path.exists(log_path):
+            os.makedirs(os.path.dirname(log_path), exist_ok=True)
+            self._remember(self._checked, user_id, True)
+            return
+        
+        size = self._size(user_id)
+        last = self._read_records(user_id, size - 1, size) if size else array('q')
+        start = last[0] if last else 0
+        seq = last[1] if last else -1
+        
+        with open(log_path, 'rb') as f:
+            f.seek(start)
+            tail = f.read()
+        
+        position = start
+        missing = []
+        for line in tail.splitlines(keepends=True):
+            if not line.endswith(b'\n'):
+                # Drop a partially written last entry
+                with open(log_path, 'r+b') as f:
+                    f.truncate(position)
+                break
+            if position != start or not last:
+                seq += 1
+                missing.append((position, seq, json.loads(line)))
+            position += len(line)
+        
+        if missing:
+            self._record_ids(user_id, [(entry, seq) for _, seq, entry in missing])
+            self._append_records(user_id, [(offset, seq) for offset, seq, _ in missing])
+        self._remember(self._checked, user_id, True)
+    
+    def _read_records(self, user_id, start, stop):
+        """Read index records [start, stop) as a flat array of (offset, number) pairs"""
+        idx_path = self._paths(user_id)[1]
+        records = array('q')
+        try:
+            with open(idx_path, 'rb') as f:
+                f.seek(start * RECORD_SIZE)
+                data = f.read() if stop is None else f.read((stop - start) * RECORD_SIZE)
+        except FileNotFoundError:
+            return records
+        records.frombytes(data[:len(data) - len(data) % RECORD_SIZE])
+        return records
+    
+    def _append_records(self, user_id, records):
+        with open(self._paths(user_id)[1], 'ab') as f:
+            f.write(b''.join(RECORD.pack(offset, seq) for offset, seq in records))
+    
+    def _size(self, user_id):
+        """Number of entries in the log, deleted ones included"""
+        try:
+            return os.path.getsize(self._paths(user_id)[1]) // RECORD_SIZE
+        except FileNotFoundError:
+            return 0
+    
+    def _next_seq(self, user_id):
+        """Number the next appended entry gets"""
+        size = self._size(user_id)
+        return self._read_records(user_id, size - 1, size)[1] + 1 if size else 0
+    
+    def _position(self, user_id, seq):
+        """Index position of the first entry numbered `seq` or higher"""
+        lo, hi = 0, self._size(user_id)
+        if hi == 0:
+            return 0
+        
+        # Numbers only grow, so the index can be bisected in place
+        with open(self._paths(user_id)[1], 'rb') as f:
+            while lo < hi:
+                mid = (lo + hi) // 2
+                f.seek(mid * RECORD_SIZE)
+                if RECORD.unpack(f.read(RECORD_SIZE))[1] < seq:
+                    lo = mid + 1
+                else:
+                    hi = mid
+        return lo
+    
+    def _deleted(self, user_id):
+        try:
+            with open(self._paths(user_id)[2], 'r') as f:
+                return {int(line) for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+    
+    def _record_ids(self, user_id, numbered):
+        """Add the ids of (entry, number) pairs to the id file"""
+        lines = [
+            json.dumps([json.dumps(entry['id']), seq]) + '\n'
+            for entry, seq in numbered if isinstance(entry, dict) and 'id' in entry
+        ]
+        if lines:
+            with open(self._paths(user_id)[3], 'a') as f:
+                f.write(''.join(lines))
+    
+    def _id_map(self, user_id):
+        """
+        Map of encoded entry id to the numbers of entries holding it
+        
+        The map is kept in memory and only the lines appended since the last
+        call are read; it is rebuilt when the id file is replaced or the
+        user has dropped out of the cache.
+        """
+        ids_path = self._paths(user_id)[3]
+        try:
+            stat = os.stat(ids_path)
+        except FileNotFoundError:
+            self._forget(user_id)
+            return {}
+        
+        cached = self._cached(self._ids, user_id)
+        if cached is None or cached[0] != stat.st_ino or cached[1] > stat.st_size:
+            cached = [stat.st_ino, 0, {}]
+            self._remember(self._ids, user_id, cached)
+        
+        if cached[1] < stat.st_size:
+            with open(ids_path, 'rb') as f:
+                f.seek(cached[1])
+                data = f.read()
+            # A partially written last line is read once it is complete
+            data = data[:data.rfind(b'\n') + 1]
+            for line in data.splitlines():
+                key, seq = json.loads(line)
+                cached[2].setdefault(key, set()).add(seq)
+            cached[1] += len(data)
+        return cached[2]
+    
+    def append(self, user_id, entry):
+        """
+        Append an entry to a user's journal
+        
+        Returns:
+        - the entry's number
+        """
+        line = (json.dumps(entry) + '\n').encode('utf-8')
+        log_path = self._paths(user_id)[0]
+        
+        with self._lock(user_id):
+            self._check(user_id)
+            seq = self._next_seq(user_id)
+            with open(log_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(line)
+            self._record_ids(user_id, [(entry, seq)])
+            self._append_records(user_id, [(offset, seq)])
+            return seq
+    
+    def extend(self, user_id, entries):
+        """Append several entries, oldest first, with one write per file"""
+        entries = list(entries)
+        log_path = self._paths(user_id)[0]
+        with self._lock(user_id):
+            self._check(user_id)
+            seq = self._next_seq(user_id)
+            with open(log_path, 'ab') as f:
+                offset = f.seek(0, os.SEEK_END)
+                records = []
+                lines = []
+                for number, entry in enumerate(entries, seq):
+                    line = (json.dumps(entry) + '\n').encode('utf-8')
+                    records.append((offset, number))
+                    offset += len(line)
+                    lines.append(line)
+                f.write(b''.join(lines))
+            self._record_ids(user_id, list(zip(entries, range(seq, seq + len(entries)))))
+            self._append_records(user_id, records)
+    
+    def count(self, user_id):
+        """Number of live entries in a user's journal"""
+        with self._lock(user_id):
+            self._check(user_id)
+            return self._size(user_id) - len(self._deleted(user_id))
+    
+    def find(self, user_id, item_id):
+        """Numbers of the live entries whose 'id' is item_id, oldest first"""
+        with self._lock(user_id):
+            self._check(user_id)
+            seqs = self._id_map(user_id).get(json.dumps(item_id))
+            if not seqs:
+                return []
+            deleted = self._deleted(user_id)
+            return sorted(seq for seq in seqs if seq not in deleted)
+    
+    def latest(self, user_id, limit=10, before=None):
+        """
+        Read the newest entries of a user's journal
+        
+        Parameters:
+        - limit: maximum number of entries to return (None for all)
+        - before: only return entries numbered below this (for paging)
+        
+        Returns:
+        - list of (number, entry) tuples, newest first
+        """
+        log_path = self._paths(user_id)[0]
+        with self._lock(user_id):
+            self._check(user_id)
+            end = self._size(user_id) if before is None else self._position(user_id, before)
+            results = []
+            if end == 0 or (limit is not None and limit <= 0):
+                return results
+            deleted = self._deleted(user_id)
+            
+            with open(log_path, 'rb') as f:
+                while end > 0 and (limit is None or len(results) < limit):
+                    # Read just enough entries, plus the offset where they stop
+                    start = 0 if limit is None else max(0, end - (limit - len(results)))
+                    records = self._read_records(user_id, start, end + 1)
+                    offsets, seqs = records[0::2], records[1::2]
+                    if len(offsets) < end - start + 1:
+                        offsets.append(f.seek(0, os.SEEK_END))
+                    
+                    f.seek(offsets[0])
+                    lines = f.read(offsets[-1] - offsets[0]).splitlines()
+                    for position in range(end - 1, start - 1, -1):
+                        seq = seqs[position - start]
+                        if seq not in deleted:
+                            results.append((seq, json.loads(lines[position - start])))
+                    end = start
+            
+            return results if limit is None else results[:limit]
+    
+    def entries(self, user_id):
+        """Return every live entry of a user's journal, oldest first"""
+        return [entry for _, entry in reversed(self.latest(user_id, limit=None))]
+    
+    def delete(self, user_id, *seqs):
+        """Mark entries as deleted, compacting the log when worthwhile"""
+        del_path = self._paths(user_id)[2]
+        with self._lock(user_id):
+            self._check(user_id)
+            with open(del_path, 'a') as f:
+                f.write(''.join(f"{seq}\n" for seq in seqs))
+            
+            deleted = len(self._deleted(user_id))
+            if deleted >= max(self.min_compact, self.compact_ratio * self._size(user_id)):
+                self._compact(user_id)
+    
+    def compact(self, user_id):
+        """Rewrite a user's log without its deleted entries"""
+        with self._lock(user_id):
+            self._compact(user_id)
+    
+    def replace(self, user_id, entries):
+        """
+        Replace a user's whole journal with the given entries, oldest first
+        
+        The new entries are numbered after every earlier entry.
+        """
+        with self._lock(user_id):
+            self._check(user_id)
+            seq = self._next_seq(user_id)
+            lines = [(json.dumps(entry) + '\n').encode('utf-8') for entry in entries]
+            self._rewrite(user_id, lines, list(range(seq, seq + len(lines))), entries)
+    
+    def _compact(self, user_id):
+        log_path = self._paths(user_id)[0]
+        self._check(user_id)
+        if not os.path.exists(log_path):
+            return
+        
+        deleted = self._deleted(user_id)
+        seqs = self._read_records(user_id, 0, None)[1::2]
+        with open(log_path, 'rb') as f:
+            lines = f.read().splitlines(keepends=True)
+        
+        kept = [(seq, line) for seq, line in zip(seqs, lines) if seq not in deleted]
+        self._rewrite(
+            user_id, [line for _, line in kept], [seq for seq, _ in kept], [json.loads(line) for _, line in kept]
+        )
+    
+    def _rewrite(self, user_id, lines, seqs, entries):
+        """Write a new log, index and id file from encoded lines and swap them in"""
+        log_path, idx_path, del_path, ids_path = self._paths(user_id)
+        
+        records = []
+        offset = 0
+        for line, seq in zip(lines, seqs):
+            records.append(RECORD.pack(offset, seq))
+            offset += len(line)
+        ids = [
+            json.dumps([json.dumps(entry['id']), seq]) + '\n'
+            for entry, seq in zip(entries, seqs) if isinstance(entry, dict) and 'id' in entry
+        ]
+        
+        with open(log_path + '.tmp', 'wb') as f:
+            f.write(b''.join(lines))
+        with open(idx_path + '.tmp', 'wb') as f:
+            f.write(b''.join(records))
+        with open(ids_path + '.tmp', 'w') as f:
+            f.write(''.join(ids))
+        
+        os.replace(log_path + '.tmp', log_path)
+        os.replace(idx_path + '.tmp', idx_path)
+        os.replace(ids_path + '.tmp', ids_path)
+        if os.path.exists(del_path):
+            os.remove(del_path)
+        with self._cache_lock:
+            self._ids.pop(user_id, None)
+        self._remember(self._checked, user_id, True)
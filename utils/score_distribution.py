@@ -0,0 +1,72 @@
+"""
+Running distribution of biophilia scores
+
+Kept apart from the calculator so the user stores can use it without
+loading the trail and event engines.
+"""
+import numpy as np
+
+class ScoreDistribution:
+    """
+    Counts of biophilia scores in 101 buckets, one per score from 0-100
+    
+    Adding or removing a score and ranking a score take constant time, as
+    the bucket count never grows. Distributions kept by several processes
+    combine with merge(), and to_dict()/from_dict() give a JSON form.
+    """
+    def __init__(self, counts=None):
+        if counts is None:
+            self.counts = np.zeros(101, dtype=np.int64)
+        else:
+            self.counts = np.array(counts, dtype=np.int64)
+        self._cumulative = None
+    
+    @staticmethod
+    def _bucket(score):
+        return int(min(100, max(0, round(score))))
+    
+    @property
+    def total(self):
+        return int(self.counts.sum())
+    
+    def add(self, score, count=1):
+        """Count a score (`count` times)"""
+        self.counts[self._bucket(score)] += count
+        self._cumulative = None
+    
+    def remove(self, score):
+        """Stop counting one occurrence of a score"""
+        bucket = self._bucket(score)
+        if self.counts[bucket] > 0:
+            self.counts[bucket] -= 1
+            self._cumulative = None
+    
+    def merge(self, other):
+        """Add the counts of another distribution to this one"""
+        self.counts += other.counts
+        self._cumulative = None
+    
+    def percentile_rank(self, score):
+        """
+        Percentage of counted scores below `score`, counting ties as half
+        
+        Returns:
+        - float from 0-100, or None if no scores are counted
+        """
+        if self._cumulative is None:
+            self._cumulative = np.concatenate(([0], np.cumsum(self.counts)))
+        
+        total = self._cumulative[-1]
+        if total == 0:
+            return None
+        
+        bucket = self._bucket(score)
+        below = self._cumulative[bucket]
+        return float(100 * (below + self.counts[bucket] / 2) / total)
+    
+    def to_dict(self):
+        return {'counts': self.counts.tolist()}
+    
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['counts'])
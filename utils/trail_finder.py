@@ -0,0 +1,1001 @@
+import pandas as pd
+import numpy as np
+import os
+import json
+import base64
+import threading
+from itertools import islice
+from math import radians, degrees, cos, sin, asin, sqrt, pi
+from config import TRAIL_FEATURES
+from utils.trail_store import TrailStore, write_trail_store, CURRENT_FILE
+
+# Radius of earth in miles, shared by every distance calculation
+EARTH_RADIUS_MILES = 3956
+
+# Miles covered by one degree of latitude
+MILES_PER_DEGREE = EARTH_RADIUS_MILES * pi / 180
+
+# No two points on earth are further apart than half its circumference
+MAX_DISTANCE_MILES = EARTH_RADIUS_MILES * pi
+
+TRAILS_CSV_PATH = 'data/sample_trails.csv'
+
+def haversine(lon1, lat1, lon2, lat2):
+    """
+    Calculate the great circle distance between two points 
+    on the earth (specified in decimal degrees)
+    """
+    # Convert decimal degrees to radians
+    lon1, lat1, lon2, lat2 = map(radians, [lon1, lat1, lon2, lat2])
+    
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    c = 2 * asin(sqrt(a))
+    r = EARTH_RADIUS_MILES
+    return c * r
+
+def haversine_many(lat, lon, lats, lons):
+    """
+    Calculate the great circle distance from one point to many points
+    
+    Vectorized version of `haversine` that works on whole coordinate arrays
+    at once instead of one row at a time.
+    
+    Parameters:
+    - lat, lon: origin point in decimal degrees, or arrays of origins that
+      broadcast against `lats` and `lons` (e.g. a column for a distance matrix)
+    - lats, lons: array-likes of destination points in decimal degrees
+    
+    Returns:
+    - NumPy array of distances in miles
+    """
+    lat1 = np.radians(np.asarray(lat, dtype=float))
+    lon1 = np.radians(np.asarray(lon, dtype=float))
+    lat2 = np.radians(np.asarray(lats, dtype=float))
+    lon2 = np.radians(np.asarray(lons, dtype=float))
+    
+    # Haversine formula
+    dlon = lon2 - lon1
+    dlat = lat2 - lat1
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    
+    # Rounding can push `a` a hair above 1 for antipodal points
+    c = 2 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return c * EARTH_RADIUS_MILES
+
+def nearest_first(positions, distances, radius=MAX_DISTANCE_MILES, k=None):
+    """
+    Order measured trails nearest first, keeping those within `radius`
+    
+    `positions` must be in catalog order; trails at the same distance keep
+    that order. When `k` is set only the k nearest are kept, selected in
+    linear time so that just those k are sorted.
+    
+    Returns:
+    - (positions, distances) arrays sorted by distance
+    """
+    keep = distances <= radius
+    positions, distances = positions[keep], distances[keep]
+    
+    if k is not None and k < len(positions):
+        # Ties at the cut-off keep catalog order, as a full stable sort would
+        threshold = np.partition(distances, k - 1)[k - 1]
+        below = np.flatnonzero(distances < threshold)
+        at_threshold = np.flatnonzero(distances == threshold)[:k - len(below)]
+        chosen = np.sort(np.concatenate([below, at_threshold]))
+        positions, distances = positions[chosen], distances[chosen]
+    
+    # Stable sort keeps catalog order between trails at the same distance
+    order = np.argsort(distances, kind='stable')
+    return positions[order], distances[order]
+
+class TrailSpatialIndex:
+    """
+    Grid-bucket spatial index over trail coordinates
+    
+    Trails are bucketed into cells of `cell_size` degrees and kept sorted by
+    cell key, so a radius query only measures the trails in the cells that
+    overlap the query's bounding box instead of every trail in the catalog.
+    """
+    def __init__(self, latitudes, longitudes, cell_size=0.25, order=None, sorted_keys=None):
+        self.latitudes = np.asarray(latitudes, dtype=float)
+        self.longitudes = np.asarray(longitudes, dtype=float)
+        self.cell_size = cell_size
+        self.n_rows = int(np.ceil(180 / cell_size)) + 1
+        self.n_cols = int(np.ceil(360 / cell_size))
+        
+        if order is not None and sorted_keys is not None:
+            # Prebuilt arrays, e.g. memory-mapped from a trail store
+            self.order = order
+            self.sorted_keys = sorted_keys
+        else:
+            # Sort trail positions by cell key so each cell is a contiguous run
+            keys = self.cell_keys(self.latitudes, self.longitudes)
+            self.order = np.argsort(keys, kind='stable')
+            self.sorted_keys = keys[self.order]
+    
+    def __len__(self):
+        return len(self.latitudes)
+    
+    def _row(self, lat):
+        rows = np.floor((np.asarray(lat, dtype=float) + 90) / self.cell_size)
+        return np.clip(rows, 0, self.n_rows - 1).astype(np.int64)
+    
+    def _col(self, lon):
+        lon = (np.asarray(lon, dtype=float) + 180) % 360
+        return (np.floor(lon / self.cell_size).astype(np.int64)) % self.n_cols
+    
+    def cell_keys(self, lats, lons):
+        """Grid cell key of each point"""
+        return self._row(lats) * self.n_cols + self._col(lons)
+    
+    def group_by_cell(self, lats, lons):
+        """
+        Group points by the grid cell they fall in
+        
+        Parameters:
+        - lats, lons: arrays of point coordinates
+        
+        Returns:
+        - list of arrays of point indices, one per occupied cell
+        """
+        keys = self.cell_keys(lats, lons)
+        order = np.argsort(keys, kind='stable')
+        return np.split(order, np.flatnonzero(np.diff(keys[order])) + 1)
+    
+    def _bounding_box(self, lat, radius):
+        """Return (lat_min, lat_max, dlon) covering every point within radius"""
+        # Pad slightly so rounding never drops a point sitting on the edge
+        dlat = radius / MILES_PER_DEGREE + 1e-9
+        lat_min, lat_max = lat - dlat, lat + dlat
+        
+        # A box touching a pole has to cover every longitude
+        if lat_min <= -90 or lat_max >= 90:
+            return max(lat_min, -90), min(lat_max, 90), 180.0
+        
+        ratio = sin(radius / EARTH_RADIUS_MILES) / cos(radians(lat))
+        dlon = degrees(asin(min(ratio, 1.0))) + 1e-9
+        return lat_min, lat_max, min(dlon, 180.0)
+    
+    def candidates(self, lat, lon, radius):
+        """
+        Find the trails inside the bounding box of a query circle
+        
+        Every trail within `radius` miles is included, along with some
+        further away, so callers still measure the returned trails.
+        
+        Returns:
+        - sorted array of trail positions
+        """
+        lat_min, lat_max, dlon = self._bounding_box(lat, radius)
+        
+        # Column ranges, split in two when the box crosses the antimeridian
+        if dlon >= 180:
+            col_ranges = [(0, self.n_cols - 1)]
+        else:
+            col_lo = int(self._col(lon - dlon))
+            col_hi = int(self._col(lon + dlon))
+            if col_lo <= col_hi:
+                col_ranges = [(col_lo, col_hi)]
+            else:
+                col_ranges = [(col_lo, self.n_cols - 1), (0, col_hi)]
+        
+        # Every (row, column range) pair is one contiguous slice of the sorted keys
+        slices = []
+        for row in range(int(self._row(lat_min)), int(self._row(lat_max)) + 1):
+            for col_lo, col_hi in col_ranges:
+                start = np.searchsorted(self.sorted_keys, row * self.n_cols + col_lo, side='left')
+                end = np.searchsorted(self.sorted_keys, row * self.n_cols + col_hi, side='right')
+                if end > start:
+                    slices.append(self.order[start:end])
+        
+        if not slices:
+            return np.empty(0, dtype=np.int64)
+        positions = np.concatenate(slices)
+        
+        # Drop trails from the edge cells that fall outside the exact box
+        lats = self.latitudes[positions]
+        dlons = np.abs((self.longitudes[positions] - lon + 180) % 360 - 180)
+        inside = (lats >= lat_min) & (lats <= lat_max) & (dlons <= dlon)
+        return np.sort(positions[inside])
+    
+    def _measure(self, lat, lon, positions, radius, k=None):
+        """Distances to the given positions within radius, ordered nearest first"""
+        distances = haversine_many(lat, lon, self.latitudes[positions], self.longitudes[positions])
+        return nearest_first(positions, distances, radius, k)
+    
+    def query_radius(self, lat, lon, radius, k=None, where=None):
+        """
+        Find the trails within `radius` miles of a point
+        
+        Parameters:
+        - lat, lon: query point in decimal degrees
+        - radius: maximum distance in miles
+        - k: optional maximum number of (nearest) trails to return
+        - where: optional function mapping trail positions to a boolean
+          array, used to drop trails before they are measured
+        
+        Returns:
+        - (positions, distances) arrays sorted by distance
+        """
+        if radius < 0 or len(self) == 0 or (k is not None and k <= 0):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+        
+        positions = self.candidates(lat, lon, min(radius, MAX_DISTANCE_MILES))
+        if where is not None:
+            positions = positions[where(positions)]
+        return self._measure(lat, lon, positions, radius, k)
+    
+    def query_nearest(self, lat, lon, k, where=None):
+        """
+        Find the `k` trails nearest to a point
+        
+        The search radius starts at one cell and doubles until it holds at
+        least `k` trails, so only the neighbourhood of the point is measured
+        and only the `k` winners are sorted.
+        
+        Returns:
+        - (positions, distances) arrays sorted by distance
+        """
+        if k <= 0 or len(self) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=float)
+        
+        radius = self.cell_size * MILES_PER_DEGREE
+        while True:
+            positions, distances = self.query_radius(lat, lon, radius, k, where)
+            if len(positions) >= k or radius >= MAX_DISTANCE_MILES:
+                return positions, distances
+            radius *= 2
+
+class TrailFeatureIndex:
+    """
+    Bitmask index over the comma-separated `features` column
+    
+    Every feature in `config.TRAIL_FEATURES` owns a fixed bit, other features
+    get the remaining bits in order of first appearance, and features beyond
+    64 fall back to sorted lists of trail positions. Feature names are
+    matched whole and case-insensitively.
+    """
+    MAX_BITS = 64
+    
+    def __init__(self, masks, bit_names, overflow=None):
+        self.masks = np.asarray(masks, dtype=np.uint64)
+        self.bit_names = list(bit_names)
+        self.bits = {name: bit for bit, name in enumerate(self.bit_names)}
+        self.overflow = overflow or {}
+    
+    @classmethod
+    def from_values(cls, values, vocabulary=TRAIL_FEATURES):
+        """Parse a column of comma-separated feature strings"""
+        values = pd.Series(values).reset_index(drop=True)
+        
+        # One row per (trail position, feature name)
+        tokens = values.fillna('').astype(str).str.split(',').explode()
+        tokens = tokens.str.strip().str.lower()
+        tokens = tokens[tokens != '']
+        positions = tokens.index.to_numpy(dtype=np.int64)
+        codes, names = pd.factorize(tokens)
+        
+        # Vocabulary features come first so their bits never move
+        bit_names = [name.lower() for name in vocabulary][:cls.MAX_BITS]
+        for name in names:
+            if name not in bit_names and len(bit_names) < cls.MAX_BITS:
+                bit_names.append(name)
+        bits = {name: bit for bit, name in enumerate(bit_names)}
+        
+        masks = np.zeros(len(values), dtype=np.uint64)
+        overflow = {}
+        name_bits = np.array([bits.get(name, -1) for name in names], dtype=np.int64)
+        token_bits = name_bits[codes] if len(codes) else np.empty(0, dtype=np.int64)
+        
+        in_mask = token_bits >= 0
+        np.bitwise_or.at(masks, positions[in_mask], np.left_shift(np.uint64(1), token_bits[in_mask].astype(np.uint64)))
+        
+        for code in np.unique(codes[~in_mask]):
+            overflow[names[code]] = np.unique(positions[codes == code])
+        
+        return cls(masks, bit_names, overflow)
+    
+    def match(self, features, mode='all', positions=None):
+        """
+        Test trails against a list of features
+        
+        Parameters:
+        - features: list of feature names
+        - mode: 'all' to require every feature, 'any' to require at least one
+        - positions: optional trail positions to test instead of every trail
+        
+        Returns:
+        - boolean NumPy array, one entry per tested trail
+        """
+        if mode not in ('all', 'any'):
+            raise ValueError(f"Unknown feature match mode: {mode}")
+        
+        masks = self.masks if positions is None else self.masks[positions]
+        wanted = np.uint64(0)
+        overflow_names = []
+        unknown = False
+        for feature in features:
+            name = feature.strip().lower()
+            if name in self.bits:
+                wanted |= np.uint64(1) << np.uint64(self.bits[name])
+            elif name in self.overflow:
+                overflow_names.append(name)
+            else:
+                unknown = True
+        
+        if mode == 'all':
+            # A feature no trail has can never be matched by every trail
+            if unknown:
+                return np.zeros(len(masks), dtype=bool)
+            result = (masks & wanted) == wanted
+        else:
+            result = (masks & wanted) != 0
+        
+        if overflow_names:
+            tested = np.arange(len(self.masks)) if positions is None else np.asarray(positions)
+            for name in overflow_names:
+                has_feature = np.isin(tested, self.overflow[name])
+                result = result & has_feature if mode == 'all' else result | has_feature
+        
+        return result
+
+class TrailCatalog:
+    """
+    A loaded trail table together with the indexes built over it
+    
+    A catalog is never modified after it is built, so requests can keep
+    using one while the manager swaps in a freshly loaded replacement.
+    """
+    def __init__(self, trails_df=None, store=None):
+        self.trails_df = trails_df
+        self.store = store
+        
+        if store is not None:
+            if store.has_array('index_order'):
+                # The store ships its spatial index, so nothing is sorted here
+                self.index = TrailSpatialIndex(
+                    store.latitude, store.longitude, store.meta['index_cell_size'],
+                    order=store.array('index_order'), sorted_keys=store.array('index_keys')
+                )
+            else:
+                self.index = TrailSpatialIndex(store.latitude, store.longitude)
+            
+            if store.has_array('feature_masks'):
+                overflow = {
+                    name: store.array(array_name)
+                    for name, array_name in store.meta['feature_overflow'].items()
+                }
+                self.features = TrailFeatureIndex(store.array('feature_masks'), store.meta['feature_bits'], overflow)
+            else:
+                self.features = TrailFeatureIndex.from_values(store.column('features', np.arange(len(store))))
+        else:
+            self.index = TrailSpatialIndex(trails_df['latitude'].to_numpy(), trails_df['longitude'].to_numpy())
+            self.features = TrailFeatureIndex.from_values(trails_df['features'])
+            self.difficulty = trails_df['difficulty'].to_numpy()
+    
+    def __len__(self):
+        if self.store is not None:
+            return len(self.store)
+        return len(self.trails_df)
+    
+    def match_difficulty(self, levels, positions):
+        """Boolean array marking which of the given trails have one of the levels"""
+        if self.store is not None:
+            # Compare the stored integer codes instead of decoding names
+            known = self.store.meta['categories']['difficulty']
+            codes = [code for code, level in enumerate(known) if level in levels]
+            return np.isin(self.store.array('difficulty')[positions], codes)
+        return np.isin(self.difficulty[positions], list(levels))
+    
+    def match(self, positions, difficulty=None, features=None, feature_match='all'):
+        """Boolean array marking which of the given trails pass the filters"""
+        keep = np.ones(len(positions), dtype=bool)
+        if difficulty is not None and len(difficulty) > 0:
+            keep &= self.match_difficulty(difficulty, positions)
+        if features is not None and len(features) > 0:
+            keep &= self.features.match(features, feature_match, positions)
+        return keep
+    
+    def take(self, positions):
+        """Return the trails at the given positions as a new DataFrame"""
+        if self.store is not None:
+            return self.store.take(positions)
+        return self.trails_df.iloc[positions].copy()
+
+def convert_trail_catalog(csv_path, path, cell_size=0.25):
+    """
+    Convert a trail CSV into a memory-mapped trail store
+    
+    The spatial and feature indexes are built once here and saved with the
+    store, so opening the store later does not sort or parse anything.
+    
+    Parameters:
+    - csv_path: CSV file following the trail schema in data/README.md
+    - path: store directory to create or replace
+    - cell_size: grid cell size of the spatial index in degrees
+    
+    Returns:
+    - the opened TrailStore
+    """
+    trails_df = pd.read_csv(csv_path)
+    index = TrailSpatialIndex(trails_df['latitude'].to_numpy(), trails_df['longitude'].to_numpy(), cell_size)
+    features = TrailFeatureIndex.from_values(trails_df['features'])
+    
+    extra_arrays = {
+        'index_order': index.order,
+        'index_keys': index.sorted_keys,
+        'feature_masks': features.masks
+    }
+    feature_overflow = {}
+    for i, (name, positions) in enumerate(features.overflow.items()):
+        feature_overflow[name] = f"feature_overflow_{i}"
+        extra_arrays[feature_overflow[name]] = positions
+    
+    write_trail_store(
+        trails_df, path,
+        extra_arrays=extra_arrays,
+        extra_meta={
+            'index_cell_size': cell_size,
+            'feature_bits': features.bit_names,
+            'feature_overflow': feature_overflow
+        }
+    )
+    return TrailStore(path)
+
+class CatalogManager:
+    """
+    Keeps a catalog built from a file in memory and reloads it only when the
+    file changes
+    
+    The file's modification time and size are checked on every `get`, which
+    costs one `stat` call instead of re-parsing the file. Subclasses define
+    how the file is read and how sample data is created.
+    """
+    def __init__(self, path, create_if_missing=False):
+        self.path = path
+        self.create_if_missing = create_if_missing
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self._catalog = None
+        self._signature = None
+        # (generation, catalog) of the last load, replaced as one object
+        self._versioned = (0, None)
+        self._lock = threading.Lock()
+    
+    def _file_signature(self):
+        """Return (mtime, size, inode) of the catalog file, or None if it is missing"""
+        path = self.path
+        if os.path.isdir(path):
+            # Stores switch versions by replacing their CURRENT file, which
+            # gives it a new inode; older stores only have meta.json
+            pointer = os.path.join(path, CURRENT_FILE)
+            path = pointer if os.path.exists(pointer) else os.path.join(path, 'meta.json')
+        
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    
+    def _read(self):
+        """Build the catalog from the file"""
+        raise NotImplementedError
+    
+    def _create_sample(self):
+        """Write sample data to the file"""
+        raise NotImplementedError
+    
+    def get(self):
+        """Return the current catalog, loading it if the file changed"""
+        signature = self._file_signature()
+        catalog = self._catalog
+        if catalog is not None and signature is not None and signature == self._signature:
+            self.hits += 1
+            return catalog
+        
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            signature = self._file_signature()
+            if self._catalog is not None and signature is not None and signature == self._signature:
+                self.hits += 1
+                return self._catalog
+            
+            if signature is None:
+                if not self.create_if_missing:
+                    raise FileNotFoundError(self.path)
+                self._create_sample()
+                signature = self._file_signature()
+            
+            if self._catalog is None:
+                self.misses += 1
+            else:
+                self.reloads += 1
+            
+            # Signature is taken before reading, so a write during the read
+            # just triggers another reload on the next call
+            self._catalog = self._read()
+            self._signature = signature
+            self._versioned = (self.generation, self._catalog)
+            return self._catalog
+    
+    def get_versioned(self):
+        """
+        Return the current catalog with its generation
+        
+        Both come from the same load, so the generation can key caches of
+        results computed from the catalog.
+        
+        Returns:
+        - (generation, catalog) tuple
+        """
+        self.get()
+        return self._versioned
+    
+    @property
+    def generation(self):
+        """Number of times the catalog has been loaded; changes on every reload"""
+        return self.misses + self.reloads
+    
+    def invalidate(self):
+        """Drop the cached catalog so the next `get` reloads it"""
+        with self._lock:
+            self._signature = None
+    
+    def stats(self):
+        """Return cache counters as a dictionary"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'reloads': self.reloads
+        }
+
+class TrailCatalogManager(CatalogManager):
+    """
+    Keeps the trail catalog in memory and reloads it only when its file changes
+    
+    `path` may be a trail CSV or a trail store directory, which is
+    memory-mapped instead of parsed.
+    """
+    def __init__(self, path=TRAILS_CSV_PATH, create_if_missing=False):
+        super().__init__(path, create_if_missing)
+    
+    def _read(self):
+        """Open the catalog file or trail store"""
+        if os.path.isdir(self.path):
+            return TrailCatalog(store=TrailStore(self.path))
+        return TrailCatalog(pd.read_csv(self.path))
+    
+    def _create_sample(self):
+        create_sample_trails_data()
+
+# Catalog manager for the bundled sample trails
+trail_catalog_manager = TrailCatalogManager(create_if_missing=True)
+
+def get_trail_catalog():
+    """Return the cached catalog of sample trails"""
+    return trail_catalog_manager.get()
+
+def find_nearby_trails(user_location, distance=None, difficulty=None, features=None, limit=None,
+                       feature_match='all', catalog=None):
+    """
+    Find trails near the user's location with optional filters
+    
+    Parameters:
+    - user_location: dict with 'lat' and 'lon' keys
+    - distance: maximum distance in miles
+    - difficulty: list of difficulty levels to include
+    - features: list of features to include
+    - limit: maximum number of trails to return
+    - feature_match: 'all' to require every feature, 'any' for at least one
+    - catalog: TrailCatalog to search instead of the cached sample catalog
+    
+    Returns:
+    - list of trail dictionaries
+    """
+    # In a real app, this would query an API or database
+    # For this example, trails come from a sample CSV file that is parsed
+    # once and kept in memory with its indexes between calls
+    if catalog is None:
+        catalog = get_trail_catalog()
+    
+    # Difficulty and features are checked per trail position before any
+    # rows are materialized
+    def where(positions):
+        return catalog.match(positions, difficulty, features, feature_match)
+    
+    # Calculate distance from user location
+    if user_location and 'lat' in user_location and 'lon' in user_location:
+        index = catalog.index
+        lat, lon = user_location['lat'], user_location['lon']
+        
+        if distance is not None:
+            # Only trails inside the radius's bounding box are measured
+            positions, distances = index.query_radius(lat, lon, distance, limit, where)
+        elif limit is not None:
+            # Widen the search only until `limit` matching trails are found
+            positions, distances = index.query_nearest(lat, lon, limit, where)
+        else:
+            positions, distances = index.query_radius(lat, lon, MAX_DISTANCE_MILES, where=where)
+    else:
+        # Default distances if no user location provided
+        positions = np.arange(len(catalog))
+        distances = positions + 1
+        
+        if distance is not None:
+            keep = distances <= distance
+            positions, distances = positions[keep], distances[keep]
+        
+        keep = where(positions)
+        positions, distances = positions[keep][:limit], distances[keep][:limit]
+    
+    # Results are already in distance order, so only the kept rows are built
+    trails_df = catalog.take(positions)
+    trails_df['distance'] = distances
+    
+    # Convert to list of dictionaries
+    trails = trails_df.to_dict('records')
+    
+    return trails
+
+def find_nearby_trails_batch(user_locations, distance=None, difficulty=None, features=None, limit=None,
+                             feature_match='all', max_block_cells=2_000_000, catalog=None):
+    """
+    Find nearby trails for many user locations in one pass
+    
+    Filters are evaluated once for the whole batch. Users in the same grid
+    cell of the spatial index share one candidate set, which is measured as
+    distance matrices holding at most `max_block_cells` distances at a time.
+    
+    Parameters:
+    - user_locations: list of dicts with 'lat' and 'lon' keys
+    - distance, difficulty, features, limit, feature_match: shared filters,
+      as for find_nearby_trails
+    - max_block_cells: upper bound on the size of each distance matrix
+    - catalog: TrailCatalog to search instead of the cached sample catalog
+    
+    Returns:
+    - list with one list of trail dictionaries per user location, in the
+      same order and with the same results as find_nearby_trails
+    """
+    if catalog is None:
+        catalog = get_trail_catalog()
+    index = catalog.index
+    results = [None] * len(user_locations)
+    
+    located = [
+        i for i, location in enumerate(user_locations)
+        if location and 'lat' in location and 'lon' in location
+    ]
+    
+    # Users without a location all get the same default ordering
+    if len(located) < len(user_locations):
+        fallback = find_nearby_trails(None, distance, difficulty, features, limit, feature_match, catalog)
+        for i in set(range(len(user_locations))) - set(located):
+            results[i] = [dict(trail) for trail in fallback]
+    
+    if not located:
+        return results
+    
+    lats = np.array([user_locations[i]['lat'] for i in located], dtype=float)
+    lons = np.array([user_locations[i]['lon'] for i in located], dtype=float)
+    radius = MAX_DISTANCE_MILES if distance is None else distance
+    
+    # Shared filters are applied to the whole catalog once
+    allowed = catalog.match(np.arange(len(catalog)), difficulty, features, feature_match)
+    
+    # Users sharing a grid cell are measured together against the trails
+    # around that cell
+    matches = [None] * len(located)
+    for group in index.group_by_cell(lats, lons):
+        center_lat, center_lon = lats[group].mean(), lons[group].mean()
+        spread = haversine_many(center_lat, center_lon, lats[group], lons[group]).max()
+        
+        # Without a radius, a limited search widens until every user in the
+        # group has `limit` matches, like query_nearest does for one user
+        if distance is not None:
+            reach = distance
+        elif limit is not None:
+            reach = index.cell_size * MILES_PER_DEGREE
+        else:
+            reach = MAX_DISTANCE_MILES
+        
+        while True:
+            # Every trail within `reach` of a user in the group is within
+            # `reach` plus the group's spread of the group's centre
+            search_radius = min(spread + reach, MAX_DISTANCE_MILES)
+            nearby = index.candidates(center_lat, center_lon, search_radius)
+            candidates = nearby[allowed[nearby]]
+            
+            # Measure in blocks of users to bound the distance matrix size
+            block_size = max(1, max_block_cells // max(len(candidates), 1))
+            for start in range(0, len(group), block_size):
+                block = group[start:start + block_size]
+                matrix = haversine_many(
+                    lats[block, None], lons[block, None],
+                    index.latitudes[candidates], index.longitudes[candidates]
+                )
+                for row, user in enumerate(block):
+                    matches[user] = nearest_first(candidates, matrix[row], min(radius, reach), limit)
+            
+            if distance is not None or limit is None or search_radius >= MAX_DISTANCE_MILES:
+                break
+            if all(len(matches[user][0]) >= limit for user in group):
+                break
+            reach *= 2
+    
+    # Build each distinct trail once and share it between users
+    if matches:
+        distinct = np.unique(np.concatenate([positions for positions, _ in matches]))
+    else:
+        distinct = np.empty(0, dtype=np.int64)
+    records = dict(zip(distinct.tolist(), catalog.take(distinct).to_dict('records')))
+    
+    for user, (positions, distances) in zip(located, matches):
+        results[user] = [
+            dict(records[position], distance=float(trail_distance))
+            for position, trail_distance in zip(positions.tolist(), distances)
+        ]
+    
+    return results
+
+def _encode_cursor(distance, position):
+    """Pack the sort key of the last trail on a page into an opaque string"""
+    payload = json.dumps([float(distance), int(position)]).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+def _decode_cursor(cursor):
+    """Unpack a cursor created by _encode_cursor"""
+    try:
+        distance, position = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return float(distance), int(position)
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError(f"Invalid trail cursor: {cursor!r}")
+
+def _iter_nearby_positions(catalog, user_location, distance=None, where=None, after=None):
+    """
+    Yield (position, distance) pairs nearest first
+    
+    With a location, the search radius doubles ring by ring, so trails far
+    away are only measured once the nearer ones have been consumed. `after`
+    is a (distance, position) sort key to resume after.
+    """
+    if not (user_location and 'lat' in user_location and 'lon' in user_location):
+        # Default distances if no user location provided
+        positions = np.arange(len(catalog))
+        distances = positions + 1
+        keep = np.ones(len(positions), dtype=bool) if where is None else where(positions)
+        if distance is not None:
+            keep &= distances <= distance
+        if after is not None:
+            keep &= positions > after[1]
+        yield from zip(positions[keep].tolist(), distances[keep].tolist())
+        return
+    
+    index = catalog.index
+    lat, lon = user_location['lat'], user_location['lon']
+    limit_radius = MAX_DISTANCE_MILES if distance is None else min(distance, MAX_DISTANCE_MILES)
+    
+    # Trails at or inside the previous ring have already been yielded
+    inner = -1.0
+    radius = index.cell_size * MILES_PER_DEGREE
+    if after is not None:
+        inner = after[0]
+        radius = max(radius, inner)
+    
+    while True:
+        radius = min(radius, limit_radius)
+        positions, distances = index.query_radius(lat, lon, radius, where=where)
+        keep = distances > inner
+        if after is not None and inner == after[0]:
+            # Trails tied with the cursor resume after its position
+            keep |= (distances == after[0]) & (positions > after[1])
+        
+        yield from zip(positions[keep].tolist(), distances[keep].tolist())
+        
+        if radius >= limit_radius:
+            return
+        # Later rings start past the cursor, so ties are only resumed once
+        after = None
+        inner = radius
+        radius *= 2
+
+def iter_nearby_trails(user_location, distance=None, difficulty=None, features=None,
+                       feature_match='all', batch_size=50, catalog=None):
+    """
+    Lazily yield trails near the user's location, nearest first
+    
+    Takes the same filters as find_nearby_trails, but trails are measured
+    ring by ring and turned into dictionaries `batch_size` at a time, so
+    reading the first few results does not build the whole result list.
+    
+    Returns:
+    - generator of trail dictionaries
+    """
+    if catalog is None:
+        catalog = get_trail_catalog()
+    
+    def where(positions):
+        return catalog.match(positions, difficulty, features, feature_match)
+    
+    matches = _iter_nearby_positions(catalog, user_location, distance, where)
+    while True:
+        batch = list(islice(matches, batch_size))
+        if not batch:
+            return
+        positions, distances = zip(*batch)
+        trails_df = catalog.take(list(positions))
+        trails_df['distance'] = distances
+        yield from trails_df.to_dict('records')
+
+def find_nearby_trails_page(user_location, page_size=20, cursor=None, distance=None, difficulty=None,
+                            features=None, feature_match='all', catalog=None):
+    """
+    Return one page of trails near the user's location
+    
+    Parameters:
+    - user_location, distance, difficulty, features, feature_match, catalog:
+      as for find_nearby_trails
+    - page_size: number of trails per page
+    - cursor: `next_cursor` from the previous page, or None for the first page
+    
+    Returns:
+    - dict with 'trails' (list of trail dictionaries) and 'next_cursor'
+      (string, or None on the last page)
+    """
+    if catalog is None:
+        catalog = get_trail_catalog()
+    after = _decode_cursor(cursor) if cursor is not None else None
+    
+    def where(positions):
+        return catalog.match(positions, difficulty, features, feature_match)
+    
+    # One extra trail tells whether another page follows
+    matches = list(islice(_iter_nearby_positions(catalog, user_location, distance, where, after), page_size + 1))
+    page = matches[:page_size]
+    
+    trails = []
+    if page:
+        positions, distances = zip(*page)
+        trails_df = catalog.take(list(positions))
+        trails_df['distance'] = distances
+        trails = trails_df.to_dict('records')
+    
+    next_cursor = None
+    if len(matches) > page_size:
+        last_position, last_distance = page[-1]
+        next_cursor = _encode_cursor(last_distance, last_position)
+    
+    return {
+        'trails': trails,
+        'next_cursor': next_cursor
+    }
+
+def create_sample_trails_data():
+    """Create sample trail data and save to CSV"""
+    trails = [
+        {
+            'id': 1,
+            'name': 'Pine Forest Loop',
+            'latitude': 37.7749,
+            'longitude': -122.4194,
+            'length': 3.2,
+            'difficulty': 'Easy',
+            'features': 'Forest,Wildlife,Scenic Views',
+            'description': 'A beautiful loop through old-growth pine forest with abundant wildlife viewing opportunities.',
+            'image_url': 'https://i.imgur.com/3Cm5BM9.jpg'
+        },
+        {
+            'id': 2,
+            'name': 'Mountain Vista Trail',
+            'latitude': 37.8049,
+            'longitude': -122.4094,
+            'length': 5.8,
+            'difficulty': 'Moderate',
+            'features': 'Mountain View,Wildflowers,Forest',
+            'description': 'Climb to stunning panoramic views of the surrounding mountains and valleys.',
+            'image_url': 'https://i.imgur.com/Gju4kCM.jpg'
+        },
+        {
+            'id': 3,
+            'name': 'Crystal Lake Path',
+            'latitude': 37.7649,
+            'longitude': -122.4294,
+            'length': 2.5,
+            'difficulty': 'Easy',
+            'features': 'Lake,Fishing,Wildlife',
+            'description': 'An easy walk around a pristine mountain lake with fishing spots and wildlife viewing areas.',
+            'image_url': 'https://i.imgur.com/K58U4dV.jpg'
+        },
+        {
+            'id': 4,
+            'name': 'Ridgeline Traverse',
+            'latitude': 37.7849,
+            'longitude': -122.4394,
+            'length': 7.2,
+            'difficulty': 'Hard',
+            'features': 'Mountain View,Waterfall,Forest',
+            'description': 'A challenging hike along a mountain ridge with breathtaking views and a hidden waterfall.',
+            'image_url': 'https://i.imgur.com/QLKL9F5.jpg'
+        },
+        {
+            'id': 5,
+            'name': 'Waterfall Canyon',
+            'latitude': 37.7599,
+            'longitude': -122.4494,
+            'length': 4.6,
+            'difficulty': 'Moderate',
+            'features': 'Waterfall,Forest,Wildflowers',
+            'description': 'Hike through a lush canyon to a spectacular 60-foot waterfall surrounded by wildflowers.',
+            'image_url': 'https://i.imgur.com/Y2JJ6KQ.jpg'
+        },
+        {
+            'id': 6,
+            'name': 'Ancient Redwood Trail',
+            'latitude': 37.8149,
+            'longitude': -122.3994,
+            'length': 3.0,
+            'difficulty': 'Easy',
+            'features': 'Forest,Wildlife,Educational',
+            'description': 'Walk among ancient redwood trees, some over 500 years old, with educational placards.',
+            'image_url': 'https://i.imgur.com/B4mJErA.jpg'
+        },
+        {
+            'id': 7,
+            'name': 'Eagle Peak Trail',
+            'latitude': 37.7499,
+            'longitude': -122.4594,
+            'length': 8.4,
+            'difficulty': 'Hard',
+            'features': 'Mountain View,Wildlife,Forest',
+            'description': 'A challenging climb to Eagle Peak with opportunities to see eagles and other birds of prey.',
+            'image_url': 'https://i.imgur.com/bIziVdO.jpg'
+        },
+        {
+            'id': 8,
+            'name': 'Meadow Wildflower Walk',
+            'latitude': 37.8249,
+            'longitude': -122.3894,
+            'length': 1.8,
+            'difficulty': 'Easy',
+            'features': 'Wildflowers,Wildlife,Educational',
+            'description': 'A gentle walk through meadows filled with seasonal wildflowers and butterflies.',
+            'image_url': 'https://i.imgur.com/VmFbVmE.jpg'
+        },
+        {
+            'id': 9,
+            'name': 'River Gorge Path',
+            'latitude': 37.7449,
+            'longitude': -122.4694,
+            'length': 5.2,
+            'difficulty': 'Moderate',
+            'features': 'River,Wildlife,Forest',
+            'description': 'Follow a scenic river through a gorge with swimming holes and fishing spots.',
+            'image_url': 'https://i.imgur.com/K58U4dV.jpg'
+        },
+        {
+            'id': 10,
+            'name': 'Sunset Ridge Trail',
+            'latitude': 37.8349,
+            'longitude': -122.3794,
+            'length': 4.0,
+            'difficulty': 'Moderate',
+            'features': 'Mountain View,Sunset Views,Wildflowers',
+            'description': 'Perfect for evening hikes with spectacular sunset views from multiple vantage points.',
+            'image_url': 'https://i.imgur.com/QLKL9F5.jpg'
+        }
+    ]
+    
+    # Create DataFrame
+    trails_df = pd.DataFrame(trails)
+    
+    # Ensure data directory exists
+    os.makedirs('data', exist_ok=True)
+    
+    # Save to CSV
+    trails_df.to_csv(TRAILS_CSV_PATH, index=False)
+    
+    return trails_df
@@ -0,0 +1,236 @@
+"""
+Memory-mapped columnar storage for the trail catalog
+
+A trail store is a directory holding one `.npy` file per numeric column,
+small integer codes for difficulty levels and an offsets-encoded UTF-8 blob
+for every text column. All files are opened with memory mapping, so opening
+a store only reads `meta.json` and processes sharing a store share its pages.
+"""
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from config import TRAIL_DIFFICULTY_LEVELS
+
+STORE_VERSION = 1
+
+# File naming the version directory a store currently serves
+CURRENT_FILE = 'CURRENT'
+
+# Columns every trail store must contain (see data/README.md)
+REQUIRED_COLUMNS = ['id', 'name', 'latitude', 'longitude', 'length', 'difficulty', 'features', 'description']
+
+# Columns stored as fixed-width numeric arrays
+NUMERIC_COLUMNS = {
+    'id': np.int64,
+    'latitude': np.float64,
+    'longitude': np.float64,
+    'length': np.float64
+}
+
+# Columns stored as small integer codes into a vocabulary
+CATEGORY_COLUMNS = {
+    'difficulty': TRAIL_DIFFICULTY_LEVELS
+}
+
+def current_store_path(path):
+    """
+    Directory holding the current version of a store
+    
+    Stores written before versions were introduced keep their files
+    directly in `path`.
+    """
+    try:
+        with open(os.path.join(path, CURRENT_FILE), 'r') as f:
+            return os.path.join(path, f.read().strip())
+    except FileNotFoundError:
+        return path
+
+def write_trail_store(trails_df, path, extra_arrays=None, extra_meta=None):
+    """
+    Write a trail table to a columnar store directory
+    
+    Each write builds a new version directory inside `path` and then
+    replaces the CURRENT file naming it, so readers always find a complete
+    store. The previous version is kept for readers still opening it and
+    removed by the next write.
+    
+    Parameters:
+    - trails_df: DataFrame following the trail schema
+    - path: store directory to create or replace
+    - extra_arrays: optional dict of additional named arrays to store
+    - extra_meta: optional dict of additional metadata entries
+    """
+    missing = [column for column in REQUIRED_COLUMNS if column not in trails_df.columns]
+    if missing:
+        raise ValueError(f"Trail table is missing columns: {', '.join(missing)}")
+    
+    os.makedirs(path, exist_ok=True)
+    previous = current_store_path(path)
+    previous_name = None if previous == path else os.path.basename(previous)
+    version = f"v{int(previous_name[1:]) + 1:06d}" if previous_name else 'v000001'
+    
+    tmp_path = os.path.join(path, version + '.tmp')
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    
+    meta = {
+        'version': STORE_VERSION,
+        'count': len(trails_df),
+        'columns': list(trails_df.columns),
+        'categories': {},
+        'nullable': [],
+        'arrays': []
+    }
+    
+    for column in trails_df.columns:
+        values = trails_df[column]
+        
+        if column in NUMERIC_COLUMNS:
+            np.save(os.path.join(tmp_path, f"{column}.npy"), values.to_numpy(dtype=NUMERIC_COLUMNS[column]))
+        
+        elif column in CATEGORY_COLUMNS:
+            # Known levels keep their configured codes, unknown ones are appended
+            levels = list(CATEGORY_COLUMNS[column])
+            levels += sorted(set(values.dropna()) - set(levels))
+            codes = pd.Categorical(values, categories=levels).codes.astype(np.int8)
+            np.save(os.path.join(tmp_path, f"{column}.npy"), codes)
+            meta['categories'][column] = levels
+        
+        else:
+            nulls = values.isna().to_numpy()
+            encoded = [b'' if null else str(value).encode('utf-8') for value, null in zip(values, nulls)]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(item) for item in encoded], out=offsets[1:])
+            np.save(os.path.join(tmp_path, f"{column}.offsets.npy"), offsets)
+            with open(os.path.join(tmp_path, f"{column}.blob"), 'wb') as f:
+                f.write(b''.join(encoded))
+            
+            if nulls.any():
+                np.save(os.path.join(tmp_path, f"{column}.nulls.npy"), nulls)
+                meta['nullable'].append(column)
+    
+    for name, array in (extra_arrays or {}).items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.asarray(array))
+        meta['arrays'].append(name)
+    
+    meta.update(extra_meta or {})
+    
+    # meta.json is written last; a store without it is incomplete
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f, indent=2)
+    
+    # Switch readers to the new version with one atomic rename
+    os.replace(tmp_path, os.path.join(path, version))
+    with open(os.path.join(path, CURRENT_FILE + '.tmp'), 'w') as f:
+        f.write(version)
+    os.replace(os.path.join(path, CURRENT_FILE + '.tmp'), os.path.join(path, CURRENT_FILE))
+    
+    # Keep the previous version; with an unversioned store, that is the
+    # files directly in `path`
+    for entry in os.scandir(path):
+        if entry.name in (version, previous_name, CURRENT_FILE):
+            continue
+        if entry.is_dir():
+            shutil.rmtree(entry.path, ignore_errors=True)
+        elif previous_name is not None:
+            os.remove(entry.path)
+
+class TrailStore:
+    """
+    Read-only, memory-mapped view of a trail store directory
+    
+    All files are mapped when the store is opened, so it stays readable
+    after a rewrite removes its version; text is only decoded for the rows
+    passed to `take`.
+    """
+    def __init__(self, path):
+        while True:
+            self.path = current_store_path(path)
+            try:
+                self._open()
+                break
+            except FileNotFoundError:
+                # A rewrite removed this version while it was being opened
+                if current_store_path(path) == self.path:
+                    raise
+    
+    def _open(self):
+        """Read the metadata and map every array of the current version"""
+        with open(os.path.join(self.path, 'meta.json'), 'r') as f:
+            self.meta = json.load(f)
+        
+        if self.meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported trail store version: {self.meta.get('version')}")
+        
+        self._arrays = {}
+        for name in os.listdir(self.path):
+            file_path = os.path.join(self.path, name)
+            if name.endswith('.npy'):
+                self._arrays[name[:-len('.npy')]] = np.load(file_path, mmap_mode='r')
+            elif name.endswith('.blob'):
+                # Empty files cannot be memory-mapped
+                if os.path.getsize(file_path) == 0:
+                    self._arrays[name] = np.empty(0, dtype=np.uint8)
+                else:
+                    self._arrays[name] = np.memmap(file_path, dtype=np.uint8, mode='r')
+    
+    def __len__(self):
+        return self.meta['count']
+    
+    @property
+    def columns(self):
+        return self.meta['columns']
+    
+    @property
+    def latitude(self):
+        return self.array('latitude')
+    
+    @property
+    def longitude(self):
+        return self.array('longitude')
+    
+    def has_array(self, name):
+        """Check whether a numeric column or extra array is stored"""
+        return name in NUMERIC_COLUMNS or name in self.meta['categories'] or name in self.meta['arrays']
+    
+    def array(self, name):
+        """Return a memory-mapped numeric column, code column or extra array"""
+        return self._arrays[name]
+    
+    def _text(self, column):
+        """Return the (offsets, blob) pair of a text column"""
+        return self.array(f"{column}.offsets"), self._arrays[f"{column}.blob"]
+    
+    def column(self, column, positions):
+        """Decode one column for the given row positions"""
+        if column in NUMERIC_COLUMNS:
+            return np.asarray(self.array(column)[positions])
+        
+        if column in self.meta['categories']:
+            levels = np.array(self.meta['categories'][column] + [np.nan], dtype=object)
+            
+            # Code -1 marks a missing value and indexes the trailing NaN
+            return levels[self.array(column)[positions]]
+        
+        offsets, blob = self._text(column)
+        values = np.empty(len(positions), dtype=object)
+        for i, position in enumerate(positions):
+            values[i] = blob[offsets[position]:offsets[position + 1]].tobytes().decode('utf-8')
+        
+        if column in self.meta['nullable']:
+            values[self.array(f"{column}.nulls")[positions]] = np.nan
+        return values
+    
+    def take(self, positions):
+        """Return the trails at the given positions as a DataFrame"""
+        positions = np.asarray(positions, dtype=np.int64)
+        return pd.DataFrame(
+            {column: self.column(column, positions) for column in self.columns},
+            columns=self.columns
+        )
+    
+    def to_dataframe(self):
+        """Materialize the whole store as a DataFrame"""
+        return self.take(np.arange(len(self)))